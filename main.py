@@ -2,9 +2,14 @@
 # -*- coding: utf-8 -*-
 """
 Orquesta: búsqueda → imágenes → TTS → vídeo → publicación Whatsapp.
+
+Todo el flujo de un trabajo recibe un JobConfig inmutable, de modo que build_status()
+puede llamarse varias veces (incluso a la vez) con configuraciones distintas.
 """
 
 import os
+import json
+import time
 import logging
 import shutil
 
@@ -12,6 +17,10 @@ import shutil
 
 import openai
 from utils.helper import bootstrap, new_run_dir
+from utils.config import JobConfig
+from utils import run_store
+from utils import openai_scheduler, call_policy, trace_helper, image_race, image_artifact
+from utils.media_library import MediaLibrary
 from my_agents.websearch_agent import run as web_search
 from my_agents.illustration_agent import run as make_images
 from my_agents.tts_agent import run as make_audio
@@ -21,73 +30,52 @@ from my_agents.langcheck_agent import run as translate_script
 from my_agents.script_transform_agent import run as transform_script
 from my_agents.web_image_agent import fetch_images_via_bing
 from utils.selenium_helper import publish
+from utils.publish_spool import enqueue as enqueue_publish, stats as spool_stats
 
-import numpy as np
 # Nota: PIL/textwrap ahora se importan en utils.video_helper
 
-# === 0. Arranque =============================================================
-bootstrap()
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-TOPIC      = os.getenv("WEB_SEARCH_TOPIC")
-VOICE      = os.getenv("TTS_VOICE")
-TTS_MODEL  = os.getenv("TTS_MODEL")
-TITLE_MODEL = os.getenv("TITLE_MODEL")
-IMG_MODEL  = os.getenv("IMAGE_GEN_MODEL")
-TEXT_MODEL = os.getenv("WEB_SEARCH_MODEL")
-CAPTION_TEXT   = os.getenv("CAPTION_TEXT")
-TTS_TONE   = os.getenv("TTS_TONE")
-IMAGE_COUNT = int(os.getenv("IMAGE_COUNT"))
-SCRIPT_MODEL = os.getenv("SCRIPT_MODEL")
-SCRIPT_TRANSFORM_MODEL = os.getenv("SCRIPT_TRANSFORM_MODEL")
-KEYWORK_IMAGE_SEARCH = os.getenv("KEYWORK_IMAGE_SEARCH")
-USE_SCRIPT_FILE = os.getenv("USE_SCRIPT_FILE", "false").lower() == "true"
-USE_CAPTION_FILE = os.getenv("USE_CAPTION_FILE", "false").lower() == "true"
-
-# === 1. Directorio de ejecución ==============================================
-run_dir = new_run_dir()
-logging.info("[Main] Carpeta de ejecución: %s", run_dir)
-
 # Logger para mensajes de salida de agentes
 out_log = logging.getLogger("AGENTS_OUT")
 
-# Comprobamos si se va a usar un audio personalizado
-USE_CUSTOM_AUDIO = os.getenv("USE_CUSTOM_AUDIO", "false").lower() == "true"
-CUSTOM_AUDIO_FILE = os.getenv("CUSTOM_AUDIO_FILE", "input.mp3")
-
-if USE_CUSTOM_AUDIO:
-    # Modo de audio personalizado - omitimos toda la generación de guión y TTS
-    custom_audio_path = os.path.join('media', CUSTOM_AUDIO_FILE)
-    
-    if not os.path.isfile(custom_audio_path):
-        logging.error(f"No se encontró el archivo de audio personalizado: {custom_audio_path}")
-        raise FileNotFoundError(f"No se encontró el archivo de audio personalizado: {custom_audio_path}")
-    
-    logging.info(f"[Main] Usando archivo de audio personalizado: {custom_audio_path}")
-    
-    # Copiamos el archivo de audio personalizado al directorio de ejecución
-    audio_file = os.path.join(run_dir, "voice.mp3")
-    shutil.copy2(custom_audio_path, audio_file)
-    
-    # Como no tenemos guión, usamos placeholders
-    final_script = "Audio personalizado"
-    translated_script = final_script
-    hubo_traduccion = False
-    summary = "Audio personalizado"  # resumen para imágenes si se necesita
-    
-    # Generar un título simple
-    video_title = "Video con audio personalizado - " + os.path.splitext(os.path.basename(CUSTOM_AUDIO_FILE))[0]
-    logging.info(f"[Main] Título generado: {video_title}")
-    
-    # No hay script real para mostrar
-    script = final_script
-    
-    out_log.info("[Main] Usando modo de audio personalizado, omitiendo generación de guión y TTS")
-    
-else:
-    # === 1. Flujo normal - Búsqueda Web + Procesamiento ========================
-    if (os.getenv("USE_SCRIPT_FILE", "false").lower() == "true" and 
-            os.path.isfile(os.path.join('media', 'script.txt'))):
+# === 1. Guion y audio ========================================================
+def make_script_and_audio(cfg: JobConfig, run_dir: str) -> dict:
+    """
+    Genera (o carga) el guion, su traducción, el título y la voz.
+
+    Returns:
+        dict con script, translated_script, hubo_traduccion, summary, video_title y audio_file
+    """
+    if cfg.use_custom_audio:
+        # Modo de audio personalizado - omitimos toda la generación de guión y TTS
+        custom_audio_path = os.path.join('media', cfg.custom_audio_file)
+
+        if not os.path.isfile(custom_audio_path):
+            logging.error(f"No se encontró el archivo de audio personalizado: {custom_audio_path}")
+            raise FileNotFoundError(f"No se encontró el archivo de audio personalizado: {custom_audio_path}")
+
+        logging.info(f"[Main] Usando archivo de audio personalizado: {custom_audio_path}")
+
+        # Copiamos el archivo de audio personalizado al directorio de ejecución
+        # (compartido por hardlink entre ejecuciones, ver utils.run_store)
+        audio_file = run_store.import_file(custom_audio_path, os.path.join(run_dir, "voice.mp3"))
+
+        # Generar un título simple
+        video_title = "Video con audio personalizado - " + os.path.splitext(os.path.basename(cfg.custom_audio_file))[0]
+        logging.info(f"[Main] Título generado: {video_title}")
+
+        out_log.info("[Main] Usando modo de audio personalizado, omitiendo generación de guión y TTS")
+        # Como no tenemos guión, usamos placeholders
+        return {
+            "script": "Audio personalizado",
+            "translated_script": "Audio personalizado",
+            "hubo_traduccion": False,
+            "summary": "Audio personalizado",  # resumen para imágenes si se necesita
+            "video_title": video_title,
+            "audio_file": audio_file,
+        }
+
+    # Flujo normal - Búsqueda Web + Procesamiento
+    if cfg.use_script_file and os.path.isfile(os.path.join('media', 'script.txt')):
         # Usar archivo de script existente
         script_file = os.path.join('media', 'script.txt')
         logging.info("[Main] Usando script.txt encontrado en carpeta media")
@@ -96,131 +84,239 @@ else:
         summary = final_script[:300]  # resumen para imágenes
     else:
         # Búsqueda web automatizada
-        search_results = web_search(TOPIC, TEXT_MODEL)
+        search_results = web_search(cfg.web_search_topic, cfg.web_search_model)
         out_log.info("[WebSearchAgent]\n%s\n", search_results)
 
-        # === 2. Generación de Guión =================================================
-        # Nota: La función make_script solo recibe el resumen y el modelo, el tema se toma de SCRIPT_TOPIC en .env
-        script = make_script(search_results, SCRIPT_MODEL)
-        logging.info("[ScriptAgent] Guión generado")    
-        
+        # Generación de guion (tema y longitud salen de cfg)
+        script = make_script(search_results, cfg.script_model, config=cfg)
+        logging.info("[ScriptAgent] Guión generado")
+
         # Opcional: transformación adicional del guión
-        if os.getenv("SCRIPT_TRANSFORM_ENABLED", "false").lower() == "true":
-            transform_instruction = os.getenv("SCRIPT_TRANSFORM_INSTRUCTION", "")
-            final_script = transform_script(script, transform_instruction, SCRIPT_TRANSFORM_MODEL)
+        if cfg.script_transform_enabled:
+            final_script = transform_script(script, cfg.script_transform_instruction,
+                                            cfg.script_transform_model, config=cfg)
             logging.info("[ScriptTransformAgent] Guión transformado")
         else:
             final_script = script
-        
+
         summary = search_results[:300]  # resumen para imágenes
 
     # Verificar si se necesita traducir el texto
-    translated_script, hubo_traduccion = translate_script(final_script, SCRIPT_MODEL)
+    translated_script, hubo_traduccion = translate_script(final_script, cfg.script_model)
     out_log.info("[LangCheckAgent]\n%s\nTraducción:%s\n", translated_script, hubo_traduccion)
 
     # Generar título para la publicación de WhatsApp
-    video_title = make_title(final_script, TITLE_MODEL)
+    video_title = make_title(final_script, cfg.title_model)
     logging.info("[TitleAgent] Título generado: %s", video_title)
 
-    # === 4. Texto + audio ========================================================
+    # Texto + audio
     script = f"{final_script}"
     audio_file = make_audio(
-        script, VOICE, TTS_MODEL, os.path.join(run_dir, "voice.mp3")
+        script, cfg.tts_voice, cfg.tts_model, os.path.join(run_dir, "voice.mp3"), config=cfg
     )
     out_log.info("[TTS]\n%s\n", script)             # ← texto enviado a voz
     out_log.info("[Audio] %s", audio_file)
+    return {
+        "script": script,
+        "translated_script": translated_script,
+        "hubo_traduccion": hubo_traduccion,
+        "summary": summary,
+        "video_title": video_title,
+        "audio_file": audio_file,
+    }
 
-# === 3. Ilustraciones ===
-image_source = os.getenv("IMAGE_SOURCE", "api")
-
-if image_source == "web":
-    # Descargar imágenes en paralelo (una por tema)
-    img_files_all = []
-    topic_imgs = fetch_images_via_bing(KEYWORK_IMAGE_SEARCH, count=IMAGE_COUNT, out_dir=run_dir)
-    if topic_imgs:
-        img_files_all.extend(topic_imgs)
-    
-    if img_files_all:
-        img_files = img_files_all[:IMAGE_COUNT]
-    else:
-        # Si no hay imágenes de Bing, usar OpenAI como fallback
-        logging.warning("No se encontraron imágenes con Bing, intentando con OpenAI API...")
-        img_files = make_images(summary, IMAGE_COUNT, run_dir)
-elif image_source == "local":
-    # Usar imágenes de la carpeta media
-    media_dir = os.path.join(os.path.dirname(__file__), 'media')
-    if not os.path.exists(media_dir):
-        os.makedirs(media_dir)
-    
-    # Obtener lista de archivos de imagen soportados
-    img_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
-    img_files = []
-    
-    # Buscar archivos de imagen en el directorio media
-    for root, _, files in os.walk(media_dir):
-        for file in sorted(files):  # Ordenar alfabéticamente
-            if file.lower().endswith(img_extensions):
-                img_files.append(os.path.abspath(os.path.join(root, file)))
-                if len(img_files) >= IMAGE_COUNT:
-                    break
-        if img_files:  # Si ya encontramos suficientes imágenes, salir del bucle
-            break
-    
-    # Mover las imágenes al directorio de ejecución
-    if img_files:
-        moved_files = []
-        for i, img_path in enumerate(img_files[:IMAGE_COUNT]):
-            try:
-                # Generar un nombre de archivo único para el destino
-                ext = os.path.splitext(img_path)[1]
-                dest_path = os.path.join(run_dir, f'local_img_{i+1}{ext}')
-                shutil.move(img_path, dest_path)
-                moved_files.append(dest_path)
-                logging.info(f"Imagen movida: {img_path} -> {dest_path}")
-            except Exception as e:
-                logging.error(f"Error moviendo imagen {img_path}: {e}")
-        
-        if not moved_files:
-            logging.error("No se pudieron mover las imágenes locales. Usando imágenes por defecto.")
-            img_files = make_images(summary, IMAGE_COUNT, run_dir)
+# === 2. Ilustraciones ========================================================
+def collect_images(cfg: JobConfig, summary: str, run_dir: str) -> list[str]:
+    """Obtiene IMAGE_COUNT imágenes según IMAGE_SOURCE (api, web, local o race)"""
+    image_count = cfg.image_count
+
+    if cfg.image_source == "race":
+        # Bing y la API compiten: la API arranca tras IMAGE_RACE_HEDGE s (o antes si Bing termina
+        # sin llenar los huecos) y la primera imagen válida de cualquiera ocupa cada hueco
+        result = image_race.race([
+            ("web", 0.0, lambda n, cancel, deliver: fetch_images_via_bing(
+                cfg.keywork_image_search, count=n, out_dir=run_dir, cancel=cancel, on_image=deliver,
+                config=cfg)),
+            ("api", cfg.image_race_hedge, lambda n, cancel, deliver: make_images(
+                summary, n, run_dir, config=cfg, cancel=cancel, on_image=deliver)),
+        ], image_count)
+        out_log.info("[ImageRace] Ganadora: %s; origen por imagen: %s; primera imagen (s): %s",
+                     result.winner, result.sources, result.first_image)
+        img_files = result.files
+        if not img_files:
+            raise RuntimeError("Ninguna fuente de imágenes (web ni API) entregó imágenes")
+    elif cfg.image_source == "web":
+        # Descargar imágenes en paralelo (una por tema)
+        img_files_all = []
+        topic_imgs = fetch_images_via_bing(cfg.keywork_image_search, count=image_count, out_dir=run_dir,
+                                           config=cfg)
+        if topic_imgs:
+            img_files_all.extend(topic_imgs)
+
+        if img_files_all:
+            img_files = img_files_all[:image_count]
         else:
-            img_files = moved_files
+            # Si no hay imágenes de Bing, usar OpenAI como fallback
+            logging.warning("No se encontraron imágenes con Bing, intentando con OpenAI API...")
+            img_files = make_images(summary, image_count, run_dir, config=cfg)
+    elif cfg.image_source == "local":
+        # Usar imágenes de la carpeta media, a través de su índice (utils.media_library)
+        library = MediaLibrary(os.path.join(os.path.dirname(__file__), 'media'))
+        library.scan()
+
+        # Reserva atómica: otro worker nunca recibe las mismas imágenes
+        img_files = library.claim(image_count, owner=os.path.basename(os.path.normpath(run_dir)),
+                                  policy=cfg.media_library_policy,
+                                  orientation=cfg.media_library_orientation)
+
+        # Mover (o, si MEDIA_LIBRARY_CONSUME=false, enlazar) las imágenes al directorio de ejecución
+        if img_files:
+            moved_files = []
+            for i, img_path in enumerate(img_files):
+                try:
+                    # Generar un nombre de archivo único para el destino
+                    ext = os.path.splitext(img_path)[1]
+                    dest_path = os.path.join(run_dir, f'local_img_{i+1}{ext}')
+                    if cfg.media_library_consume:
+                        shutil.move(img_path, dest_path)
+                        library.consume(img_path)
+                    else:
+                        run_store.import_file(img_path, dest_path)
+                        library.release(img_path, used=True)
+                    moved_files.append(dest_path)
+                    logging.info(f"Imagen movida: {img_path} -> {dest_path}")
+                except Exception as e:
+                    library.release(img_path)
+                    logging.error(f"Error moviendo imagen {img_path}: {e}")
+
+            if not moved_files:
+                logging.error("No se pudieron mover las imágenes locales. Usando imágenes por defecto.")
+                img_files = make_images(summary, image_count, run_dir, config=cfg)
+            else:
+                img_files = moved_files
+        else:
+            logging.warning("No se encontraron imágenes en la carpeta 'media'. Usando generación de imágenes por defecto.")
+            img_files = make_images(summary, image_count, run_dir, config=cfg)
     else:
-        logging.warning("No se encontraron imágenes en la carpeta 'media'. Usando generación de imágenes por defecto.")
-        img_files = make_images(summary, IMAGE_COUNT, run_dir)
-else:
-    # Genera N imágenes con la API de OpenAI (comportamiento por defecto)
-    img_files = make_images(summary, IMAGE_COUNT, run_dir)
-out_log.info("[Illustration]\n%s\n", "\n".join(img_files))
-
-# === 4. Vídeo y audio ========================================================
-
-# === 5. Vídeo ================================================================
-from utils.video_helper import generate_video
-
-# Verificar si existe caption.txt en la carpeta media
-caption_file_path = os.path.join('media', 'caption.txt')
-if USE_CAPTION_FILE and os.path.isfile(caption_file_path):
-    logging.info("[Main] Utilizando caption.txt encontrado en carpeta media")
-    with open(caption_file_path, 'r', encoding='utf-8') as file:
-        caption_text = file.read().strip()
-else:
-    caption_text = CAPTION_TEXT
-    
-# Generar vídeo con las imágenes, audio y subtítulos
-subtitle_font_size = int(os.getenv("SUBTITLE_FONT_SIZE", "30"))
-video_path = generate_video(
-    audio_file=audio_file,
-    img_files=img_files,
-    script=script,
-    translated_script=translated_script,
-    hubo_traduccion=hubo_traduccion,
-    caption_text=caption_text,
-    run_dir=run_dir,
-    font_size=subtitle_font_size
-)
-
-logging.info("[Main] Vídeo listo: %s", video_path)
-
-# === 6. Publicar en WhatsApp Web ============================================
-publish(video_path, video_title)
+        # Genera N imágenes con la API de OpenAI (comportamiento por defecto)
+        img_files = make_images(summary, image_count, run_dir, config=cfg)
+    out_log.info("[Illustration]\n%s\n", "\n".join(img_files))
+    return img_files
+
+def resolve_caption(cfg: JobConfig) -> str | None:
+    """Texto de la esquina: media/caption.txt si USE_CAPTION_FILE, si no CAPTION_TEXT"""
+    caption_file_path = os.path.join('media', 'caption.txt')
+    if cfg.use_caption_file and os.path.isfile(caption_file_path):
+        logging.info("[Main] Utilizando caption.txt encontrado en carpeta media")
+        with open(caption_file_path, 'r', encoding='utf-8') as file:
+            return file.read().strip()
+    return cfg.caption_text
+
+# === 3. Vídeo ================================================================
+def build_status(cfg: JobConfig, run_dir: str, draft: bool | None = None,
+                 timings: dict | None = None) -> tuple[str, str]:
+    """
+    Ejecuta el flujo completo de un trabajo hasta el vídeo, sin publicarlo.
+
+    Args:
+        cfg: configuración del trabajo
+        run_dir: carpeta de la ejecución
+        draft: render de borrador; por defecto cfg.video_draft
+        timings: si se pasa un dict, se rellena con la duración (s) de cada etapa
+
+    Returns:
+        (ruta del vídeo, título para WhatsApp)
+    """
+    from utils.video_helper import generate_video
+
+    # La instantánea de la configuración queda junto a los resultados de la ejecución
+    with open(os.path.join(run_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(cfg.to_dict(), f, ensure_ascii=False, indent=2)
+
+    timings = {} if timings is None else timings
+    # Las llamadas a OpenAI de este trabajo comparten puesto en la cola del planificador
+    with openai_scheduler.job_context(os.path.basename(os.path.normpath(run_dir))):
+        t0 = time.perf_counter()
+        with trace_helper.span("script_audio", custom_audio=cfg.use_custom_audio):
+            parts = make_script_and_audio(cfg, run_dir)
+        t1 = time.perf_counter()
+        with trace_helper.span("images", source=cfg.image_source, count=cfg.image_count):
+            img_files = collect_images(cfg, parts["summary"], run_dir)
+        t2 = time.perf_counter()
+
+    # Generar vídeo con las imágenes, audio y subtítulos
+    with trace_helper.span("video", mode=cfg.video_render_mode, motion=cfg.video_motion):
+        video_path = generate_video(
+            audio_file=parts["audio_file"],
+            img_files=img_files,
+            script=parts["script"],
+            translated_script=parts["translated_script"],
+            hubo_traduccion=parts["hubo_traduccion"],
+            caption_text=resolve_caption(cfg),
+            run_dir=run_dir,
+            font_size=cfg.subtitle_font_size,
+            draft=cfg.video_draft if draft is None else draft,
+            config=cfg,
+        )
+    # Las imágenes se entregaron en memoria; sus ficheros deben estar escritos al cerrar la ejecución
+    if image_artifact.flush():
+        logging.warning("[Main] Alguna imagen de la ejecución no se pudo guardar en %s", run_dir)
+    for src in img_files:
+        image_artifact.release(src)
+    timings.update(script_audio=round(t1 - t0, 2), images=round(t2 - t1, 2),
+                   video=round(time.perf_counter() - t2, 2))
+    return video_path, parts["video_title"]
+
+# === 4. Publicar en WhatsApp Web ============================================
+def publish_status(cfg: JobConfig, video_path: str, video_title: str, run_dir: str) -> str:
+    """Publica directamente o encola en el spool según PUBLISH_MODE; devuelve el estado de la ejecución"""
+    # Cuenta de destino (clave de WHATSAPP_ACCOUNTS); vacía → perfil WHATSAPP_PROFILE_DIR
+    if cfg.publish_mode == "spool":
+        # El worker del spool (python -m utils.publish_spool) se encarga de publicar con reintentos
+        job_id = enqueue_publish(video_path, video_title, account=cfg.whatsapp_account,
+                                 run_dir=os.path.abspath(run_dir))
+        logging.info("[Main] Vídeo encolado para publicar (trabajo %s). Cola: %s", job_id, spool_stats()["depth"])
+        return "queued"
+    publish(video_path, video_title, account=cfg.whatsapp_account)
+    return "published"
+
+def main() -> None:
+    # === 0. Arranque =========================================================
+    bootstrap()
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    # Presupuestos de OpenAI alimentados por las cabeceras de cada respuesta
+    openai_scheduler.install_hooks()
+    cfg = JobConfig.from_env()
+
+    # Retención de runs/ por edad y cuota (RUNS_MAX_AGE_DAYS, RUNS_MAX_MB) antes de llenar más disco
+    run_store.enforce_retention()
+    run_dir = new_run_dir(topic=cfg.web_search_topic or cfg.script_topic)
+    logging.info("[Main] Carpeta de ejecución: %s", run_dir)
+
+    timings = {}
+    try:
+        # Traza de la ejecución (TRACE_FORMAT): runs/<run>/trace.json, con publicación incluida
+        with trace_helper.start(run_dir):
+            video_path, video_title = build_status(cfg, run_dir, timings=timings)
+            if cfg.video_draft:
+                # Modo borrador: render rápido para revisión, sin publicación
+                logging.info("[Main] Borrador listo para revisión: %s", video_path)
+                run_store.finish_run(run_dir, "draft", video_path=video_path, timings=timings)
+                return
+
+            logging.info("[Main] Vídeo listo: %s", video_path)
+            t0 = time.perf_counter()
+            with trace_helper.span("publish", mode=cfg.publish_mode):
+                status = publish_status(cfg, video_path, video_title, run_dir)
+            timings["publish"] = round(time.perf_counter() - t0, 2)
+    except BaseException:
+        run_store.finish_run(run_dir, "failed", timings=timings)
+        raise
+    finally:
+        # Latencias por etapa de las llamadas a OpenAI: base de los umbrales de cobertura
+        call_policy.save_latencies()
+        logging.info("[Main] Latencias de llamadas: %s", call_policy.summary())
+    run_store.finish_run(run_dir, status, video_path=video_path, timings=timings)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import logging
-from agents import Agent, Runner
+from agents import Agent
+from utils import openai_scheduler, call_policy
 import json
 
 log = logging.getLogger(__name__)
@@ -33,7 +34,10 @@ def run(final_script: str, model: str) -> tuple[str, bool]:
         tools=[],
     )
     
-    result = Runner.run_sync(agent, final_script)
+    # La respuesta puede incluir la traducción completa
+    result = call_policy.run_agent(agent, final_script, stage="langcheck",
+                                   tokens=openai_scheduler.estimate_tokens(agent.instructions, final_script,
+                                                                           output=len(final_script) // 4 + 64))
     output = result.final_output.strip()
     
     try:
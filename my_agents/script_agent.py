@@ -1,26 +1,26 @@
 # agents/script_agent.py
 
 import logging
-import os
-from agents import Agent, Runner, ModelSettings
+from agents import Agent, ModelSettings
+from utils.config import JobConfig
+from utils import openai_scheduler, call_policy
 
 log = logging.getLogger(__name__)
 
-"""Delay env var reading; load VIDEO_TEXT_LEN and SCRIPT_TOPIC inside run()."""
-import os  # ensure os is imported
-
-def run(summary: str, model: str) -> str:
+def run(summary: str, model: str, config: JobConfig | None = None) -> str:
     """
     Agente que convierte un resumen en una cita/aforismo breve.
     Devuelve el texto generado.
+
+    La longitud (VIDEO_TEXT_LEN) y el tema (SCRIPT_TOPIC) salen de config; sin config
+    se toma una instantánea del entorno en el momento de la llamada.
     """
     log.info("[ScriptAgent] Iniciando agente de guion...")
-    # Load environment settings at runtime
-    video_text_len_str = os.getenv("VIDEO_TEXT_LEN")
-    if video_text_len_str is None:
+    config = config or JobConfig.from_env()
+    video_text_len = config.video_text_len
+    if video_text_len is None:
         raise ValueError("VIDEO_TEXT_LEN must be set in environment")
-    video_text_len = int(video_text_len_str)
-    script_topic = os.getenv("SCRIPT_TOPIC")
+    script_topic = config.script_topic
     if script_topic is None:
         raise ValueError("SCRIPT_TOPIC must be set in environment")
     agent = Agent(
@@ -37,7 +37,8 @@ def run(summary: str, model: str) -> str:
         tools=[],  # no necesita herramientas externas
         model_settings=ModelSettings(temperature=1.0),
     )
-    # Ejecuta de forma sincrónica
-    result = Runner.run_sync(agent, summary)
+    # Ejecuta de forma sincrónica (con plazo, reintentos y cobertura de call_policy)
+    result = call_policy.run_agent(agent, summary, stage="script",
+                                   tokens=openai_scheduler.estimate_tokens(agent.instructions, summary))
     quote = result.final_output.strip()
     return quote
@@ -1,17 +1,18 @@
 import logging
-import os
-from agents import Agent, Runner, ModelSettings
+from agents import Agent, ModelSettings
+from utils.config import JobConfig
+from utils import openai_scheduler, call_policy
 
 log = logging.getLogger(__name__)
 
-def run(script: str, instruction: str, model: str = None) -> str:
+def run(script: str, instruction: str, model: str = None, config: JobConfig | None = None) -> str:
     """
     Agente que transforma un guion recibido según una instrucción personalizada.
     Devuelve el texto transformado.
     """
     log.info("[ScriptTransformAgent] Iniciando agente de transformación...")
     if not model:
-        model = os.getenv("SCRIPT_TRANSFORM_MODEL")
+        model = (config or JobConfig.from_env()).script_transform_model
     agent = Agent(
         name="ScriptTransformAgent",
         model=model,
@@ -23,7 +24,8 @@ def run(script: str, instruction: str, model: str = None) -> str:
         model_settings=ModelSettings(temperature=1.0),
     )
     prompt = f"{instruction}\n\nTexto original:\n{script}\n\nTexto transformado:"
-    # Ejecuta de forma sincrónica usando el patrón correcto del SDK
-    result = Runner.run_sync(agent, prompt)
+    # Ejecuta de forma sincrónica, con el plazo y los reintentos de la etapa
+    result = call_policy.run_agent(agent, prompt, stage="transform",
+                                   tokens=openai_scheduler.estimate_tokens(prompt, output=len(script) // 4 + 256))
     log.info("[ScriptTransformAgent] Guion transformado con instrucción: %s", instruction)
     return result.final_output.strip()
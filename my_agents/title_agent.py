@@ -1,6 +1,7 @@
 import logging
 import os
-from agents import Agent, Runner, ModelSettings
+from agents import Agent, ModelSettings
+from utils import openai_scheduler, call_policy
 
 log = logging.getLogger(__name__)
 
@@ -27,6 +28,7 @@ def run(script: str, model: str) -> str:
         ),
         tools=[],
     )
-    result = Runner.run_sync(agent, script)
+    result = call_policy.run_agent(agent, script, stage="title",
+                                   tokens=openai_scheduler.estimate_tokens(agent.instructions, script, output=64))
     title = result.final_output.strip()    
     return title
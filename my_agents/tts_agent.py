@@ -1,19 +1,35 @@
+import os
+import uuid
 import logging
 import openai
 from pathlib import Path
-import os
+from utils.config import JobConfig
+from utils import openai_scheduler, call_policy
 
-def run(text: str, voice: str, model: str, out_path: Path) -> str:
-    """Genera audio MP3 con la voz/tono configurados."""
+def run(text: str, voice: str, model: str, out_path: Path, config: JobConfig | None = None) -> str:
+    """Genera audio MP3 con la voz/tono configurados (el tono sale de config.tts_tone)."""
     logging.info("[TTS] Sintetizando voz (%s)…", voice)
-    tts_instructions = os.getenv("TTS_TONE")
-    with openai.audio.speech.with_streaming_response.create(
-        model=model,
-        voice=voice,
-        input=text,
-        instructions=tts_instructions,
-    ) as response:
-        response.stream_to_file(str(out_path))
+    tts_instructions = (config or JobConfig.from_env()).tts_tone
+
+    def synthesize(timeout):
+        # Cada intento escribe su propio fichero: uno abandonado por el plazo no pisa al siguiente
+        tmp_path = f"{out_path}.{uuid.uuid4().hex[:8]}.part"
+        try:
+            with openai.audio.speech.with_streaming_response.create(
+                model=model,
+                voice=voice,
+                input=text,
+                instructions=tts_instructions,
+                timeout=timeout,
+            ) as response:
+                response.stream_to_file(tmp_path)
+            os.replace(tmp_path, str(out_path))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    call_policy.call(synthesize, stage="tts", model=model,
+                     tokens=openai_scheduler.estimate_tokens(text, tts_instructions, output=0))
     logging.info("[TTS] Audio en %s", out_path)
 
     return str(out_path)
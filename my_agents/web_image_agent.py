@@ -4,13 +4,18 @@ import uuid
 import logging
 import re
 from pathlib import Path
-from typing import List # Eliminado Dict, Any ya que no se usan directamente en lo restante
+import math
+import threading
+from typing import Callable, List # Eliminado Dict, Any ya que no se usan directamente en lo restante
 from io import BytesIO
+import numpy as np
 from PIL import Image, UnidentifiedImageError
 
 # Dependencia para el nuevo agente
 from bing_image_downloader import downloader as bing_downloader
 import shutil
+from utils import trace_helper, image_artifact
+from utils.config import JobConfig
 
 # ===========================================================================
 # Logger global
@@ -26,6 +31,9 @@ log = logging.getLogger(__name__)
 MEDIA_DIR = Path(__file__).parent.parent / "media"
 MEDIA_DIR.mkdir(parents=True, exist_ok=True)
 
+# Cribado de candidatas (ver _screen_candidates); los umbrales son del trabajo (JobConfig)
+_SCREEN_SIZE = 128                                                 # lado del gris reducido para el laplaciano
+
 # ===========================================================================
 # CLASE ImageSearchAgent
 # ===========================================================================
@@ -67,15 +75,16 @@ class ImageSearchAgent:
 
         downloaded_image_paths = []
         try:
-            bing_downloader.download(
-                query,
-                limit=num_images,
-                output_dir=str(self.base_output_dir),
-                adult_filter_off=adult_filter_off,
-                force_replace=force_replace,
-                timeout=timeout,
-                verbose=True  # Activar para ver más detalles del error
-            )
+            with trace_helper.span("images.download", query=query, limit=num_images):
+                bing_downloader.download(
+                    query,
+                    limit=num_images,
+                    output_dir=str(self.base_output_dir),
+                    adult_filter_off=adult_filter_off,
+                    force_replace=force_replace,
+                    timeout=timeout,
+                    verbose=True  # Activar para ver más detalles del error
+                )
 
             if os.path.exists(actual_download_folder):
                 for item in os.listdir(actual_download_folder):
@@ -97,10 +106,11 @@ class ImageSearchAgent:
 # ---------------------------------------------------------------------------
 # Utilidades de imagen
 # ---------------------------------------------------------------------------
+@trace_helper.traced("images.resize")
 def _process_downloaded_image(source_image_path: Path, final_out_dir: Path, desired_width: int = 1024, aspect_ratio: float = 16/9) -> str:
     """
     Abre una imagen desde source_image_path, la redimensiona a proporción 16:9, y la guarda en final_out_dir.
-    Retorna la ruta de la imagen guardada o una cadena vacía si falla.
+    Retorna la ruta de la imagen (un ImageArtifact con la imagen en memoria) o una cadena vacía si falla.
     """
     try:
         log.debug("Procesando imagen: %s, directorio final=%s", source_image_path, final_out_dir)
@@ -142,10 +152,10 @@ def _process_downloaded_image(source_image_path: Path, final_out_dir: Path, desi
         # Nombre de archivo único en el directorio de salida final
         path = final_out_dir / f"img_{int(time.time())}_{uuid.uuid4().hex}.jpg"
 
-        final_out_dir.mkdir(parents=True, exist_ok=True)
-        img.save(path, format="JPEG", quality=90) # Calidad JPEG
-        log.debug("Imagen procesada y guardada en %s", path)
-        return str(path)
+        # La imagen queda en memoria para el render; el JPEG se escribe en segundo plano
+        artifact = image_artifact.persist(img, path, format="JPEG", quality=90) # Calidad JPEG
+        log.debug("Imagen procesada, guardándose en %s", path)
+        return artifact
     except UnidentifiedImageError:
         log.error("No se pudo identificar el archivo (corrupto o no es imagen): %s", source_image_path)
         return ""
@@ -153,10 +163,81 @@ def _process_downloaded_image(source_image_path: Path, final_out_dir: Path, desi
         log.exception(f"Error en _process_downloaded_image procesando {source_image_path}")
         return ""
 
+# ---------------------------------------------------------------------------
+# Cribado de candidatas
+# ---------------------------------------------------------------------------
+def _screen_decode(path: str):
+    """Decodificación barata: tamaño original + gris reducido (JPEG con draft, sin decodificar a tamaño completo)"""
+    try:
+        with Image.open(path) as img:
+            size = img.size
+            img.draft("L", (_SCREEN_SIZE, _SCREEN_SIZE))
+            gray = img.convert("L")
+            small = np.asarray(gray.resize((_SCREEN_SIZE, _SCREEN_SIZE), Image.BILINEAR), dtype=np.float32)
+            dhash = np.asarray(gray.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+        return size, small, dhash
+    except Exception as e:
+        log.debug("Candidata ilegible %s: %s", path, e)
+        return None
+
+@trace_helper.traced("images.screen")
+def _screen_candidates(paths: List[str], config: JobConfig | None = None) -> List[str]:
+    """
+    Ordena las candidatas de mejor a peor y quita las casi-duplicadas, antes de redimensionar.
+
+    Sobre todo el lote a la vez (NumPy): resolución del original, nitidez (varianza del
+    laplaciano del gris reducido) y dHash de 64 bits. Primero van las que superan
+    IMAGE_MIN_SIDE e IMAGE_MIN_SHARPNESS, cada grupo ordenado por nitidez ponderada por la
+    resolución (hasta 1080 px, el ancho del lienzo), así que de dos copias de la misma foto
+    se queda la más grande. Una candidata a <= IMAGE_DUP_DISTANCE bits de otra mejor situada
+    se descarta. Las que no superan los umbrales quedan al final, solo como relleno.
+    Los umbrales salen de config (por defecto, del entorno).
+    """
+    config = config or JobConfig.from_env()
+    decoded = [(p, d) for p in paths if (d := _screen_decode(p)) is not None]
+    if not decoded:
+        return []
+    sizes = np.array([d[0] for _, d in decoded])                   # (N, 2)
+    grays = np.stack([d[1] for _, d in decoded])                   # (N, S, S)
+    hashes = np.stack([d[2] for _, d in decoded])                  # (N, 8, 9)
+
+    lap = (grays[:, 1:-1, :-2] + grays[:, 1:-1, 2:] + grays[:, :-2, 1:-1] + grays[:, 2:, 1:-1]
+           - 4 * grays[:, 1:-1, 1:-1])
+    sharpness = lap.var(axis=(1, 2))
+    bits = (hashes[:, :, 1:] > hashes[:, :, :-1]).reshape(len(decoded), -1)
+    distance = (bits[:, None, :] != bits[None, :, :]).sum(axis=2)  # (N, N) distancia de Hamming
+    passes = (sizes.min(axis=1) >= config.image_min_side) & (sharpness >= config.image_min_sharpness)
+    score = sharpness * np.minimum(1.0, sizes.min(axis=1) / 1080)
+
+    ranked: List[int] = []
+    for i in sorted(range(len(decoded)), key=lambda i: (not passes[i], -score[i])):
+        if not any(distance[i, j] <= config.image_dup_distance for j in ranked):
+            ranked.append(i)
+
+    log.info("Cribado: %d candidatas → %d distintas (%d casi-duplicadas, %d ilegibles, %d bajo los umbrales)",
+             len(paths), len(ranked), len(decoded) - len(ranked), len(paths) - len(decoded),
+             sum(1 for i in ranked if not passes[i]))
+    for i in ranked:
+        log.debug("  %s: %dx%d, nitidez %.0f", decoded[i][0], *sizes[i], sharpness[i])
+    return [decoded[i][0] for i in ranked]
+
 # ---------------------------------------------------------------------------
 # Función de agente usando ImageSearchAgent (Bing)
 # ---------------------------------------------------------------------------
-def fetch_images_via_bing(topic: str, count: int, out_dir: str) -> List[str]:
+def fetch_images_via_bing(topic: str, count: int, out_dir: str, cancel: threading.Event | None = None,
+                          on_image: Callable[[str], None] | None = None,
+                          config: JobConfig | None = None) -> List[str]:
+    """
+    Descarga `count` imágenes de Bing para `topic` y las deja en 16:9 en out_dir.
+
+    Se descargan IMAGE_FETCH_OVERFETCH veces más candidatas de las pedidas; el cribado
+    (_screen_candidates) las ordena por calidad y solo se redimensionan las `count` primeras.
+
+    cancel/on_image son para IMAGE_SOURCE=race: cada imagen procesada se entrega en cuanto
+    está lista y, si cancel se activa, no se procesan más (la descarga en curso no se corta).
+    config: umbrales del cribado (IMAGE_FETCH_OVERFETCH, IMAGE_MIN_SIDE...); por defecto, el entorno
+    """
+    config = config or JobConfig.from_env()
     log.info("=== BÚSQUEDA DE IMÁGENES (Bing): %s ===", topic)
 
     final_out_path = Path(out_dir)
@@ -171,7 +252,8 @@ def fetch_images_via_bing(topic: str, count: int, out_dir: str) -> List[str]:
     agent = ImageSearchAgent(base_output_dir=str(temp_bing_download_dir))
 
     # force_replace=True es útil para dir temporales para asegurar descargas frescas si se reejecuta.
-    raw_downloaded_paths = agent.search_and_download(topic, num_images=count, force_replace=True)
+    raw_downloaded_paths = agent.search_and_download(topic, num_images=max(count, math.ceil(count * config.image_fetch_overfetch)),
+                                                     force_replace=True)
 
     if not raw_downloaded_paths:
         log.warning(f"ImageSearchAgent no devolvió rutas para '{topic}'.")
@@ -185,16 +267,22 @@ def fetch_images_via_bing(topic: str, count: int, out_dir: str) -> List[str]:
         return []
 
     log.info(f"ImageSearchAgent descargó {len(raw_downloaded_paths)} imágenes en bruto.")
+    raw_downloaded_paths = _screen_candidates(raw_downloaded_paths, config)
 
     processed_image_paths: List[str] = []
     for i, raw_path_str in enumerate(raw_downloaded_paths):
         if len(processed_image_paths) >= count: # No procesar más de 'count'
             break
+        if cancel is not None and cancel.is_set():
+            log.info("Búsqueda en Bing cancelada: otra fuente ya completó las imágenes.")
+            break
         log.debug(f"Procesando imagen {i+1}/{len(raw_downloaded_paths)}: {raw_path_str}")
         # Usar proporción 16:9 para procesar las imágenes
         processed_path = _process_downloaded_image(Path(raw_path_str), final_out_path, desired_width=1024, aspect_ratio=16/9)
         if processed_path:
             processed_image_paths.append(processed_path)
+            if on_image is not None:
+                on_image(processed_path)
 
     # Limpiar el directorio temporal de descargas de Bing
     try:
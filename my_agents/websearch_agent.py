@@ -1,5 +1,6 @@
 import logging
-from agents import Agent, WebSearchTool, Runner, ModelSettings
+from agents import Agent, WebSearchTool, ModelSettings
+from utils import openai_scheduler, call_policy
 
 log = logging.getLogger(__name__)
 
@@ -14,5 +15,8 @@ def run(topic: str, model: str) -> str:
         tools=[WebSearchTool()],
         model_settings=ModelSettings(temperature=1.0),
     )
-    result = Runner.run_sync(agent, f"Ideas para crear un texto sobre {topic}")
+    prompt = f"Ideas para crear un texto sobre {topic}"
+    # La búsqueda web añade contexto a la entrada: se reserva más presupuesto de tokens
+    result = call_policy.run_agent(agent, prompt, stage="websearch",
+                                   tokens=openai_scheduler.estimate_tokens(prompt, output=4096))
     return result.final_output.strip()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Planificador de franjas de publicación con pregeneración.
+
+Conoce las próximas franjas (POST_SLOTS) y, dentro de la ventana de antelación
+(PREGEN_LOOKAHEAD_HOURS), ejecuta por adelantado todo lo caro del flujo: búsqueda,
+guion, TTS, imágenes y render, con como mucho PREGEN_CONCURRENCY trabajos a la vez.
+Cada vídeo terminado se encola en el spool con not_before = hora de la franja, así que
+a la hora de publicar solo queda publish() en un navegador ya abierto.
+
+El estado de cada franja se deduce del propio spool (clave 'slot' del trabajo): si el
+planificador se reinicia, no regenera las franjas que ya tienen vídeo.
+
+Con PREGEN_BACKEND=queue no renderiza en este host: cada franja se deja en la cola de render
+compartida (utils.render_queue) y la renderizan los workers de cualquier máquina, que
+encolan el vídeo en el spool con la misma clave 'slot'.
+
+Uso:
+    python scheduler.py                 # pregenera y publica (incluye el worker del spool)
+    python scheduler.py --no-publisher  # solo pregenera; publica otro proceso (python -m utils.publish_spool)
+    python scheduler.py --plan          # muestra las próximas franjas y su estado
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import datetime
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.helper import bootstrap
+from utils.config import JobConfig
+from utils import run_store
+from utils import publish_spool
+from utils import render_queue
+from utils import openai_scheduler, call_policy, trace_helper
+
+log = logging.getLogger(__name__)
+
+def parse_slots(value: str) -> list[datetime.time]:
+    """'09:00, 14:30,21:00' → horas del día ordenadas"""
+    slots = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            slots.append(datetime.datetime.strptime(item, "%H:%M").time())
+        except ValueError:
+            raise ValueError(f"POST_SLOTS: franja no válida '{item}' (formato HH:MM)") from None
+    return sorted(set(slots))
+
+def upcoming_slots(now: datetime.datetime, slots: list[datetime.time],
+                   lookahead_hours: float) -> list[datetime.datetime]:
+    """Franjas posteriores a now dentro de la ventana de antelación, en orden"""
+    horizon = now + datetime.timedelta(hours=lookahead_hours)
+    result = []
+    day = now.date()
+    while datetime.datetime.combine(day, datetime.time.min) <= horizon:
+        for t in slots:
+            dt = datetime.datetime.combine(day, t)
+            if now < dt <= horizon:
+                result.append(dt)
+        day += datetime.timedelta(days=1)
+    return result
+
+def slot_key(dt: datetime.datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M")
+
+def _init_worker(budget_share: float) -> None:
+    """Inicializador de cada proceso del pool: logging, clave de OpenAI y su parte del presupuesto"""
+    import openai
+
+    bootstrap()
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    # Los límites de la cuenta se reparten entre los procesos que generan a la vez
+    openai_scheduler.install_hooks(share=budget_share)
+
+def _generate(cfg_data: dict, key: str) -> dict:
+    """Se ejecuta en un proceso del pool: flujo completo hasta el vídeo, sin publicar"""
+    from main import build_status
+
+    cfg = JobConfig.from_dict(cfg_data)
+    run_dir = run_store.create_run(topic=cfg.web_search_topic or cfg.script_topic)
+    log.info("[Scheduler] Pregenerando franja %s en %s", key, run_dir)
+    timings = {}
+    try:
+        with trace_helper.start(run_dir):
+            video_path, video_title = build_status(cfg, run_dir, draft=False, timings=timings)
+    except BaseException:
+        run_store.finish_run(run_dir, "failed", timings=timings)
+        raise
+    finally:
+        call_policy.save_latencies()
+    # 'queued': la retención no lo borra mientras espera su franja
+    run_store.finish_run(run_dir, "queued", video_path=video_path, timings=timings)
+    return {"run_dir": os.path.abspath(run_dir), "video_path": video_path,
+            "video_title": video_title, "timings": timings}
+
+class SlotScheduler:
+    """
+    Mantiene pregeneradas las franjas de la ventana de antelación.
+
+    tick() es idempotente: consulta el spool, lanza las franjas que faltan (respetando
+    la concurrencia y el tiempo de reintento de las fallidas) y encola las terminadas.
+    """
+
+    def __init__(self, slots: list[datetime.time], cfg: JobConfig, lookahead_hours: float = 6,
+                 concurrency: int = 1, retry_minutes: float = 10, backend: str = "local"):
+        if not slots:
+            raise ValueError("POST_SLOTS no define ninguna franja")
+        if backend not in ("local", "queue"):
+            raise ValueError(f"PREGEN_BACKEND debe ser 'local' o 'queue', no '{backend}'")
+        self.slots = slots
+        self.cfg = cfg
+        self.lookahead_hours = lookahead_hours
+        self.concurrency = max(1, concurrency)
+        self.retry_minutes = retry_minutes
+        self.backend = backend
+        self.budget_share = float(os.getenv("OPENAI_BUDGET_SHARE", "1"))
+        self.inflight: dict = {}     # Future → clave de franja
+        self.failed_at: dict = {}    # clave de franja → momento del último fallo
+        self._executor = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # 'spawn': el proceso padre tiene hilos (worker del spool) y fork no es seguro con ellos
+            self._executor = ProcessPoolExecutor(max_workers=self.concurrency,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_worker,
+                                                 initargs=(self.budget_share / self.concurrency,))
+        return self._executor
+
+    def scheduled(self) -> dict:
+        """
+        Franjas próximas que ya tienen vídeo en el spool: {clave: estado del trabajo}.
+        Un trabajo se publica en su franja o después, así que basta con pending/ y claimed/.
+        """
+        return {job["slot"]: state for state, job in publish_spool.jobs(("pending", "claimed"))
+                if job.get("slot")}
+
+    def remote(self) -> tuple[set, dict]:
+        """Franjas en la cola de render: (pendientes o en render, {franja: momento del fallo})"""
+        generating, failed = set(), {}
+        for state, job in render_queue.jobs(("pending", "leased", "failed")):
+            if not job.get("slot"):
+                continue
+            if state == "failed":
+                failed[job["slot"]] = job.get("failed_at", 0)
+            else:
+                generating.add(job["slot"])
+        return generating, failed
+
+    def plan(self, now: datetime.datetime | None = None) -> list[dict]:
+        now = now or datetime.datetime.now()
+        scheduled = self.scheduled()
+        generating = set(self.inflight.values())
+        if self.backend == "queue":
+            remote, failed = self.remote()
+            generating |= remote
+            self.failed_at.update(failed)
+        plan = []
+        for dt in upcoming_slots(now, self.slots, self.lookahead_hours):
+            key = slot_key(dt)
+            if key in scheduled:
+                status = scheduled[key]
+            elif key in generating:
+                status = "generating"
+            elif key in self.failed_at:
+                status = "retrying"
+            else:
+                status = "missing"
+            plan.append({"slot": key, "at": dt.timestamp(), "status": status})
+        return plan
+
+    def tick(self, now: datetime.datetime | None = None) -> None:
+        self._collect()
+        now = now or datetime.datetime.now()
+        retry_after = self.retry_minutes * 60
+        missing = [p for p in self.plan(now) if p["status"] in ("missing", "retrying")
+                   and time.time() - self.failed_at.get(p["slot"], 0) >= retry_after]
+        if self.backend == "queue":
+            # La capacidad la ponen los workers de render: se encolan todas las que faltan
+            for p in missing:
+                render_queue.enqueue(self.cfg, job_id="slot_" + p["slot"].replace(":", ""),
+                                     publish_at=p["at"], slot=p["slot"])
+                log.info("[Scheduler] Franja %s: enviada a la cola de render (%.0f min de antelación)",
+                         p["slot"], (p["at"] - time.time()) / 60)
+            return
+        if not missing or len(self.inflight) >= self.concurrency:
+            return
+        # Antes de generar más, liberar disco según la retención configurada; si falla,
+        # se genera igualmente (el disco lleno ya lo notificará el propio render)
+        try:
+            run_store.enforce_retention()
+        except Exception:
+            log.exception("[Scheduler] No se pudo aplicar la retención de ejecuciones")
+        for p in missing[: self.concurrency - len(self.inflight)]:
+            future = self.executor.submit(_generate, self.cfg.to_dict(), p["slot"])
+            self.inflight[future] = p["slot"]
+            log.info("[Scheduler] Franja %s: pregeneración lanzada (%.0f min de antelación)",
+                     p["slot"], (p["at"] - time.time()) / 60)
+
+    def _collect(self) -> None:
+        for future in [f for f in self.inflight if f.done()]:
+            key = self.inflight.pop(future)
+            at = datetime.datetime.strptime(key, "%Y-%m-%dT%H:%M").timestamp()
+            try:
+                result = future.result()
+            except Exception as e:
+                self.failed_at[key] = time.time()
+                log.error("[Scheduler] Franja %s: la pregeneración falló (%s: %s); reintento en %.0f min",
+                          key, e.__class__.__name__, e, self.retry_minutes)
+                continue
+            self.failed_at.pop(key, None)
+            try:
+                job_id = publish_spool.enqueue(result["video_path"], result["video_title"], not_before=at,
+                                               account=self.cfg.whatsapp_account,
+                                               run_dir=result["run_dir"], slot=key)
+            except Exception as e:
+                # El vídeo está hecho pero no llegó al spool: la franja se reintenta como un fallo más
+                self.failed_at[key] = time.time()
+                log.error("[Scheduler] Franja %s: no se pudo encolar %s (%s: %s); reintento en %.0f min",
+                          key, result["video_path"], e.__class__.__name__, e, self.retry_minutes)
+                try:
+                    run_store.update_run(result["run_dir"], status="failed")
+                except Exception:
+                    log.exception("[Scheduler] No se pudo marcar %s como fallida", result["run_dir"])
+                continue
+            lead = (at - time.time()) / 60
+            if lead < 0:
+                log.warning("[Scheduler] Franja %s: vídeo listo con %.0f min de retraso; se publica ya", key, -lead)
+            else:
+                log.info("[Scheduler] Franja %s: vídeo listo (trabajo %s), %.0f min antes de publicar. Tiempos: %s",
+                         key, job_id, lead, result["timings"])
+
+    def run(self, tick_interval: float = 30, publisher: bool = True) -> None:
+        """Bucle principal; con publisher=True también arranca el worker del spool en un hilo"""
+        if publisher:
+            threading.Thread(target=publish_spool.run_worker, name="spool-worker", daemon=True).start()
+        log.info("[Scheduler] Franjas %s, antelación %.1f h, render %s",
+                 [t.strftime("%H:%M") for t in self.slots], self.lookahead_hours,
+                 f"local (concurrencia {self.concurrency})" if self.backend == "local" else "en la cola compartida")
+        try:
+            while True:
+                try:
+                    self.tick()
+                except Exception:
+                    # Un fallo puntual (spool, cola compartida, disco) no debe parar el demonio
+                    log.exception("[Scheduler] Error en la iteración; se reintenta en %.0f s", tick_interval)
+                time.sleep(tick_interval)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+def from_env(cfg: JobConfig | None = None) -> SlotScheduler:
+    return SlotScheduler(
+        parse_slots(os.getenv("POST_SLOTS", "")),
+        cfg or JobConfig.from_env(),
+        lookahead_hours=float(os.getenv("PREGEN_LOOKAHEAD_HOURS", "6")),
+        concurrency=int(os.getenv("PREGEN_CONCURRENCY", "1")),
+        retry_minutes=float(os.getenv("PREGEN_RETRY_MINUTES", "10")),
+        backend=os.getenv("PREGEN_BACKEND", "local").lower(),
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pregeneración de estados para franjas programadas")
+    parser.add_argument("--plan", action="store_true", help="Muestra las próximas franjas y termina")
+    parser.add_argument("--no-publisher", action="store_true",
+                        help="No arranca el worker del spool (lo ejecuta otro proceso)")
+    args = parser.parse_args()
+
+    bootstrap()
+    scheduler = from_env()
+    if args.plan:
+        print(json.dumps(scheduler.plan(), indent=2))
+    else:
+        scheduler.run(tick_interval=float(os.getenv("PREGEN_TICK", "30")), publisher=not args.no_publisher)
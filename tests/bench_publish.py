@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# bench_publish.py
+# Mide la latencia de publish() contra la réplica local de WhatsApp Web, en headless.
+#
+#   python tests/bench_publish.py --runs 10 --upload-delay-ms 800
+#   python tests/bench_publish.py --cold          # un navegador nuevo por publicación
+#   python tests/bench_publish.py --json out.json
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("WHATSAPP_PROFILE_DIR", tempfile.mkdtemp(prefix="wa_profile_"))
+
+from utils import selenium_helper
+from whatsapp_standin import StandIn
+
+logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s – %(message)s")
+
+
+def _summary(values: list[float]) -> dict:
+    values = sorted(values)
+    return {
+        "p50": round(statistics.median(values), 3),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def run_bench(runs: int, cold: bool, **standin_config) -> dict:
+    video = os.path.join(tempfile.mkdtemp(), "status.mp4")
+    with open(video, "wb") as f:
+        f.write(b"\x00" * 1024 * 1024)
+
+    totals, steps = [], {}
+    with StandIn(**standin_config) as wa:
+        selenium_helper.WHATSAPP_URL = wa.url
+        publisher = None if cold else selenium_helper.WhatsAppPublisher().__enter__()
+        try:
+            for i in range(runs):
+                t0 = time.perf_counter()
+                if cold:
+                    timings = selenium_helper.publish(video, f"bench {i}")
+                else:
+                    timings = publisher.publish(video, f"bench {i}")
+                totals.append(time.perf_counter() - t0)
+                for name, secs in timings.items():
+                    steps.setdefault(name, []).append(secs)
+        finally:
+            if publisher:
+                publisher.close()
+        sent = len(wa.sent)
+
+    return {
+        "runs": runs,
+        "mode": "cold" if cold else "warm",
+        "published": sent,
+        "total": _summary(totals),
+        "steps": {name: _summary(vals) for name, vals in steps.items()},
+        "config": standin_config,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de publish() contra la réplica local")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--cold", action="store_true", help="Abrir un navegador nuevo por publicación")
+    parser.add_argument("--upload-delay-ms", type=int, default=300)
+    parser.add_argument("--send-delay-ms", type=int, default=300)
+    parser.add_argument("--json", help="Guardar el resultado en este fichero")
+    args = parser.parse_args()
+
+    result = run_bench(args.runs, args.cold,
+                       upload_delay_ms=args.upload_delay_ms, send_delay_ms=args.send_delay_ms)
+    print(json.dumps(result, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
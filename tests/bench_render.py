@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# bench_render.py
+# Mide tiempo y pico de memoria de las funciones del render con entradas sintéticas
+# (imágenes de ruido/degradado, audio de tono y guiones generados), sin red ni OpenAI.
+#
+#   python tests/bench_render.py                      # rejilla rápida
+#   python tests/bench_render.py --full               # más imágenes, resoluciones y guiones largos
+#   python tests/bench_render.py --only text_layers   # solo un grupo
+#   python tests/bench_render.py --save runs/bench_render.json
+#   python tests/bench_render.py --compare runs/bench_render.json --threshold 0.25
+#
+# Grupos (cada resultado es "grupo[parámetros]"):
+#   split_script       _split_script por longitud de guion y número de imágenes
+#   process_audio      process_audio + materializar la mezcla, con y sin música en bucle
+#   text_layers        el bucle de capas de texto de generate_video (_render_text_layer + _compose_image)
+#   process_image      _process_downloaded_image por tamaño de la imagen descargada
+#   generate_video     render completo; desglose por función a partir de los spans de la traza
+#                      (video.process_audio, video.normalize_image, video.text_layer, video.encode
+#                      = write_videofile)
+#
+# Memoria: peak_mb es el pico del heap de Python (tracemalloc, incluye los buffers de NumPy
+# pero no los de PIL) y peak_rss_mb el crecimiento del pico de RSS del proceso (solo Linux;
+# orientativo, depende de lo que el asignador ya tenga reservado). La memoria del proceso
+# ffmpeg no se cuenta. --compare termina con código 1 si algún tiempo o peak_mb empeora
+# más de --threshold respecto a la línea base.
+
+import os
+import sys
+import json
+import math
+import time
+import wave
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import itertools
+import statistics
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from utils import trace_helper, image_artifact
+from utils.config import JobConfig
+from utils import video_helper
+from my_agents.web_image_agent import _process_downloaded_image
+
+logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s – %(message)s")
+logging.getLogger("moviepy").setLevel(logging.ERROR)
+
+GROUPS = ("split_script", "process_audio", "text_layers", "process_image", "generate_video")
+
+GRIDS = {
+    "quick": {
+        "script_words": [60, 600],
+        "image_counts": [3, 6],
+        "resolutions": [(540, 960), (1080, 1920)],
+        "audio_seconds": [5, 30],
+        "source_sizes": [(1280, 720), (4000, 3000)],
+        "render": {"image_counts": [3], "resolutions": [(540, 960)], "audio_seconds": 4},
+    },
+    "full": {
+        "script_words": [60, 600, 6000],
+        "image_counts": [3, 6, 12],
+        "resolutions": [(540, 960), (1080, 1920), (1920, 1080)],
+        "audio_seconds": [5, 30, 120],
+        "source_sizes": [(800, 600), (1920, 1080), (4000, 3000), (8000, 6000)],
+        "render": {"image_counts": [3, 6], "resolutions": [(540, 960), (1080, 1920)], "audio_seconds": 8},
+    },
+}
+
+_WORDS = ("el la de que y en un una para con los las por como más pero sus le ya o este sí porque "
+          "esta entre cuando muy sin sobre también me hasta hay donde quien desde todo nos durante "
+          "estados unidos mercado energía noticias ciencia tecnología inteligencia artificial").split()
+
+
+# ---------------------------------------------------------------------------
+# Entradas sintéticas
+# ---------------------------------------------------------------------------
+def _script(n_words: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(_WORDS) for _ in range(n_words))
+
+def _image(size: tuple[int, int], seed: int = 0) -> Image.Image:
+    """Degradado con ruido: comprime y se redimensiona como una foto, no como un color plano"""
+    w, h = size
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:h, 0:w]
+    base = np.dstack([x * 255 // max(1, w), y * 255 // max(1, h), (x + y) * 255 // max(1, w + h)])
+    noise = rng.integers(0, 48, (h, w, 3))
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+
+def _tone(path: str, seconds: float, freq: float = 220.0, rate: int = 44100) -> str:
+    """WAV mono de 16 bits con un tono (sustituto de la voz o de la música)"""
+    t = np.arange(int(seconds * rate)) / rate
+    samples = (0.3 * np.sin(2 * math.pi * freq * t) * 32767).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Medición
+# ---------------------------------------------------------------------------
+def _rss_kb(field: str) -> int | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def _reset_peak_rss() -> int | None:
+    """Reinicia el pico de RSS del proceso (Linux) y devuelve el RSS actual en kB"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return None
+    return _rss_kb("VmRSS")
+
+def _peak_rss_delta_mb(base_kb: int | None) -> float | None:
+    """Crecimiento del pico de RSS desde _reset_peak_rss (memoria de PIL y NumPy incluida)"""
+    peak = _rss_kb("VmHWM") if base_kb is not None else None
+    return round(max(0, peak - base_kb) / 1024, 2) if peak is not None else None
+
+def _measure(fn, repeat: int = 1) -> dict:
+    """
+    Mejor tiempo de `repeat` ejecuciones, crecimiento del pico de RSS en ellas y pico de heap
+    de Python de una ejecución aparte bajo tracemalloc (que no ve los buffers internos de PIL)
+    """
+    times = []
+    base = _reset_peak_rss()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    rss = _peak_rss_delta_mb(base)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"time": round(min(times), 6), "median": round(statistics.median(times), 6),
+            "peak_mb": round(peak / (1024 * 1024), 2), "peak_rss_mb": rss}
+
+def _key(group: str, **params) -> str:
+    def fmt(v):
+        return f"{v[0]}x{v[1]}" if isinstance(v, tuple) else str(v)
+    return f"{group}[{','.join(f'{k}={fmt(v)}' for k, v in params.items())}]"
+
+
+# ---------------------------------------------------------------------------
+# Grupos
+# ---------------------------------------------------------------------------
+def bench_split_script(grid: dict, repeat: int) -> dict:
+    results = {}
+    for words, count in itertools.product(grid["script_words"], grid["image_counts"]):
+        text = _script(words)
+        results[_key("split_script", words=words, images=count)] = _measure(
+            lambda: [video_helper._split_script(text, count) for _ in range(100)], repeat)
+    return results
+
+def bench_process_audio(grid: dict, repeat: int, work: Path) -> dict:
+    """process_audio solo compone clips; la mezcla se calcula al materializarla (como al codificar)"""
+    media = work / "media"
+    media.mkdir(exist_ok=True)
+    # Música más corta que la voz para forzar las repeticiones en bucle
+    _tone(str(media / "music.wav"), 7.0, freq=330.0)
+    results = {}
+    for seconds, music in itertools.product(grid["audio_seconds"], (False, True)):
+        voice = _tone(str(work / f"voice_{seconds}.wav"), seconds)
+        cfg = JobConfig(silence_duration=1.0, background_music_file="music.wav" if music else None)
+
+        def run():
+            clip = video_helper.process_audio(voice, bg_music_dir=str(media), config=cfg)
+            for _ in clip.iter_chunks(fps=44100, chunksize=50000):  # como write_audiofile
+                pass
+        results[_key("process_audio", seconds=seconds, music=music)] = _measure(run, repeat)
+    return results
+
+def bench_text_layers(grid: dict, repeat: int) -> dict:
+    """El bucle por imagen de generate_video (modo standard): capa de texto + composición"""
+    results = {}
+    for count, canvas, overlay, translated in itertools.product(
+            grid["image_counts"], grid["resolutions"], (False, True), (False, True)):
+        images = [video_helper._fit_to_canvas(_image((1024, 576), seed=i), canvas) for i in range(count)]
+        segments = video_helper._split_script(_script(40 * count), count)
+        tsegments = video_helper._split_script(_script(40 * count, seed=1), count) if translated else None
+        font = video_helper._load_font(max(8, round(30 * min(canvas) / 1080)))
+
+        def run():
+            for i, img in enumerate(images):
+                tseg = tsegments[i] if tsegments else None
+                layer = video_helper._render_text_layer(canvas, segments[i], tseg, "Caption", font,
+                                                        overlay, translated)
+                video_helper._compose_image(img, layer)
+        results[_key("text_layers", images=count, canvas=canvas, overlay=overlay,
+                      translation=translated)] = _measure(run, repeat)
+    return results
+
+def bench_process_image(grid: dict, repeat: int, work: Path) -> dict:
+    out_dir = work / "processed"
+    out_dir.mkdir(exist_ok=True)
+    results = {}
+    for size in grid["source_sizes"]:
+        src = work / f"download_{size[0]}x{size[1]}.jpg"
+        _image(size).save(src, quality=92)
+
+        def run():
+            _process_downloaded_image(src, out_dir)
+            image_artifact.flush()  # incluye la escritura en segundo plano del JPEG
+        results[_key("process_image", source=size)] = _measure(run, repeat)
+    return results
+
+def bench_generate_video(grid: dict, work: Path, mode: str) -> dict:
+    """Render completo (una ejecución por combinación); los spans de la traza dan el desglose"""
+    render = grid["render"]
+    media = work / "media"
+    media.mkdir(exist_ok=True)
+    _tone(str(media / "music.wav"), 3.0, freq=330.0)
+    voice = _tone(str(work / "voice_render.wav"), render["audio_seconds"])
+    results = {}
+    for count, canvas, overlay, translated in itertools.product(
+            render["image_counts"], render["resolutions"], (False, True), (False, True)):
+        run_dir = work / f"render_{count}_{canvas[0]}x{canvas[1]}_{int(overlay)}{int(translated)}"
+        shutil.rmtree(run_dir, ignore_errors=True)
+        run_dir.mkdir()
+        imgs = []
+        for i in range(count):
+            imgs.append(str(run_dir / f"img_{i}.jpg"))
+            _image((1024, 576), seed=i).save(imgs[-1], quality=90)
+        cfg = JobConfig(video_canvas=canvas, use_overlay=overlay, silence_duration=0.5,
+                        background_music_file="music.wav", video_render_mode=mode)
+
+        base = _reset_peak_rss()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        cwd = os.getcwd()
+        os.chdir(work)  # process_audio busca la música en media/
+        try:
+            with trace_helper.start(str(run_dir), fmt="chrome") as trace:
+                video_helper.generate_video(voice, imgs, _script(30 * count), _script(30 * count, seed=1),
+                                            translated, "Caption", str(run_dir), config=cfg)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            os.chdir(cwd)
+            tracemalloc.stop()
+        entry = {"time": round(time.perf_counter() - t0, 4), "peak_mb": round(peak / (1024 * 1024), 2),
+                 "peak_rss_mb": _peak_rss_delta_mb(base)}
+        # Tiempo acumulado por función trazada (los spans anidados se cuentan en su propia entrada)
+        per_span = {}
+        for s in trace.spans:
+            if s["name"].startswith("video."):
+                per_span[s["name"]] = per_span.get(s["name"], 0.0) + (s["end"] - s["start"]) / 1e9
+        entry["functions"] = {name: round(secs, 4) for name, secs in sorted(per_span.items())}
+        results[_key("generate_video", mode=mode, images=count, canvas=canvas, overlay=overlay,
+                     translation=translated)] = entry
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Líneas base
+# ---------------------------------------------------------------------------
+MIN_TIME_DELTA = 0.005
+MIN_MEM_DELTA_MB = 1.0
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Devuelve las regresiones (tiempo o memoria) por encima de threshold; imprime la tabla"""
+    regressions = []
+    base = baseline.get("results", {})
+    print(f"\n{'benchmark':<90} {'base':>9} {'actual':>9} {'ratio':>6}   mem")
+    for key, cur in sorted(current["results"].items()):
+        old = base.get(key)
+        if not old:
+            print(f"{key:<90} {'—':>9} {cur['time']:>9.4f}        (nuevo)")
+            continue
+        ratio = cur["time"] / old["time"] if old["time"] else 1.0
+        mem_ratio = cur["peak_mb"] / old["peak_mb"] if old["peak_mb"] else 1.0
+        flag = ""
+        # Diferencias de menos de 5 ms o 1 MB son ruido de medida, no regresiones
+        if ratio > 1 + threshold and cur["time"] - old["time"] > MIN_TIME_DELTA:
+            flag += " TIEMPO"
+        if mem_ratio > 1 + threshold and cur["peak_mb"] - old["peak_mb"] > MIN_MEM_DELTA_MB:
+            flag += " MEMORIA"
+        if flag:
+            regressions.append(key)
+        rss = f" (RSS {old.get('peak_rss_mb')}→{cur.get('peak_rss_mb')} MB)" if cur.get("peak_rss_mb") is not None else ""
+        print(f"{key:<90} {old['time']:>9.4f} {cur['time']:>9.4f} {ratio:>6.2f}   "
+              f"{old['peak_mb']:.1f}→{cur['peak_mb']:.1f} MB{rss}{flag}")
+    return regressions
+
+def run_bench(grid_name: str, groups: list[str], repeat: int, mode: str) -> dict:
+    grid = GRIDS[grid_name]
+    work = Path(tempfile.mkdtemp(prefix="bench_render_"))
+    results = {}
+    try:
+        for group in groups:
+            t0 = time.perf_counter()
+            if group == "split_script":
+                results.update(bench_split_script(grid, repeat))
+            elif group == "process_audio":
+                results.update(bench_process_audio(grid, repeat, work))
+            elif group == "text_layers":
+                results.update(bench_text_layers(grid, repeat))
+            elif group == "process_image":
+                results.update(bench_process_image(grid, repeat, work))
+            elif group == "generate_video":
+                results.update(bench_generate_video(grid, work, mode))
+            logging.warning("%s: %.1fs", group, time.perf_counter() - t0)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return {
+        "grid": grid_name,
+        "repeat": repeat,
+        "render_mode": mode,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de las funciones del render con entradas sintéticas")
+    parser.add_argument("--full", action="store_true", help="Rejilla completa (más lenta)")
+    parser.add_argument("--only", action="append", choices=GROUPS, help="Solo estos grupos (repetible)")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por medida (se toma el mejor tiempo)")
+    parser.add_argument("--mode", default="standard", choices=("standard", "streaming", "ffmpeg"),
+                        help="VIDEO_RENDER_MODE del grupo generate_video")
+    parser.add_argument("--save", help="Guardar el resultado como línea base en este fichero")
+    parser.add_argument("--compare", help="Comparar con una línea base guardada")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Empeoramiento tolerado (0.2 = 20%%)")
+    parser.add_argument("--json", action="store_true", help="Imprimir el resultado completo en JSON")
+    args = parser.parse_args()
+
+    result = run_bench("full" if args.full else "quick", args.only or list(GROUPS), args.repeat, args.mode)
+    if args.json or not args.compare:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regresiones por encima del {args.threshold:.0%}")
+            sys.exit(1)
@@ -0,0 +1,4 @@
+# conftest.py
+# test_publish.py es un script manual contra el WhatsApp Web real (requiere argumentos
+# y un teléfono), así que pytest no debe recogerlo.
+collect_ignore = ["test_publish.py"]
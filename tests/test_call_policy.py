@@ -0,0 +1,86 @@
+# test_call_policy.py
+# Política de llamadas: plazo con reintento, cobertura tras el percentil y persistencia de latencias.
+
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import call_policy, openai_scheduler
+
+@pytest.fixture(autouse=True)
+def fresh_stats(tmp_path, monkeypatch):
+    monkeypatch.setenv("CALL_LATENCY_FILE", str(tmp_path / "latency.json"))
+    monkeypatch.setenv("CALL_BACKOFF", "0")
+    monkeypatch.setattr(call_policy, "_stats", {})
+    monkeypatch.setattr(call_policy, "_loaded", False)
+
+def test_histogram_percentile():
+    hist = call_policy.LatencyHistogram()
+    for s in [0.1] * 90 + [10.0] * 10:
+        hist.record(s)
+    assert hist.percentile(50) == 0.25
+    assert 10 <= hist.percentile(95) < 12
+
+def test_deadline_then_retry(monkeypatch):
+    monkeypatch.setenv("CALL_DEADLINES", "t=0.2")
+    monkeypatch.setenv("CALL_RETRIES", "1")
+    attempts = itertools.count()
+
+    def fn(timeout):
+        if next(attempts) == 0:
+            time.sleep(1)
+        return "ok"
+
+    assert call_policy.call(fn, stage="t", model="m") == "ok"
+    assert call_policy.summary()["t"]["timeouts"] == 1
+
+def test_queue_wait_does_not_count_against_deadline(monkeypatch):
+    # Planificador saturado: la segunda llamada espera ~1 s en la cola con un plazo de 1,5 s
+    monkeypatch.setattr(openai_scheduler, "_scheduler", openai_scheduler.OpenAIScheduler(max_concurrency=1))
+    monkeypatch.setenv("CALL_DEADLINES", "t=1.5")
+    monkeypatch.setenv("CALL_RETRIES", "1")
+    timeouts = []
+
+    def fn(timeout):
+        timeouts.append(timeout)
+        time.sleep(1)
+        return "ok"
+
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(lambda _: call_policy.call(fn, stage="t", model="m"), range(2)))
+    assert results == ["ok", "ok"]
+    # Sin reintentos espurios: cada llamada se ejecutó una vez, con el plazo completo
+    assert len(timeouts) == 2 and min(timeouts) > 1.3
+    assert call_policy.summary()["t"]["timeouts"] == 0
+
+def test_hedge_wins_over_slow_attempt(monkeypatch):
+    monkeypatch.setenv("CALL_HEDGE_STAGES", "t")
+    monkeypatch.setenv("CALL_HEDGE_MIN_SAMPLES", "5")
+    stats = call_policy._stage("t")
+    for _ in range(10):
+        stats.attempt.record(0.2)  # p95 histórico ≈ 0,25 s → cobertura al cabo de 1 s (mínimo)
+    attempts = itertools.count()
+
+    def fn(timeout):
+        if next(attempts) == 0:
+            time.sleep(3)
+            return "lento"
+        return "cobertura"
+
+    t0 = time.monotonic()
+    assert call_policy.call(fn, stage="t", model="m") == "cobertura"
+    assert time.monotonic() - t0 < 2.5
+    assert (stats.hedges, stats.hedge_wins) == (1, 1)
+
+def test_latencies_persist_between_sessions(tmp_path, monkeypatch):
+    call_policy.call(lambda timeout: "ok", stage="t", model="m")
+    call_policy.save_latencies()
+    data = json.loads((tmp_path / "latency.json").read_text())
+    assert sum(data["stages"]["t"]["call"]) == 1
+
+    monkeypatch.setattr(call_policy, "_stats", {})
+    monkeypatch.setattr(call_policy, "_loaded", False)
+    assert call_policy.summary()["t"]["samples"] == 1
@@ -0,0 +1,52 @@
+# test_config.py
+# Instantánea de configuración por trabajo: parseo desde el entorno, validación e inmutabilidad.
+
+import dataclasses
+
+import pytest
+
+from utils.config import JobConfig
+
+def test_from_env_parses_types_and_overrides():
+    cfg = JobConfig.from_env(
+        {"IMAGE_COUNT": "4", "VIDEO_CANVAS": "720x1280", "USE_OVERLAY": "true",
+         "VOICE_VOLUME": "0.8", "VIDEO_TEXT_LEN": "", "WHATSAPP_ACCOUNT": ""},
+        video_motion="kenburns",
+    )
+    assert cfg.image_count == 4
+    assert cfg.video_canvas == (720, 1280)
+    assert cfg.use_overlay is True
+    assert cfg.voice_volume == 0.8
+    assert cfg.video_text_len is None
+    assert cfg.whatsapp_account is None
+    assert cfg.video_motion == "kenburns"
+    assert JobConfig.from_dict(cfg.to_dict()) == cfg
+
+@pytest.mark.parametrize("env", [
+    {"IMAGE_COUNT": "muchas"},
+    {"IMAGE_COUNT": "0"},
+    {"VIDEO_CANVAS": "1080"},
+    {"VIDEO_MOTION": "zoom"},
+    {"IMAGE_SOURCE": "ftp"},
+    {"VIDEO_DRAFT_SCALE": "2"},
+    {"IMAGE_FETCH_OVERFETCH": "0.5"},
+    {"IMAGE_DUP_DISTANCE": "65"},
+])
+def test_invalid_values_are_rejected(env):
+    with pytest.raises(ValueError):
+        JobConfig.from_env(env)
+
+def test_config_is_immutable():
+    cfg = JobConfig()
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        cfg.image_count = 10
+    assert cfg.replace(image_count=10).image_count == 10
+    assert cfg.image_count == 3
+
+def test_renditions_parse_and_roundtrip():
+    cfg = JobConfig.from_env({"VIDEO_RENDITIONS": "1920x1080, 1080x1080"})
+    assert cfg.video_renditions == ((1920, 1080), (1080, 1080))
+    assert JobConfig.from_dict(cfg.to_dict()) == cfg
+    assert JobConfig.from_env({"VIDEO_RENDITIONS": ""}).video_renditions == ()
+    with pytest.raises(ValueError):
+        JobConfig.from_env({"VIDEO_RENDITIONS": "1920x1080,cuadrado"})
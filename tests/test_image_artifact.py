@@ -0,0 +1,65 @@
+# test_image_artifact.py
+# Entrega de imágenes en memoria: el render no relee disco y los ficheros se escriben en segundo plano.
+
+import pickle
+
+import numpy as np
+from PIL import Image
+from moviepy.editor import AudioClip
+
+from utils import image_artifact, video_helper
+from utils.video_helper import normalize_images
+
+def test_artifact_is_path_with_image_in_memory(tmp_path):
+    img = Image.new("RGB", (64, 48), "red")
+    art = image_artifact.persist(img, tmp_path / "img.jpg", format="JPEG", quality=90)
+    assert art == str(tmp_path / "img.jpg")
+    assert image_artifact.load(art) is img
+    assert image_artifact.flush() == 0
+    assert Image.open(art).size == (64, 48)
+    assert pickle.loads(pickle.dumps(art)) == art   # entre procesos viaja solo la ruta
+
+def test_raw_bytes_are_written_unchanged(tmp_path):
+    src = tmp_path / "api.png"
+    Image.new("RGB", (8, 8), "blue").save(src)
+    data = src.read_bytes()
+    art = image_artifact.persist(Image.open(src), tmp_path / "copia.png", data=data)
+    art.wait()
+    assert (tmp_path / "copia.png").read_bytes() == data
+
+def test_normalize_uses_memory_and_writes_nothing(tmp_path):
+    art = image_artifact.persist(Image.new("RGB", (400, 300), "green"), tmp_path / "a.jpg", format="JPEG")
+    art.wait()
+    (tmp_path / "a.jpg").unlink()                        # el render no necesita el fichero
+    plain = tmp_path / "b.jpg"
+    Image.new("RGB", (300, 400), "white").save(plain)
+    images = normalize_images([art, str(plain)], (90, 160), fit="contain")
+    assert [im.size for im in images] == [(90, 160), (90, 160)]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b.jpg"]
+
+def test_release_waits_for_the_write(tmp_path):
+    art = image_artifact.persist(Image.new("RGB", (64, 48), "red"), tmp_path / "img.jpg", format="JPEG")
+    art.release()
+    art.wait()
+    assert art.image is None
+    assert image_artifact.load(art).size == (64, 48)   # desde el fichero
+
+def test_streaming_render_drops_each_image_after_its_segment(tmp_path, monkeypatch):
+    arts = [image_artifact.persist(Image.new("RGB", (120, 90), color), tmp_path / f"{color}.jpg", format="JPEG")
+            for color in ("red", "green", "blue")]
+    held = []
+    encode = video_helper._encode_frames
+
+    def spy(frames, path, *args, **kwargs):
+        held.append([a.image is not None for a in arts])
+        return encode(frames, path, *args, **kwargs)
+    monkeypatch.setattr(video_helper, "_encode_frames", spy)
+    audio = AudioClip(lambda t: np.zeros((np.size(t), 2)) if np.ndim(t) else [0, 0], duration=0.5, fps=44100)
+    image_artifact.flush()
+    video_helper._render_streaming(audio, arts, ["a", "b", "c"], None, "", video_helper._load_font(10), False,
+                                   False, (64, 112), "contain", "#000000",
+                                   video_helper.RenderProfile("test", fps=12, preset="ultrafast"),
+                                   "none", 1.15, str(tmp_path))
+    # Al codificar el segmento i, las imágenes de los anteriores ya no están en memoria
+    assert held == [[True, True, True], [False, True, True], [False, False, True]]
+    assert [a.image for a in arts] == [None, None, None]
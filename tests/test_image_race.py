@@ -0,0 +1,48 @@
+# test_image_race.py
+# Carrera entre fuentes de imágenes: cobertura retardada, cancelación y fuente ganadora.
+
+import time
+
+from PIL import Image
+
+from utils import image_race
+
+def _source(tmp_path, name, delay_per_image, fail=False):
+    def fn(count, cancel, deliver):
+        if fail:
+            raise RuntimeError("sin red")
+        for i in range(count):
+            if cancel.is_set():
+                return
+            time.sleep(delay_per_image)
+            path = tmp_path / f"{name}_{i}.jpg"
+            Image.new("RGB", (8, 8)).save(path)
+            deliver(str(path))
+    return fn
+
+def test_fast_source_wins_and_hedge_never_starts(tmp_path):
+    result = image_race.race([
+        ("web", 0.0, _source(tmp_path, "web", 0.01)),
+        ("api", 5.0, _source(tmp_path, "api", 0.01)),
+    ], count=3)
+    assert result.sources == ["web"] * 3
+    assert result.winner == "web"
+    assert result.started == ["web"]
+
+def test_failed_source_starts_hedge_early(tmp_path):
+    t0 = time.monotonic()
+    result = image_race.race([
+        ("web", 0.0, _source(tmp_path, "web", 0, fail=True)),
+        ("api", 30.0, _source(tmp_path, "api", 0.01)),
+    ], count=2)
+    assert time.monotonic() - t0 < 5
+    assert result.winner == "api" and len(result.files) == 2
+
+def test_slots_fill_from_both_and_losers_are_discarded(tmp_path):
+    result = image_race.race([
+        ("web", 0.0, _source(tmp_path, "web", 0.5)),
+        ("api", 0.0, _source(tmp_path, "api", 0.3)),
+    ], count=3)
+    assert len(result.files) == 3 and set(result.sources) == {"web", "api"}
+    time.sleep(0.7)  # la fuente perdedora entrega su última imagen tarde: se borra
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(p.split("/")[-1] for p in result.files)
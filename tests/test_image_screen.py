@@ -0,0 +1,43 @@
+# test_image_screen.py
+# Cribado de imágenes descargadas: resolución, nitidez y casi-duplicados por dHash.
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from my_agents.web_image_agent import _screen_candidates
+from utils.config import JobConfig
+
+def _photo(seed: int, size=(800, 600)) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 255, (12, 16, 3), dtype=np.uint8)  # textura con bordes nítidos
+    return Image.fromarray(blocks).resize(size, Image.NEAREST)
+
+def _candidates(tmp_path) -> dict:
+    paths = {}
+    for name, img in {
+        "a": _photo(1),
+        "a_copia": _photo(1).resize((640, 480)),                  # misma foto más pequeña
+        "b_borrosa": _photo(2).filter(ImageFilter.GaussianBlur(12)),
+        "c_miniatura": _photo(3, size=(160, 120)),
+        "d": _photo(4),
+    }.items():
+        paths[name] = str(tmp_path / f"{name}.jpg")
+        img.save(paths[name], quality=90)
+    (tmp_path / "rota.jpg").write_bytes(b"no es una imagen")
+    return paths
+
+def test_rejects_duplicates_and_ranks_quality_last(tmp_path):
+    paths = _candidates(tmp_path)
+    ranked = _screen_candidates(list(paths.values()) + [str(tmp_path / "rota.jpg")], JobConfig())
+    names = [p.rsplit("/", 1)[-1][:-4] for p in ranked]
+    assert "a_copia" not in names and "rota" not in names
+    assert set(names[:2]) == {"a", "d"}                           # las que pasan los umbrales, primero
+    assert set(names[2:]) == {"b_borrosa", "c_miniatura"}         # solo como relleno
+
+def test_thresholds_come_from_the_job_config(tmp_path):
+    paths = _candidates(tmp_path)
+    # Otro trabajo del mismo proceso: acepta miniaturas y solo descarta hashes idénticos
+    cfg = JobConfig(image_min_side=100, image_dup_distance=0)
+    names = [p.rsplit("/", 1)[-1][:-4] for p in _screen_candidates(list(paths.values()), cfg)]
+    assert set(names[:4]) == {"a", "a_copia", "d", "c_miniatura"}
+    assert names[-1] == "b_borrosa"
@@ -0,0 +1,64 @@
+# test_media_library.py
+# Biblioteca local: escaneo incremental, filtros por orientación y reparto atómico entre workers.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from utils.media_library import MediaLibrary
+
+def _populate(folder, n, size=(40, 80)):
+    os.makedirs(folder, exist_ok=True)
+    for i in range(n):
+        Image.new("RGB", size, (i * 7 % 255, 0, 0)).save(os.path.join(folder, f"img{i:03d}.png"))
+
+def _claim_all(media_dir, owner):
+    lib = MediaLibrary(media_dir)
+    got = []
+    while True:
+        batch = lib.claim(3, owner)
+        if not batch:
+            return got
+        got.extend(batch)
+
+def test_scan_is_incremental(tmp_path):
+    media = str(tmp_path / "media")
+    _populate(media, 5)
+    _populate(os.path.join(media, "landscape"), 2, size=(80, 40))
+    lib = MediaLibrary(media)
+    assert lib.scan() == {"added": 7, "updated": 0, "removed": 0}
+    assert lib.scan() == {"added": 0, "updated": 0, "removed": 0}
+    os.remove(os.path.join(media, "img000.png"))
+    assert lib.scan()["removed"] == 1
+    assert lib.stats()["portrait"]["images"] == 4
+    assert all(p.endswith(".png") and "landscape" in p
+               for p in lib.claim(5, "w", orientation="landscape"))
+
+def test_user_image_with_generated_looking_name_is_indexed(tmp_path):
+    # Ningún productor usa ya media/ como staging: un nombre img_<n>_<hex>.png es del usuario
+    media = tmp_path / "media"
+    media.mkdir()
+    Image.new("RGB", (40, 80)).save(media / f"img_1700000000_{'ab' * 16}.png")
+    assert MediaLibrary(str(media)).scan()["added"] == 1
+
+def test_least_used_rotates(tmp_path):
+    media = str(tmp_path / "media")
+    _populate(media, 3)
+    lib = MediaLibrary(media)
+    lib.scan()
+    first = lib.claim(2, "a", policy="least_used")
+    for p in first:
+        lib.release(p, used=True)
+    second = lib.claim(2, "b", policy="least_used")
+    assert set(first).isdisjoint(second[:1])
+
+def test_concurrent_workers_never_share_images(tmp_path):
+    media = str(tmp_path / "media")
+    _populate(media, 40)
+    MediaLibrary(media).scan()
+    with ProcessPoolExecutor(4) as pool:
+        results = list(pool.map(_claim_all, [media] * 4, ["w0", "w1", "w2", "w3"]))
+    claimed = [p for r in results for p in r]
+    assert len(claimed) == 40
+    assert len(set(claimed)) == 40
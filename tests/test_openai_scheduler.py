@@ -0,0 +1,68 @@
+# test_openai_scheduler.py
+# Planificador de llamadas a OpenAI: prioridad por etapa, cabeceras de límites y AIMD ante 429.
+
+import os
+import threading
+import time
+
+import pytest
+
+from utils import openai_scheduler
+from utils.openai_scheduler import OpenAIScheduler, job_context, _parse_duration
+
+def test_parse_duration():
+    assert _parse_duration("6m0s") == 360
+    assert _parse_duration("20ms") == 0.02
+    assert _parse_duration("1.5") == 1.5
+    assert _parse_duration("nope") is None
+
+def test_waiting_calls_served_by_priority():
+    sched = OpenAIScheduler(max_concurrency=1)
+    first = sched.acquire("m", stage="websearch")  # ocupa la única plaza
+    order = []
+
+    def call(stage, job):
+        with job_context(job):
+            ticket = sched.acquire("m", stage=stage)
+        order.append(stage)
+        sched.release(ticket)
+
+    threads = [threading.Thread(target=call, args=(stage, f"job{i}"))
+               for i, stage in enumerate(["websearch", "script", "tts"])]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)
+    sched.release(first)
+    for t in threads:
+        t.join(5)
+    assert order == ["tts", "script", "websearch"]
+
+def test_headers_and_429_adapt_budget():
+    sched = OpenAIScheduler(max_concurrency=8, share=0.5)
+    sched.observe("m", 200, {"x-ratelimit-limit-requests": "100", "x-ratelimit-remaining-requests": "80",
+                             "x-ratelimit-limit-tokens": "10000", "x-ratelimit-remaining-tokens": "9000"})
+    stats = sched.stats()["m"]
+    assert (stats["rpm"], stats["tpm"]) == (50, 5000)
+
+    sched.observe("m", 429, {"retry-after-ms": "50"})
+    sched.observe("m", 429, {"retry-after-ms": "50"})
+    assert sched.stats()["m"]["concurrency"] == 2
+    t0 = time.monotonic()
+    sched.release(sched.acquire("m"))  # espera a que pase la pausa del 429
+    assert time.monotonic() - t0 >= 0.03
+    assert sched.stats()["m"]["concurrency"] > 2  # crecimiento aditivo tras un éxito
+
+def test_configured_limits_are_not_overridden():
+    sched = OpenAIScheduler({"m": (60, 0)})
+    sched.observe("m", 200, {"x-ratelimit-limit-requests": "5000"})
+    assert sched.stats()["m"]["rpm"] == 60
+
+def test_install_hooks_sets_share_without_touching_env(monkeypatch):
+    openai = pytest.importorskip("openai")
+    monkeypatch.setattr(openai, "http_client", None)    # install_hooks lo sustituye
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)   # sin clave no se tocan los clientes del SDK
+    monkeypatch.setattr(openai_scheduler, "_scheduler", None)
+    monkeypatch.delenv("OPENAI_BUDGET_SHARE", raising=False)
+    openai_scheduler.install_hooks(share=0.25)
+    assert openai_scheduler.get().share == 0.25
+    assert "OPENAI_BUDGET_SHARE" not in os.environ
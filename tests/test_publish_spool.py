@@ -0,0 +1,122 @@
+# test_publish_spool.py
+# Worker del spool sin navegador: reintentos (nada se repite tras pulsar Enviar) y un trabajo por cuenta.
+
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("selenium")
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from utils import publish_spool, selenium_helper
+
+@pytest.fixture(autouse=True)
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setenv("PUBLISH_SPOOL_DIR", str(tmp_path / "spool"))
+    monkeypatch.setenv("PUBLISH_BACKOFF", "0")
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "status.mp4"
+    path.write_bytes(b"\x00" * 64)
+    return str(path)
+
+def _publisher(monkeypatch, outcomes):
+    """WhatsAppPublisher sin Chrome: cada intento consume el siguiente resultado de outcomes"""
+    pub = selenium_helper.WhatsAppPublisher(max_reconnects=2)
+    pub.restarts = 0
+    monkeypatch.setattr(pub, "ensure_ready", lambda: None)
+    monkeypatch.setattr(pub, "restart", lambda: setattr(pub, "restarts", pub.restarts + 1))
+
+    def steps(driver, video_abs, caption):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    monkeypatch.setattr(selenium_helper, "_publish_steps", steps)
+    return pub
+
+def test_failure_before_send_reconnects_and_retries(monkeypatch, video):
+    pub = _publisher(monkeypatch, [TimeoutException("sin vista previa"), {"send": 0.1}])
+    assert pub.publish(video, "t") == {"send": 0.1}
+    assert pub.restarts == 1 and pub.published == 1
+
+def test_failure_after_send_is_never_repeated(monkeypatch, video):
+    outcomes = [selenium_helper.SendUnconfirmed("Enviar pulsado sin confirmación"), {"send": 0.1}]
+    pub = _publisher(monkeypatch, outcomes)
+    with pytest.raises(selenium_helper.SendUnconfirmed):
+        pub.publish(video, "t")
+    assert pub.restarts == 0 and len(outcomes) == 1
+
+class _FailingPool:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def submit(self, account, video_path, caption):
+        self.calls += 1
+        fut = Future()
+        fut.set_exception(self.error)
+        return fut
+
+    def close(self):
+        pass
+
+def test_spool_does_not_retry_unconfirmed_send(video):
+    publish_spool.enqueue(video, "t")
+    pool = _FailingPool(selenium_helper.SendUnconfirmed("Enviar pulsado sin confirmación"))
+    assert publish_spool.run_worker(once=True, poll_interval=0, pool=pool) == 0
+    assert pool.calls == 1
+    [(state, job)] = publish_spool.jobs()
+    assert state == "failed" and job["attempts"] == 1
+
+def test_spool_retries_browser_failures(video, monkeypatch):
+    monkeypatch.setenv("PUBLISH_MAX_ATTEMPTS", "3")
+    publish_spool.enqueue(video, "t")
+    pool = _FailingPool(WebDriverException("chrome cerrado"))
+    publish_spool.run_worker(once=True, poll_interval=0, pool=pool)
+    [(state, job)] = publish_spool.jobs()
+    assert pool.calls == 3 and state == "failed" and job["attempts"] == 3
+
+class _SlowPool:
+    """Dos cuentas; cada publicación tarda un poco y se anota la concurrencia por cuenta"""
+    accounts = {"a": None, "b": None}
+
+    def __init__(self):
+        self.running: dict = {}
+        self.peak: dict = {}
+        self.order: list = []
+        self.lock = threading.Lock()
+
+    def submit(self, account, video_path, caption):
+        fut = Future()
+        with self.lock:
+            self.running[account] = self.running.get(account, 0) + 1
+            self.peak[account] = max(self.peak.get(account, 0), self.running[account])
+            self.order.append(caption)
+
+        def finish():
+            time.sleep(0.1)
+            with self.lock:
+                self.running[account] -= 1
+            fut.set_result({})
+        threading.Thread(target=finish).start()
+        return fut
+
+    def close(self):
+        pass
+
+def test_one_job_per_account_and_busy_accounts_do_not_block_others(tmp_path):
+    for name, account in (("a1", "a"), ("a2", "a"), ("b1", "b")):
+        path = tmp_path / f"{name}.mp4"
+        path.write_bytes(name.encode())
+        publish_spool.enqueue(str(path), name, account=account)
+        time.sleep(0.01)  # orden de encolado estable
+    pool = _SlowPool()
+    assert publish_spool.run_worker(once=True, poll_interval=0.05, pool=pool) == 3
+    assert pool.peak == {"a": 1, "b": 1}
+    # b1 no espera detrás de a2 aunque se encoló después
+    assert pool.order[:2] == ["a1", "b1"]
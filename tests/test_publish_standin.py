@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# test_publish_standin.py
+# Ejecuta publish() en headless contra la réplica local de WhatsApp Web.
+
+import os
+import tempfile
+
+import pytest
+
+pytest.importorskip("selenium")
+
+# selenium_helper lee el perfil y la URL al importarse
+os.environ.setdefault("WHATSAPP_PROFILE_DIR", tempfile.mkdtemp(prefix="wa_profile_"))
+os.environ.setdefault("PUBLISH_STEP_TIMEOUT", "5")
+os.environ.setdefault("PUBLISH_SENT_TIMEOUT", "5")
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from utils import selenium_helper
+from whatsapp_standin import StandIn
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    with StandIn() as wa:
+        monkeypatch.setattr(selenium_helper, "WHATSAPP_URL", wa.url)
+        yield wa
+
+
+@pytest.fixture
+def publisher(standin):
+    pub = selenium_helper.WhatsAppPublisher(max_reconnects=0)
+    try:
+        pub.start()
+    except WebDriverException as e:
+        pytest.skip(f"Chrome/ChromeDriver no disponible: {e.msg}")
+    yield pub
+    pub.close()
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "status.mp4"
+    path.write_bytes(b"\x00" * 1024)
+    return str(path)
+
+
+def test_publish_records_status_and_timings(standin, publisher, video):
+    timings = publisher.publish(video, "Título de prueba")
+
+    assert standin.sent[-1]["caption"] == "Título de prueba"
+    assert standin.sent[-1]["name"] == "status.mp4"
+    assert set(timings) == {"open_status", "new_status", "select_media", "upload", "caption", "send", "confirm"}
+    # La subida espera a la barra de progreso, no a un tiempo fijo
+    assert timings["upload"] >= standin.config["upload_delay_ms"] / 1000
+
+
+def test_warm_session_publishes_several_statuses(standin, publisher, video):
+    publisher.publish_many([(video, "Uno"), (video, "Dos")])
+
+    assert [s["caption"] for s in standin.sent] == ["Uno", "Dos"]
+    assert publisher.published == 2
+
+
+def test_stalled_upload_times_out(standin, publisher, video, monkeypatch):
+    monkeypatch.setenv("PUBLISH_UPLOAD_TIMEOUT", "2")
+    standin.configure(fail_mode="upload")
+    publisher.driver.refresh()
+
+    with pytest.raises(TimeoutException):
+        publisher.publish(video, "Atascado")
+    assert standin.sent == []
+
+
+def test_emoji_caption_and_instant_confirmation(standin, publisher, video):
+    # El reloj de pendiente dura menos que un sondeo: la confirmación lo ve igualmente
+    standin.configure(send_delay_ms=0)
+    publisher.driver.refresh()
+
+    publisher.publish(video, "🚀 Título con emoji")
+    assert standin.sent[-1]["caption"] == "🚀 Título con emoji"
+
+
+def test_unconfirmed_send_is_not_repeated(standin, publisher, video):
+    standin.configure(fail_mode="send")
+    publisher.driver.refresh()
+
+    with pytest.raises(selenium_helper.SendUnconfirmed):
+        publisher.publish(video, "Sin confirmar")
+    assert publisher.published == 0
@@ -0,0 +1,211 @@
+# test_render.py
+# Render sintético en los modos standard, streaming y con caché de segmentos: tamaños, fotogramas y memoria.
+
+import re
+import subprocess
+import tracemalloc
+import wave
+
+import numpy as np
+import pytest
+from PIL import Image
+from moviepy.config import get_setting
+from moviepy.editor import AudioClip
+
+from utils import video_helper
+from utils.config import JobConfig
+
+CANVAS = (64, 112)
+FPS = 12
+PROFILE = video_helper.RenderProfile("test", fps=FPS, preset="ultrafast")
+
+def _images(tmp_path, n: int) -> list[str]:
+    """Imágenes de tamaños y proporciones distintas, como las que llegan de la web"""
+    sizes = [(300, 200), (120, 240), (257, 257), (90, 61)]
+    paths = []
+    for i in range(n):
+        path = tmp_path / f"img{i}.jpg"
+        rng = np.random.default_rng(i)
+        w, h = sizes[i % len(sizes)]
+        Image.fromarray(rng.integers(0, 255, (h, w, 3), dtype=np.uint8)).save(path)
+        paths.append(str(path))
+    return paths
+
+def _voice(path, seconds: float, rate: int = 44100) -> str:
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(np.zeros(int(seconds * rate), dtype=np.int16).tobytes())
+    return str(path)
+
+def _silence(seconds: float) -> AudioClip:
+    return AudioClip(lambda t: np.zeros((np.size(t), 2)) if np.ndim(t) else [0, 0], duration=seconds, fps=44100)
+
+def _video_info(path: str) -> tuple[tuple[int, int], int]:
+    """(ancho, alto) y número de fotogramas del flujo de vídeo"""
+    err = subprocess.run([get_setting("FFMPEG_BINARY"), "-i", path, "-map", "0:v", "-f", "null", "-"],
+                         capture_output=True, text=True).stderr
+    w, h = re.search(r"Video: .*?, (\d+)x(\d+)", err).groups()
+    frames = re.findall(r"frame=\s*(\d+)", err)
+    return (int(w), int(h)), int(frames[-1])
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("SEGMENT_CACHE_DIR", str(tmp_path / "cache"))
+
+@pytest.fixture
+def encodes(monkeypatch):
+    """Segmentos realmente codificados (los aciertos de caché no pasan por aquí)"""
+    calls = []
+    encode = video_helper._encode_frames
+
+    def counting(frames, path, *args, **kwargs):
+        calls.append(path)
+        return encode(frames, path, *args, **kwargs)
+    monkeypatch.setattr(video_helper, "_encode_frames", counting)
+    return calls
+
+@pytest.mark.parametrize("fit", ["contain", "cover"])
+def test_normalize_images_to_canvas(tmp_path, fit):
+    images = video_helper.normalize_images(_images(tmp_path, 4), CANVAS, fit=fit, workers=2)
+    assert [img.size for img in images] == [CANVAS] * 4
+    assert {img.mode for img in images} == {"RGB"}
+
+def test_segment_frame_counts_add_up():
+    counts = video_helper._segment_frame_counts(10.0, 7, 24)
+    assert sum(counts) == 240 and max(counts) - min(counts) <= 1
+    assert video_helper._segment_frame_counts(0.1, 4, 24) == [1, 1, 1, 1]  # al menos un fotograma
+
+def test_ken_burns_frames(tmp_path):
+    img = video_helper.normalize_images(_images(tmp_path, 1), CANVAS)[0]
+    layer = Image.new("RGBA", CANVAS)
+    frames = list(video_helper._image_frames(img, layer, 10, CANVAS, "kenburns", 1.15, 0))
+    assert len(frames) == 10
+    assert {f.shape for f in frames} == {(CANVAS[1], CANVAS[0], 3)}
+    assert {f.dtype for f in frames} == {np.dtype(np.uint8)}
+    assert np.abs(frames[-1].astype(int) - frames[0].astype(int)).mean() > 1
+
+@pytest.mark.parametrize("mode", ["standard", "streaming"])
+def test_generate_video_modes(tmp_path, mode):
+    cfg = JobConfig(video_canvas=CANVAS, video_render_mode=mode, silence_duration=0.25,
+                    background_music_file=None, video_motion="kenburns")
+    path = video_helper.generate_video(_voice(tmp_path / "voz.wav", 1.5), _images(tmp_path, 3),
+                                       "uno dos tres cuatro cinco seis", caption_text="Capt",
+                                       run_dir=str(tmp_path), config=cfg)
+    size, frames = _video_info(path)
+    assert size == CANVAS
+    assert frames == sum(video_helper._segment_frame_counts(2.0, 3, video_helper.FINAL_PROFILE.fps))
+
+@pytest.mark.parametrize("use_cache", [False, True])
+def test_draft_profile_and_contact_sheet(tmp_path, encodes, use_cache):
+    cfg = JobConfig(video_canvas=CANVAS, video_render_mode="streaming", silence_duration=0.25,
+                    background_music_file=None, video_draft_scale=0.5, video_draft_fps=8,
+                    video_draft_contact_sheet=True, segment_cache=use_cache)
+    voice, imgs = _voice(tmp_path / "voz.wav", 1.5), _images(tmp_path, 3)
+    runs = ["run1", "run2"] if use_cache else ["run1"]
+    for run in runs:
+        (tmp_path / run).mkdir()
+        path = video_helper.generate_video(voice, imgs, "uno dos tres cuatro cinco seis", caption_text="Capt",
+                                           run_dir=str(tmp_path / run), draft=True, config=cfg)
+        assert path.endswith("status_draft.mp4")
+        assert _video_info(path) == ((32, 56), 16)   # mitad de resolución, 8 fps durante 2 s
+        # Una miniatura por segmento (rejilla 2x2), también cuando los segmentos salen de la caché
+        with Image.open(tmp_path / run / "contact_sheet.png") as sheet:
+            assert sheet.size == (2 * (32 + 4) + 4, 2 * (56 + 4) + 4)
+            assert np.asarray(sheet)[4:4 + 56, 4:4 + 32].max() > 0
+    # Con la caché, la hoja de contactos de la segunda ejecución no recodifica ningún segmento
+    assert len(encodes) == 3
+
+def _stream(tmp_path, run: str, img_files, segments, n_seconds: float = 1.0, canvas=CANVAS,
+            caption: str = "Capt") -> str:
+    run_dir = tmp_path / run
+    run_dir.mkdir()
+    return video_helper._render_streaming(
+        _silence(n_seconds), img_files, segments, None, caption, video_helper._load_font(10), True, False,
+        canvas, "contain", "#000000", PROFILE, "none", 1.15, str(run_dir), use_cache=True)
+
+def test_segment_cache_hits_and_misses(tmp_path, encodes):
+    imgs = _images(tmp_path, 3)
+    first = _stream(tmp_path, "run1", imgs, ["a", "b", "c"])
+    assert len(encodes) == 3
+
+    # Mismo contenido en otra ejecución: todo sale de la caché
+    second = _stream(tmp_path, "run2", imgs, ["a", "b", "c"])
+    assert len(encodes) == 3
+    assert _video_info(second) == _video_info(first) == (CANVAS, FPS)
+
+    # Solo cambia el texto del segundo segmento: solo ese se recodifica
+    _stream(tmp_path, "run3", imgs, ["a", "otro", "c"])
+    assert [p.rsplit("/", 1)[1] for p in encodes[3:]] == ["seg_001.mp4"]
+
+def test_renditions_share_one_pass_and_cache_per_canvas(tmp_path, monkeypatch):
+    written = []
+    writer = video_helper.FFMPEG_VideoWriter
+
+    def counting(path, size, *args, **kwargs):
+        written.append((path.rsplit("/", 1)[1], size))
+        return writer(path, size, *args, **kwargs)
+    monkeypatch.setattr(video_helper, "FFMPEG_VideoWriter", counting)
+    fonts = {}
+    layer = video_helper._render_text_layer
+
+    def font_spy(size, seg, tseg, caption_text, font, *args):
+        fonts[size] = font.size
+        return layer(size, seg, tseg, caption_text, font, *args)
+    monkeypatch.setattr(video_helper, "_render_text_layer", font_spy)
+    imgs = _images(tmp_path, 2)
+    canvases = [CANVAS, (224, 128)]
+
+    def render(run: str, segments):
+        run_dir = tmp_path / run
+        run_dir.mkdir()
+        return video_helper._render_renditions(
+            _silence(1.0), imgs, segments, None, "Capt", 10, True, False, canvases, "contain", "#000000",
+            PROFILE, "none", 1.15, str(run_dir), use_cache=True)
+
+    paths = render("run1", ["a", "b"])
+    assert [p.rsplit("/", 1)[1] for p in paths] == ["status.mp4", "status_224x128.mp4"]
+    assert [_video_info(p) for p in paths] == [(CANVAS, FPS), ((224, 128), FPS)]
+    assert sorted(written) == [("seg_224x128_000.mp4", (224, 128)), ("seg_224x128_001.mp4", (224, 128)),
+                               ("seg_64x112_000.mp4", CANVAS), ("seg_64x112_001.mp4", CANVAS)]
+    # Subtítulos proporcionales al lado corto de cada lienzo (64 → 10 px, 128 → 20 px)
+    assert fonts == {CANVAS: 10, (224, 128): 20}
+
+    # Segunda ejecución: solo el segmento cuyo texto cambia se recodifica, en sus dos versiones
+    written.clear()
+    paths = render("run2", ["a", "otro"])
+    assert sorted(written) == [("seg_224x128_001.mp4", (224, 128)), ("seg_64x112_001.mp4", CANVAS)]
+    assert [_video_info(p) for p in paths] == [(CANVAS, FPS), ((224, 128), FPS)]
+
+def test_caption_change_reuses_every_segment(tmp_path, encodes):
+    imgs = _images(tmp_path, 3)
+    _stream(tmp_path, "run1", imgs, ["a", "b", "c"], caption="")
+    # El caption se compone en la pasada final: cambiarlo no invalida ningún segmento
+    path = _stream(tmp_path, "run2", imgs, ["a", "b", "c"], caption="Nuevo caption")
+    assert len(encodes) == 3
+    assert _video_info(path) == (CANVAS, FPS)
+    corner = _frame(path)[:24, CANVAS[0] // 2:]
+    assert corner.max() > 200   # texto blanco arriba a la derecha
+
+def _frame(path: str) -> np.ndarray:
+    """Primer fotograma RGB del vídeo"""
+    out = subprocess.run([get_setting("FFMPEG_BINARY"), "-v", "error", "-i", path, "-frames:v", "1",
+                          "-f", "rawvideo", "-pix_fmt", "rgb24", "-"], capture_output=True, check=True).stdout
+    return np.frombuffer(out, np.uint8).reshape(CANVAS[1], CANVAS[0], 3)
+
+def test_streaming_memory_does_not_grow_with_segments(tmp_path):
+    def peak(n: int) -> float:
+        imgs = _images(tmp_path, n)
+        tracemalloc.start()
+        try:
+            # Lienzo real: retener el fotograma compuesto de cada segmento sumaría ~0.7 MB por segmento
+            _stream(tmp_path, f"mem{n}", imgs, [f"s{i}" for i in range(n)], n_seconds=n * 0.25,
+                    canvas=(360, 640))
+            return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+
+    few, many = peak(2), peak(8)
+    # Cuatro veces más segmentos (y audio) y el pico apenas cambia: cada segmento se libera al codificarlo
+    assert many < few * 1.25, (few, many)
@@ -0,0 +1,95 @@
+# test_render_queue.py
+# Cola de render compartida: leases con latido, recuperación de workers caídos y entrega al spool.
+
+import datetime
+import os
+import time
+
+import pytest
+
+import scheduler
+from utils import publish_spool, render_queue
+from utils.config import JobConfig
+
+@pytest.fixture(autouse=True)
+def shared_dirs(tmp_path, monkeypatch):
+    monkeypatch.setenv("RENDER_QUEUE_DIR", str(tmp_path / "queue"))
+    monkeypatch.setenv("PUBLISH_SPOOL_DIR", str(tmp_path / "spool"))
+
+def test_expired_lease_is_requeued_and_old_worker_cannot_finish():
+    job_id = render_queue.enqueue(JobConfig(image_count=2))
+    assert render_queue.enqueue(JobConfig(), job_id=job_id) == job_id  # idempotente
+    a = render_queue.claim(lease=0.2, worker="host-a:1")
+    assert render_queue.claim(lease=0.2, worker="host-b:1") is None
+    assert render_queue.heartbeat(a, lease=0.2)
+
+    time.sleep(0.3)  # host-a deja de latir
+    assert render_queue.requeue_expired(max_attempts=3) == 1
+    b = render_queue.claim(lease=30, worker="host-b:1")
+    assert b["id"] == job_id and b["attempts"] == 1 and b["config"]["image_count"] == 2
+    assert not render_queue.heartbeat(a, lease=30)
+    assert not render_queue.complete(a, {})
+    assert render_queue.complete(b, {})
+
+def _states(job_id: str) -> list[str]:
+    return sorted(state for state, job in render_queue.jobs() if job["id"] == job_id)
+
+def test_heartbeat_racing_requeue_does_not_resurrect_lease(monkeypatch):
+    job_id = render_queue.enqueue(JobConfig())
+    a = render_queue.claim(lease=0.1, worker="host-a:1")
+    time.sleep(0.2)
+    holds = render_queue._holds
+
+    def holds_then_requeue(job, root):
+        current = holds(job, root)
+        # Otro worker recupera el trabajo justo después de la comprobación del latido
+        assert render_queue.requeue_expired(max_attempts=3, root=root) == 1
+        return current
+    monkeypatch.setattr(render_queue, "_holds", holds_then_requeue)
+    assert not render_queue.heartbeat(a, lease=30)
+    assert _states(job_id) == ["pending"]
+
+def test_heartbeat_keeps_lease_alive():
+    job_id = render_queue.enqueue(JobConfig())
+    a = render_queue.claim(lease=0.3, worker="host-a:1")
+    for _ in range(3):
+        time.sleep(0.15)
+        assert render_queue.heartbeat(a, lease=0.3)
+    # 0.45 s después de reclamarlo, el lease sigue vivo gracias a los latidos
+    assert render_queue.requeue_expired(max_attempts=3) == 0
+    assert _states(job_id) == ["leased"]
+
+def test_worker_hands_video_to_publish_spool(tmp_path):
+    at = datetime.datetime(2026, 1, 1, 9, 0).timestamp()
+    render_queue.enqueue(JobConfig(whatsapp_account="marca_a"), job_id="slot_x", publish_at=at, slot="x")
+
+    def fake_render(job):
+        video = tmp_path / "status.mp4"
+        video.write_bytes(os.urandom(64))
+        return {"video_path": str(video), "video_title": "t", "account": "marca_a"}
+
+    assert render_queue.run_worker(once=True, poll_interval=0, render=fake_render) == 1
+    [(state, job)] = publish_spool.jobs(("pending",))
+    assert (job["slot"], job["account"], job["not_before"]) == ("x", "marca_a", at)
+    assert render_queue.stats()["depth"] == {"pending": 0, "leased": 0, "done": 1, "failed": 0}
+
+def test_failed_render_retries_then_fails(monkeypatch):
+    monkeypatch.setenv("RENDER_BACKOFF", "0")
+    monkeypatch.setenv("RENDER_MAX_ATTEMPTS", "2")
+    render_queue.enqueue(JobConfig(), job_id="roto")
+
+    def broken(job):
+        raise RuntimeError("sin ffmpeg")
+
+    assert render_queue.run_worker(once=True, poll_interval=0, render=broken) == 0
+    [(state, job)] = render_queue.jobs()
+    assert state == "failed" and job["attempts"] == 2
+
+def test_scheduler_queue_backend_enqueues_each_slot_once():
+    now = datetime.datetime(2026, 1, 1, 8, 0)
+    sched = scheduler.SlotScheduler(scheduler.parse_slots("09:00,12:00"), JobConfig(),
+                                    lookahead_hours=6, backend="queue")
+    sched.tick(now)
+    sched.tick(now)
+    assert sorted(j["slot"] for _, j in render_queue.jobs(("pending",))) == ["2026-01-01T09:00", "2026-01-01T12:00"]
+    assert [p["status"] for p in sched.plan(now)] == ["generating", "generating"]
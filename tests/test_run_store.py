@@ -0,0 +1,51 @@
+# test_run_store.py
+# Almacén de ejecuciones: ids sin colisiones, deduplicación por hardlink y retención por cuota.
+
+import os
+
+from utils import run_store
+
+def _make_run(root, shared: bytes, unique_size: int, status="published"):
+    run_dir = run_store.create_run(root)
+    with open(os.path.join(run_dir, "voice.mp3"), "wb") as f:
+        f.write(shared)
+    with open(os.path.join(run_dir, "status.mp4"), "wb") as f:
+        f.write(os.urandom(unique_size))
+    run_store.finish_run(run_dir, status, dedupe=True)
+    return run_dir
+
+def test_ids_do_not_collide(tmp_path):
+    dirs = {run_store.create_run(str(tmp_path)) for _ in range(20)}
+    assert len(dirs) == 20
+    assert all(os.path.basename(d).startswith("run_") for d in dirs)
+
+def test_identical_artifacts_are_hardlinked(tmp_path):
+    root = str(tmp_path)
+    shared = os.urandom(200_000)
+    a = _make_run(root, shared, 100_000)
+    b = _make_run(root, shared, 100_000)
+    assert os.path.samefile(os.path.join(a, "voice.mp3"), os.path.join(b, "voice.mp3"))
+    # música compartida una vez + dos vídeos distintos
+    assert run_store.disk_usage(root) < 200_000 + 2 * 100_000 + 100_000
+
+def test_retention_by_quota_keeps_newest_and_active(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    monkeypatch.setenv("PUBLISH_SPOOL_DIR", str(tmp_path / "spool"))
+    shared = os.urandom(100_000)
+    old = [_make_run(root, shared, 300_000) for _ in range(3)]
+    running = run_store.create_run(root)
+    newest = _make_run(root, shared, 300_000)
+
+    removed = run_store.enforce_retention(root, max_age_days=0, max_bytes=800_000)
+
+    assert [os.path.basename(d) for d in old[:2]] == removed
+    assert os.path.isdir(old[2]) and os.path.isdir(newest) and os.path.isdir(running)
+    assert run_store.disk_usage(root) <= 800_000
+
+def test_new_run_dir_uses_runs_dir(tmp_path, monkeypatch):
+    from utils.helper import new_run_dir
+    monkeypatch.setenv("RUNS_DIR", str(tmp_path / "otro"))
+    run_dir = new_run_dir(topic="t")
+    # Mismo catálogo que ve la retención (run_store.runs_root())
+    assert os.path.dirname(run_dir) == str(tmp_path / "otro")
+    assert [r["topic"] for r in run_store.list_runs()] == ["t"]
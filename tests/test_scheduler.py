@@ -0,0 +1,71 @@
+# test_scheduler.py
+# Pregeneración por franjas: cálculo de franjas y encolado en el spool con not_before = franja.
+
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import scheduler
+from utils import publish_spool
+from utils.config import JobConfig
+
+def test_upcoming_slots_wraps_to_next_day():
+    slots = scheduler.parse_slots("21:00, 09:00,14:30")
+    now = datetime.datetime(2026, 1, 1, 20, 0)
+    got = scheduler.upcoming_slots(now, slots, lookahead_hours=14)
+    assert [scheduler.slot_key(s) for s in got] == ["2026-01-01T21:00", "2026-01-02T09:00"]
+
+def test_tick_pregenerates_each_slot_once(tmp_path, monkeypatch):
+    monkeypatch.setenv("PUBLISH_SPOOL_DIR", str(tmp_path / "spool"))
+    calls = []
+
+    def fake_generate(cfg_data, key):
+        calls.append(key)
+        video = tmp_path / f"{key.replace(':', '')}.mp4"
+        video.write_bytes(os.urandom(64))
+        return {"run_dir": str(tmp_path), "video_path": str(video), "video_title": key, "timings": {}}
+
+    monkeypatch.setattr(scheduler, "_generate", fake_generate)
+    monkeypatch.setattr(scheduler.run_store, "enforce_retention", lambda: [])
+    now = datetime.datetime(2026, 1, 1, 8, 0)
+    sched = scheduler.SlotScheduler(scheduler.parse_slots("09:00,12:00,23:00"), JobConfig(),
+                                    lookahead_hours=6, concurrency=2)
+    sched._executor = ThreadPoolExecutor(2)
+
+    sched.tick(now)
+    sched._executor.shutdown(wait=True)
+    sched._executor = ThreadPoolExecutor(2)
+    sched.tick(now)  # recoge y encola; no relanza lo que ya está en el spool
+    sched._executor.shutdown(wait=True)
+
+    assert sorted(calls) == ["2026-01-01T09:00", "2026-01-01T12:00"]
+    pending = sorted(job["slot"] for _, job in publish_spool.jobs(("pending",)))
+    assert pending == ["2026-01-01T09:00", "2026-01-01T12:00"]
+    not_before = {job["slot"]: job["not_before"] for _, job in publish_spool.jobs(("pending",))}
+    assert not_before["2026-01-01T09:00"] == datetime.datetime(2026, 1, 1, 9, 0).timestamp()
+    assert [p["status"] for p in sched.plan(now)] == ["pending", "pending"]
+
+def test_enqueue_failure_marks_slot_failed_and_keeps_going(tmp_path, monkeypatch):
+    monkeypatch.setenv("PUBLISH_SPOOL_DIR", str(tmp_path / "spool"))
+    video = tmp_path / "v.mp4"
+    video.write_bytes(os.urandom(64))
+    monkeypatch.setattr(scheduler, "_generate", lambda cfg_data, key: {
+        "run_dir": str(tmp_path), "video_path": str(video), "video_title": key, "timings": {}})
+
+    def broken(*args, **kwargs):
+        raise OSError("disco lleno")
+    monkeypatch.setattr(scheduler.publish_spool, "enqueue", broken)
+    monkeypatch.setattr(scheduler.run_store, "enforce_retention", broken)
+    monkeypatch.setattr(scheduler.run_store, "update_run", lambda *a, **k: None)
+    now = datetime.datetime(2026, 1, 1, 8, 0)
+    sched = scheduler.SlotScheduler(scheduler.parse_slots("09:00,12:00"), JobConfig(),
+                                    lookahead_hours=6, concurrency=2)
+    sched._executor = ThreadPoolExecutor(2)
+
+    sched.tick(now)  # la retención falla, pero se lanza igualmente
+    sched._executor.shutdown(wait=True)
+    sched.tick(now)  # el encolado falla en las dos franjas: ninguna detiene a la otra
+
+    assert set(sched.failed_at) == {"2026-01-01T09:00", "2026-01-01T12:00"}
+    assert not sched.inflight
+    assert [p["status"] for p in sched.plan(now)] == ["retrying", "retrying"]
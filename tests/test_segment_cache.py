@@ -0,0 +1,32 @@
+# test_segment_cache.py
+# Caché de segmentos: los aciertos se enlazan en la ejecución y una poda no los rompe.
+
+import os
+
+import pytest
+
+from utils import segment_cache
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("SEGMENT_CACHE_DIR", str(tmp_path / "cache"))
+
+def test_checked_out_segment_survives_prune(tmp_path):
+    seg = tmp_path / "seg_000.mp4"
+    seg.write_bytes(b"segmento")
+    segment_cache.store("ab" * 32, str(seg))
+
+    run_seg = tmp_path / "run" / "seg_000.mp4"
+    run_seg.parent.mkdir()
+    assert segment_cache.checkout("ab" * 32, str(run_seg)) == str(run_seg)
+    assert segment_cache.checkout("ab" * 32, str(run_seg)) == str(run_seg)  # idempotente
+    assert os.listdir(run_seg.parent) == ["seg_000.mp4"]
+
+    # Otro trabajo poda la caché entera mientras este aún no ha concatenado
+    assert segment_cache.prune(1) == 1
+    assert run_seg.read_bytes() == b"segmento"
+    assert segment_cache.checkout("ab" * 32, str(tmp_path / "run" / "otro.mp4")) is None
+
+def test_missing_key_is_a_miss(tmp_path):
+    assert segment_cache.checkout("cd" * 32, str(tmp_path / "seg.mp4")) is None
+    assert not (tmp_path / "seg.mp4").exists()
@@ -0,0 +1,63 @@
+# test_subtitles.py
+# Render con ffmpeg: subtítulos ASS (estilos, tiempos, escapes) y una codificación completa con libass.
+
+import subprocess
+
+import numpy as np
+import pytest
+from PIL import Image
+from moviepy.config import get_setting
+from moviepy.editor import AudioClip
+
+from utils import subtitle_helper
+from utils.video_helper import FINAL_PROFILE, _load_font, _render_ffmpeg
+
+def _events(ass: str) -> list[list[str]]:
+    return [line.split(",", 9) for line in ass.splitlines() if line.startswith("Dialogue:")]
+
+def test_ass_styles_and_timing():
+    cues = [(0.0, 1.5, "hola {mundo}", "hello"), (1.5, 3.0, "adiós", "bye")]
+    ass = subtitle_helper.build_ass((360, 640), cues, "Capt", 3.0, _load_font(20),
+                                    use_overlay=True, hubo_traduccion=True)
+    assert "PlayResX: 360" in ass and "PlayResY: 640" in ass
+    events = _events(ass)
+    assert [(e[1], e[2], e[3]) for e in events] == [
+        ("0:00:00.00", "0:00:01.50", "Original"), ("0:00:00.00", "0:00:01.50", "Translated"),
+        ("0:00:01.50", "0:00:03.00", "Original"), ("0:00:01.50", "0:00:03.00", "Translated"),
+        ("0:00:00.00", "0:00:03.00", "Caption"),
+    ]
+    assert events[0][9] == "hola (mundo)"   # las llaves serían órdenes de ASS
+    # Caja semitransparente con overlay; traducción en verde claro
+    assert "&H00C8FFC8" in ass and ",3,10,0,1," in ass
+
+def test_translation_hidden_without_flag_and_long_lines_wrapped():
+    ass = subtitle_helper.build_ass((360, 640), [(0, 2, "palabra " * 12, "word")], None, 2.0,
+                                    _load_font(20), use_overlay=False, hubo_traduccion=False)
+    events = _events(ass)
+    assert [e[3] for e in events] == ["Original"]
+    assert "\\N" in events[0][9]
+
+def _has_libass() -> bool:
+    try:
+        out = subprocess.run([get_setting("FFMPEG_BINARY"), "-hide_banner", "-filters"],
+                             capture_output=True, text=True).stdout
+    except OSError:
+        return False
+    return " ass " in out
+
+@pytest.mark.skipif(not _has_libass(), reason="ffmpeg sin libass")
+@pytest.mark.parametrize("motion", ["none", "kenburns"])
+def test_ffmpeg_render_single_encode(tmp_path, motion):
+    imgs = []
+    for i, color in enumerate(("red", "blue")):
+        imgs.append(str(tmp_path / f"img{i}.jpg"))
+        Image.new("RGB", (300, 200), color).save(imgs[-1])
+    audio = AudioClip(lambda t: np.zeros((np.size(t), 2)) if np.ndim(t) else [0, 0], duration=1.0, fps=44100)
+    paths = _render_ffmpeg(audio, imgs, ["uno", "dos"], ["one", "two"], "Capt", 16, True, True,
+                           [(160, 240), (240, 160)], "contain", "#000000", FINAL_PROFILE, motion, 1.15,
+                           str(tmp_path), soft_subtitles=True)
+    assert [p.rsplit("/", 1)[1] for p in paths] == ["status.mp4", "status_240x160.mp4"]
+    info = subprocess.run([get_setting("FFMPEG_BINARY"), "-i", paths[0], "-map", "0:v", "-f", "null", "-"],
+                          capture_output=True, text=True).stderr
+    assert "160x240" in info and "mov_text" in info
+    assert "frame=   24" in info
@@ -0,0 +1,46 @@
+# test_trace_helper.py
+# Spans de una ejecución: anidamiento, propagación a hilos, formatos de exportación y perfilado.
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import trace_helper
+
+def test_span_outside_trace_is_noop():
+    with trace_helper.span("suelto", a=1) as attrs:
+        attrs["b"] = 2
+    assert trace_helper.current() is None
+
+def test_chrome_trace_nesting_and_threads(tmp_path):
+    with trace_helper.start(str(tmp_path), fmt="chrome") as trace:
+        with trace_helper.span("video"):
+            with ThreadPoolExecutor(2) as pool:
+                list(pool.map(trace_helper.bind(trace_helper.traced("video.normalize_image")(abs)), [1, -2]))
+    spans = {s["name"]: s for s in trace.spans}
+    assert spans["video"]["parent"] == spans["run"]["id"]
+    assert spans["video.normalize_image"]["parent"] == spans["video"]["id"]
+
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    complete = [e for e in events if e["ph"] == "X"]
+    assert sorted(e["name"] for e in complete) == ["run", "video", "video.normalize_image", "video.normalize_image"]
+
+def test_otlp_export_marks_errors(tmp_path):
+    with pytest.raises(RuntimeError):
+        with trace_helper.start(str(tmp_path), fmt="otlp"):
+            with trace_helper.span("publish.send", attempt=1):
+                raise RuntimeError("sin red")
+    data = json.loads((tmp_path / "trace.otlp.json").read_text())
+    spans = {s["name"]: s for s in data["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+    assert spans["publish.send"]["status"]["code"] == 2
+    assert spans["publish.send"]["parentSpanId"] == spans["run"]["spanId"]
+    assert {"key": "attempt", "value": {"intValue": "1"}} in spans["publish.send"]["attributes"]
+
+def test_profile_stage_capture(tmp_path, monkeypatch):
+    monkeypatch.setenv("TRACE_PROFILE_STAGE", "video.process_audio")
+    with trace_helper.start(str(tmp_path)):
+        with trace_helper.span("video.process_audio"):
+            sum(i * i for i in range(10000))
+    assert (tmp_path / "profile_video_process_audio.prof").exists()
+    assert "cumulative" in (tmp_path / "profile_video_process_audio.txt").read_text()
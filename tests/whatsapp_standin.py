@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# whatsapp_standin.py
+# Réplica local mínima de WhatsApp Web para probar y medir publish() sin teléfono.
+# Reproduce los selectores de utils.selenium_helper.SELECTORS, con retardos de subida
+# configurables e inyección de fallos.
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONFIG = {
+    "logged_in": True,        # False → el botón Chats nunca aparece seleccionado
+    "upload_delay_ms": 300,   # tiempo con la barra de progreso visible tras elegir el fichero
+    "send_delay_ms": 300,     # tiempo con el estado pendiente (icono de reloj) tras enviar
+    "fail_mode": None,        # None, "upload" (subida atascada), "preview" (sin vídeo), "send" (Enviar no responde)
+    "fail_rate": 1.0,         # probabilidad de aplicar fail_mode en cada publicación
+}
+
+PAGE = """<!doctype html>
+<html lang="es">
+<head><meta charset="utf-8"><title>WhatsApp (stand-in)</title>
+<style>[hidden]{display:none !important} body{font-family:sans-serif}</style>
+</head>
+<body>
+<nav>
+  <button aria-label="Chats" id="nav-chats" data-navbar-item-selected="__LOGGED_IN__">Chats</button>
+  <button aria-label="Estados" id="nav-status" data-navbar-item-selected="false">Estados</button>
+</nav>
+<section id="status-panel" hidden>
+  <button aria-label="Add Status" id="add-status">+</button>
+  <ul id="dropdown" hidden>
+    <li data-animate-dropdown-item><span data-icon="media-refreshed">Fotos y videos</span></li>
+  </ul>
+  <input type="file" id="file" accept="video/*,image/*" style="display:none">
+  <ul id="status-list"></ul>
+</section>
+<div id="editor" hidden>
+  <div role="progressbar" id="progress" hidden>Subiendo…</div>
+  <div id="preview"></div>
+  <div contenteditable="true" aria-label="Añade un comentario" id="caption"></div>
+  <div role="button" aria-label="Enviar" aria-disabled="true" id="send">Enviar</div>
+</div>
+<script>
+const CFG = __CONFIG__;
+const $ = (id) => document.getElementById(id);
+const failing = CFG.fail_mode && Math.random() < CFG.fail_rate ? CFG.fail_mode : null;
+let upload = null;
+
+$("nav-status").onclick = () => {
+  $("status-panel").hidden = false;
+  $("nav-status").dataset.navbarItemSelected = "true";
+  $("nav-chats").dataset.navbarItemSelected = "false";
+};
+$("nav-chats").onclick = () => {
+  $("status-panel").hidden = true;
+  $("nav-status").dataset.navbarItemSelected = "false";
+  $("nav-chats").dataset.navbarItemSelected = "true";
+};
+$("add-status").onclick = () => { $("dropdown").hidden = false; };
+$("dropdown").onclick = () => { $("dropdown").hidden = true; };
+
+$("file").onchange = () => {
+  const f = $("file").files[0];
+  upload = {name: f.name, size: f.size, t0: performance.now()};
+  $("preview").innerHTML = "";
+  $("caption").textContent = "";
+  $("send").setAttribute("aria-disabled", "true");
+  $("editor").hidden = false;
+  $("progress").hidden = false;
+  if (failing === "upload") return;
+  setTimeout(() => {
+    $("progress").hidden = true;
+    if (failing === "preview") return;
+    const v = document.createElement("video");
+    // El navegador de pruebas puede no decodificar H.264: se simula el vídeo listo
+    Object.defineProperty(v, "readyState", {get: () => 4});
+    $("preview").appendChild(v);
+    $("send").setAttribute("aria-disabled", "false");
+  }, CFG.upload_delay_ms);
+};
+
+$("send").onclick = () => {
+  if ($("send").getAttribute("aria-disabled") === "true" || failing === "send") return;
+  const caption = $("caption").textContent;
+  const item = document.createElement("li");
+  item.innerHTML = '<span data-icon="msg-time"></span>';
+  item.appendChild(document.createTextNode(caption));
+  $("status-list").appendChild(item);
+  $("editor").hidden = true;
+  const sent = {caption: caption, name: upload.name, size: upload.size};
+  setTimeout(() => {
+    item.querySelector("span").dataset.icon = "status-check";
+    fetch("/api/sent", {method: "POST", body: JSON.stringify(sent)});
+  }, CFG.send_delay_ms);
+};
+</script>
+</body>
+</html>
+"""
+
+class StandIn:
+    """
+    Servidor HTTP local con la réplica de WhatsApp Web.
+
+    Uso:
+        with StandIn(upload_delay_ms=500) as wa:
+            os.environ["WHATSAPP_URL"] = wa.url
+            ...
+            assert wa.sent[-1]["caption"] == "Título"
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **config):
+        self.config = {**DEFAULT_CONFIG, **config}
+        self.sent: list[dict] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def configure(self, **config) -> None:
+        """Cambia la configuración; se aplica en la siguiente carga de la página"""
+        self.config.update(config)
+
+    def start(self) -> "StandIn":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _page(self) -> bytes:
+        html = PAGE.replace("__CONFIG__", json.dumps(self.config))
+        html = html.replace("__LOGGED_IN__", "true" if self.config["logged_in"] else "false")
+        return html.encode("utf-8")
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code: int, body: bytes, ctype: str) -> None:
+                self.send_response(code)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith("/api/sent"):
+                    with standin._lock:
+                        body = json.dumps(standin.sent).encode("utf-8")
+                    self._reply(200, body, "application/json")
+                else:
+                    self._reply(200, standin._page(), "text/html; charset=utf-8")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                data = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.startswith("/api/sent"):
+                    with standin._lock:
+                        standin.sent.append(data)
+                elif self.path.startswith("/api/config"):
+                    standin.configure(**data)
+                self._reply(204, b"", "text/plain")
+
+        return Handler
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Réplica local de WhatsApp Web")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--upload-delay-ms", type=int, default=DEFAULT_CONFIG["upload_delay_ms"])
+    parser.add_argument("--fail-mode", choices=["upload", "preview", "send"], default=None)
+    args = parser.parse_args()
+
+    with StandIn(port=args.port, upload_delay_ms=args.upload_delay_ms, fail_mode=args.fail_mode) as wa:
+        print(f"Stand-in en {wa.url} (Ctrl+C para salir)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
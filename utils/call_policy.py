@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Política común de las llamadas a OpenAI: plazo por etapa, reintentos y peticiones de cobertura.
+
+    result = call_policy.run_agent(agent, prompt, stage="script", tokens=estimate_tokens(prompt))
+    data = call_policy.call(lambda timeout: openai.images.generate(..., timeout=timeout),
+                            stage="image", model="gpt-image-1")
+
+- Plazo (CALL_DEADLINES, "etapa=segundos,..."): un intento que lo supera se abandona. Las
+  llamadas del Agents SDK se cancelan de verdad; las síncronas reciben el plazo como timeout.
+- Reintentos (CALL_RETRIES) con backoff exponencial y jitter completo ante plazos vencidos,
+  errores de conexión, 5xx y 429 (en los 429 la pausa la decide utils.openai_scheduler).
+- Cobertura (hedging, CALL_HEDGE_STAGES): si un intento tarda más que el percentil
+  CALL_HEDGE_PERCENTILE de su etapa, se lanza un duplicado y se usa el primero que acabe.
+  El duplicado solo sale si sobra presupuesto en el planificador (try_acquire) y como mucho
+  en CALL_HEDGE_MAX_RATIO de las llamadas.
+
+Los histogramas de latencia por etapa (intento y llamada completa) se guardan en
+CALL_LATENCY_FILE al terminar cada trabajo, así los percentiles sobreviven entre ejecuciones:
+
+    python -m utils.call_policy     # p50/p95/p99 por etapa y coberturas lanzadas/ganadas
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+
+from utils import openai_scheduler, trace_helper
+
+log = logging.getLogger(__name__)
+
+DEFAULT_DEADLINES = {
+    "websearch": 180.0,
+    "script": 90.0,
+    "transform": 90.0,
+    "langcheck": 90.0,
+    "title": 45.0,
+    "image_prompt": 60.0,
+    "image": 180.0,
+    "tts": 120.0,
+}
+DEFAULT_DEADLINE = 120.0
+# Solo etapas de texto por defecto: duplicar una imagen o una locución duplica un coste alto
+DEFAULT_HEDGE_STAGES = "websearch,script,transform,langcheck,title,image_prompt"
+
+class CallTimeout(TimeoutError):
+    """Ningún intento terminó dentro del plazo de la etapa"""
+
+@dataclass(frozen=True)
+class StagePolicy:
+    deadline: float
+    retries: int
+    hedge: bool
+    backoff: float
+    max_backoff: float
+
+def _parse_map(value: str) -> dict:
+    result = {}
+    for item in value.split(","):
+        name, sep, num = item.partition("=")
+        if sep:
+            result[name.strip()] = float(num)
+    return result
+
+def policy_for(stage: str) -> StagePolicy:
+    deadlines = {**DEFAULT_DEADLINES, **_parse_map(os.getenv("CALL_DEADLINES", ""))}
+    hedge_stages = {s.strip() for s in os.getenv("CALL_HEDGE_STAGES", DEFAULT_HEDGE_STAGES).split(",")}
+    return StagePolicy(
+        deadline=deadlines.get(stage, DEFAULT_DEADLINE),
+        retries=int(os.getenv("CALL_RETRIES", "2")),
+        hedge=stage in hedge_stages,
+        backoff=float(os.getenv("CALL_BACKOFF", "1")),
+        max_backoff=float(os.getenv("CALL_MAX_BACKOFF", "30")),
+    )
+
+# ---------------------------------------------------------------------------
+# Histogramas de latencia
+# ---------------------------------------------------------------------------
+# Cubetas logarítmicas (factor √2) de 0,25 s a ~1000 s; la última recoge el resto
+BOUNDS = [round(0.25 * 2 ** (i / 2), 3) for i in range(25)]
+
+class LatencyHistogram:
+    def __init__(self, counts: list | None = None):
+        self.counts = list(counts) if counts else [0] * (len(BOUNDS) + 1)
+
+    def record(self, seconds: float) -> None:
+        for i, bound in enumerate(BOUNDS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def percentile(self, p: float) -> float | None:
+        """Límite superior de la cubeta que contiene el percentil p (0-100)"""
+        total = self.count
+        if not total:
+            return None
+        rank, seen = total * p / 100, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BOUNDS[min(i, len(BOUNDS) - 1)]
+        return BOUNDS[-1]
+
+    def add(self, other: "LatencyHistogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+
+    def decay(self, max_count: int) -> None:
+        """Reduce a la mitad mientras supere max_count: la historia reciente pesa más"""
+        while self.count > max_count:
+            self.counts = [n // 2 for n in self.counts]
+
+class _StageStats:
+    def __init__(self):
+        self.attempt = LatencyHistogram()   # histórico + sesión
+        self.call = LatencyHistogram()
+        self.new_attempt = LatencyHistogram()  # solo sesión: lo que falta guardar
+        self.new_call = LatencyHistogram()
+        self.calls = self.hedges = self.hedge_wins = self.timeouts = self.retries = 0
+
+_stats: dict[str, _StageStats] = {}
+_stats_lock = threading.Lock()
+_loaded = False
+
+def _latency_file() -> str:
+    return os.getenv("CALL_LATENCY_FILE", os.path.join("runs", "call_latency.json"))
+
+def _load() -> None:
+    """Histórico de latencias del fichero (una vez por proceso; llamar con _stats_lock)"""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    for name, data in _read_file().items():
+        st = _stats.setdefault(name, _StageStats())
+        st.attempt.add(LatencyHistogram(data.get("attempt")))
+        st.call.add(LatencyHistogram(data.get("call")))
+
+def _stage(stage: str) -> _StageStats:
+    with _stats_lock:
+        _load()
+        return _stats.setdefault(stage, _StageStats())
+
+def _read_file() -> dict:
+    try:
+        with open(_latency_file(), encoding="utf-8") as f:
+            data = json.load(f)
+        # Cubetas distintas (otra versión): el histórico se descarta
+        return data.get("stages", {}) if data.get("bounds") == BOUNDS else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_latencies() -> None:
+    """Suma al fichero las latencias de esta sesión (otros procesos pueden haber escrito entretanto)"""
+    max_count = int(os.getenv("CALL_LATENCY_MAX_SAMPLES", "2000"))
+    with _stats_lock:
+        data = _read_file()
+        for name, st in _stats.items():
+            if not st.new_attempt.count and not st.new_call.count:
+                continue
+            entry = data.setdefault(name, {})
+            for key, new in (("attempt", st.new_attempt), ("call", st.new_call)):
+                hist = LatencyHistogram(entry.get(key))
+                hist.add(new)
+                hist.decay(max_count)
+                entry[key] = hist.counts
+            st.new_attempt, st.new_call = LatencyHistogram(), LatencyHistogram()
+        path = _latency_file()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"bounds": BOUNDS, "stages": data}, f)
+        os.replace(tmp, path)
+
+def summary() -> dict:
+    """p50/p95/p99 por etapa (intento y llamada completa) y contadores de la sesión"""
+    with _stats_lock:
+        _load()
+        return {
+            name: {
+                "attempt_p50": st.attempt.percentile(50), "attempt_p95": st.attempt.percentile(95),
+                "call_p50": st.call.percentile(50), "call_p95": st.call.percentile(95),
+                "call_p99": st.call.percentile(99), "samples": st.call.count,
+                "calls": st.calls, "retries": st.retries, "timeouts": st.timeouts,
+                "hedges": st.hedges, "hedge_wins": st.hedge_wins,
+            }
+            for name, st in sorted(_stats.items())
+        }
+
+def _hedge_delay(st: _StageStats) -> float | None:
+    if st.attempt.count < int(os.getenv("CALL_HEDGE_MIN_SAMPLES", "20")):
+        return None  # sin historia suficiente no hay percentil fiable
+    if st.hedges >= float(os.getenv("CALL_HEDGE_MAX_RATIO", "0.1")) * max(1, st.calls):
+        return None
+    return max(1.0, st.attempt.percentile(float(os.getenv("CALL_HEDGE_PERCENTILE", "95"))))
+
+# ---------------------------------------------------------------------------
+# Ejecución
+# ---------------------------------------------------------------------------
+_loop = None
+_executor = None
+_exec_lock = threading.Lock()
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """Bucle asyncio propio en un hilo: el cliente async del Agents SDK se reutiliza entre llamadas"""
+    global _loop
+    with _exec_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="openai-calls", daemon=True).start()
+        return _loop
+
+def _thread_pool() -> ThreadPoolExecutor:
+    global _executor
+    with _exec_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=int(os.getenv("CALL_MAX_THREADS", "16")),
+                                           thread_name_prefix="openai-call")
+        return _executor
+
+def _retryable(exc: BaseException) -> bool:
+    import openai
+    return isinstance(exc, (TimeoutError, asyncio.TimeoutError, openai.APITimeoutError,
+                            openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+
+def _launch(fn, is_async: bool, stage: str, model: str, tokens: int, timeout: float, blocking: bool):
+    """
+    Lanza un intento con su reserva del planificador; devuelve un Future (None si no hay presupuesto).
+
+    El plazo del intento (timeout) cuenta desde que el planificador concede la reserva: la espera
+    en su cola no es tiempo de OpenAI. fn recibe lo que quede de ese plazo cuando empieza de verdad
+    (el hilo o el bucle pueden tardar en tomarlo).
+    """
+    import openai
+
+    sched = openai_scheduler.get()
+    trace_state = trace_helper.current()
+    queued_ns = time.time_ns()
+    ticket = sched.acquire(model, tokens, stage) if blocking else sched.try_acquire(model, tokens, stage)
+    if ticket is None:
+        return None
+    st = _stage(stage)
+    t0 = time.monotonic()
+    start_ns = time.time_ns()
+    deadline = t0 + timeout
+
+    def remaining() -> float:
+        return max(0.0, deadline - time.monotonic())
+
+    if is_async:
+        async def run_async():
+            return await fn(remaining())
+        future = asyncio.run_coroutine_threadsafe(run_async(), _event_loop())
+    else:
+        future = _thread_pool().submit(lambda: fn(remaining()))
+
+    def done(f):
+        if trace_state is not None:
+            # Intentos concurrentes (cobertura) en su propia pista de la traza
+            exc = None if f.cancelled() else f.exception()
+            trace_state[0].record(f"openai.{stage}.attempt", start_ns, time.time_ns(), parent=trace_state[1],
+                                  lane=f"openai.{stage}",
+                                  attrs={"model": model, "hedge": not blocking, "cancelled": f.cancelled(),
+                                         "queued_ms": round((start_ns - queued_ns) / 1e6, 1)},
+                                  error=f"{exc.__class__.__name__}: {exc}" if exc else None)
+        # La reserva se libera cuando el intento termina de verdad, aunque ya se haya abandonado
+        if f.cancelled():
+            sched.release(ticket)
+            return
+        exc = f.exception()
+        if exc is None:
+            with _stats_lock:
+                st.attempt.record(time.monotonic() - t0)
+                st.new_attempt.record(time.monotonic() - t0)
+            sched.release(ticket, used_tokens=openai_scheduler._usage_tokens(f.result()))
+        elif isinstance(exc, openai.RateLimitError):
+            headers = getattr(getattr(exc, "response", None), "headers", {}) or {}
+            sched.release(ticket, rate_limited=True, retry_after=openai_scheduler._retry_after(headers))
+        else:
+            sched.release(ticket)
+
+    future.add_done_callback(done)
+    return future
+
+def _attempt(fn, is_async: bool, stage: str, model: str, tokens: int, policy: StagePolicy):
+    st = _stage(stage)
+    hedge_after = _hedge_delay(st) if policy.hedge else None
+    primary = _launch(fn, is_async, stage, model, tokens, policy.deadline, blocking=True)
+    # El reloj empieza cuando el planificador despacha el intento: si contara la cola, una llamada
+    # que esperó vencería nada más salir y se reintentaría con la primera aún en curso (y cobrada)
+    start = time.monotonic()
+    deadline = start + policy.deadline
+    pending, error = {primary}, None
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                raise CallTimeout(f"{stage}: sin respuesta en {policy.deadline:g}s")
+            timeout = deadline - now
+            if hedge_after is not None:
+                timeout = min(timeout, max(0.0, start + hedge_after - now))
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    if f is not primary:
+                        st.hedge_wins += 1
+                    return f.result()
+                error = f.exception()
+            if not pending:
+                raise error
+            if hedge_after is not None and time.monotonic() - start >= hedge_after:
+                hedge_after = None
+                hedge = _launch(fn, is_async, stage, model, tokens, deadline - time.monotonic(), blocking=False)
+                if hedge is not None:
+                    st.hedges += 1
+                    pending.add(hedge)
+                    log.info("[CallPolicy] %s: cobertura lanzada tras %.1fs", stage, time.monotonic() - start)
+    finally:
+        for f in pending:
+            f.cancel()
+
+def call(fn, stage: str, model: str, tokens: int | None = None, is_async: bool = False):
+    """
+    Ejecuta fn(timeout) con la política de la etapa.
+
+    Args:
+        fn: función (o corrutina si is_async) que recibe el tiempo máximo del intento en segundos
+        stage: etapa (clave de CALL_DEADLINES, prioridad en openai_scheduler)
+        model: modelo para los presupuestos del planificador
+        tokens: estimación de tokens de la llamada
+    """
+    tokens = tokens if tokens is not None else openai_scheduler.estimate_tokens()
+    with trace_helper.span(f"openai.{stage}", model=model, tokens=tokens) as attrs:
+        return _call(fn, stage, model, tokens, is_async, attrs)
+
+def _call(fn, stage: str, model: str, tokens: int, is_async: bool, attrs: dict):
+    policy = policy_for(stage)
+    st = _stage(stage)
+    t0 = time.monotonic()
+    for attempt in range(policy.retries + 1):
+        attrs["attempts"] = attempt + 1
+        try:
+            result = _attempt(fn, is_async, stage, model, tokens, policy)
+        except Exception as e:
+            if isinstance(e, CallTimeout):
+                st.timeouts += 1
+            if attempt == policy.retries or not _retryable(e):
+                raise
+            st.retries += 1
+            import openai
+            # Los 429 ya pausan el modelo en el planificador; el resto espera con jitter completo
+            delay = 0.0 if isinstance(e, openai.RateLimitError) else \
+                random.uniform(0, min(policy.max_backoff, policy.backoff * 2 ** attempt))
+            log.warning("[CallPolicy] %s/%s: %s (%s); reintento %d/%d en %.1fs", stage, model,
+                        e.__class__.__name__, e, attempt + 1, policy.retries, delay)
+            time.sleep(delay)
+            continue
+        elapsed = time.monotonic() - t0
+        with _stats_lock:
+            st.calls += 1
+            st.call.record(elapsed)
+            st.new_call.record(elapsed)
+        return result
+
+def run_agent(agent, input, stage: str, tokens: int | None = None):
+    """Runner.run del Agents SDK con la política de la etapa (cancelable al vencer el plazo)"""
+    from agents import Runner
+
+    async def attempt(timeout):
+        return await asyncio.wait_for(Runner.run(agent, input), timeout)
+
+    return call(attempt, stage=stage, model=str(agent.model or "default"), tokens=tokens, is_async=True)
+
+if __name__ == "__main__":
+    from utils.helper import bootstrap
+
+    bootstrap()
+    print(json.dumps(summary(), indent=2))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Configuración inmutable de un trabajo (un estado de WhatsApp).
+
+JobConfig se crea una sola vez por trabajo, normalmente con JobConfig.from_env(), y se
+pasa explícitamente a los agentes y helpers. Así dos trabajos con ajustes distintos
+pueden ejecutarse a la vez en el mismo proceso sin pisarse variables de entorno.
+
+Cada campo se corresponde con la variable de entorno del mismo nombre en mayúsculas
+(p. ej. image_count ← IMAGE_COUNT). Los ajustes del host (perfiles de Chrome, timeouts
+de publicación, directorios del spool y de la caché) siguen leyéndose del entorno.
+"""
+import os
+import re
+import dataclasses
+from dataclasses import dataclass
+
+IMAGE_SOURCES = ("api", "web", "local", "race")
+IMAGE_QUALITIES = ("low", "medium", "high", "auto")
+CANVAS_FITS = ("contain", "cover")
+MOTIONS = ("none", "kenburns")
+RENDER_MODES = ("standard", "streaming", "ffmpeg")
+PUBLISH_MODES = ("direct", "spool")
+MEDIA_POLICIES = ("alphabetical", "least_used", "random")
+MEDIA_ORIENTATIONS = ("any", "portrait", "landscape", "square")
+
+# Campos opcionales (None por defecto) que no son texto
+_OPTIONAL_CASTS = {"video_text_len": int}
+
+@dataclass(frozen=True)
+class JobConfig:
+    """Ajustes de un trabajo; validados al crearse y de solo lectura"""
+    # --- Guion ---
+    web_search_topic: str | None = None
+    web_search_model: str | None = None
+    script_topic: str | None = None
+    script_model: str | None = None
+    video_text_len: int | None = None
+    title_model: str | None = None
+    script_transform_enabled: bool = False
+    script_transform_model: str | None = None
+    script_transform_instruction: str = ""
+    use_script_file: bool = False
+    use_caption_file: bool = False
+    caption_text: str | None = None
+
+    # --- Audio ---
+    use_custom_audio: bool = False
+    custom_audio_file: str = "input.mp3"
+    tts_model: str | None = None
+    tts_voice: str | None = None
+    tts_tone: str | None = None
+    voice_volume: float = 1.0
+    music_volume: float = 1.2
+    silence_duration: float = 3.0
+    background_music_file: str | None = None
+
+    # --- Imágenes ---
+    image_source: str = "api"
+    image_count: int = 3
+    image_gen_model: str | None = None
+    image_style: str = ""
+    image_quality: str = "medium"
+    keywork_image_search: str | None = None
+    # IMAGE_SOURCE=race: segundos antes de lanzar la generación por API como cobertura de la web
+    image_race_hedge: float = 4.0
+    # IMAGE_SOURCE=web/race: cribado de las candidatas de Bing (web_image_agent._screen_candidates)
+    image_fetch_overfetch: float = 2.0
+    image_min_side: int = 400
+    image_min_sharpness: float = 40.0
+    image_dup_distance: int = 10
+    media_library_policy: str = "alphabetical"
+    media_library_orientation: str = "any"
+    media_library_consume: bool = True
+
+    # --- Vídeo ---
+    video_canvas: tuple[int, int] = (1080, 1920)
+    # Versiones adicionales del mismo vídeo (p. ej. 16:9 y 1:1) renderizadas en la misma pasada
+    video_renditions: tuple[tuple[int, int], ...] = ()
+    video_canvas_fit: str = "contain"
+    background_color: str = "#000000"
+    subtitle_font_size: int = 30
+    use_overlay: bool = False
+    video_motion: str = "none"
+    video_motion_zoom: float = 1.15
+    video_render_mode: str = "standard"
+    # VIDEO_RENDER_MODE=ffmpeg: añade una pista de subtítulos mov_text además de los quemados
+    video_soft_subtitles: bool = False
+    video_draft: bool = False
+    video_draft_scale: float = 0.5
+    video_draft_fps: int = 12
+    video_draft_contact_sheet: bool = True
+    segment_cache: bool = False
+    segment_cache_max_mb: float = 2048.0
+
+    # --- Publicación ---
+    publish_mode: str = "direct"
+    whatsapp_account: str | None = None
+
+    def __post_init__(self):
+        # Normalizaciones (el dataclass es inmutable, de ahí object.__setattr__)
+        if isinstance(self.video_canvas, str):
+            object.__setattr__(self, "video_canvas", _parse_canvas(self.video_canvas))
+        elif not isinstance(self.video_canvas, tuple):
+            object.__setattr__(self, "video_canvas", tuple(self.video_canvas))
+        if isinstance(self.video_renditions, str):
+            object.__setattr__(self, "video_renditions", _parse_renditions(self.video_renditions))
+        else:
+            object.__setattr__(self, "video_renditions",
+                               tuple(_parse_canvas(r) if isinstance(r, str) else tuple(r)
+                                     for r in self.video_renditions))
+        for name in ("image_source", "image_quality", "video_canvas_fit", "video_motion",
+                     "video_render_mode", "publish_mode", "media_library_policy", "media_library_orientation"):
+            object.__setattr__(self, name, getattr(self, name).lower())
+        if self.whatsapp_account in ("", "default"):
+            object.__setattr__(self, "whatsapp_account", None)
+        self._validate()
+
+    def _validate(self) -> None:
+        choices = {
+            "image_source": IMAGE_SOURCES,
+            "image_quality": IMAGE_QUALITIES,
+            "video_canvas_fit": CANVAS_FITS,
+            "video_motion": MOTIONS,
+            "video_render_mode": RENDER_MODES,
+            "publish_mode": PUBLISH_MODES,
+            "media_library_policy": MEDIA_POLICIES,
+            "media_library_orientation": MEDIA_ORIENTATIONS,
+        }
+        for name, allowed in choices.items():
+            if getattr(self, name) not in allowed:
+                raise ValueError(f"{name.upper()} debe ser uno de {allowed}, no '{getattr(self, name)}'")
+        if self.image_count < 1:
+            raise ValueError("IMAGE_COUNT debe ser al menos 1")
+        if self.video_text_len is not None and self.video_text_len < 1:
+            raise ValueError("VIDEO_TEXT_LEN debe ser positivo")
+        if self.subtitle_font_size < 1:
+            raise ValueError("SUBTITLE_FONT_SIZE debe ser positivo")
+        for name in ("voice_volume", "music_volume", "silence_duration", "segment_cache_max_mb",
+                     "image_race_hedge", "image_min_side", "image_min_sharpness"):
+            if getattr(self, name) < 0:
+                raise ValueError(f"{name.upper()} no puede ser negativo")
+        if self.image_fetch_overfetch < 1.0:
+            raise ValueError("IMAGE_FETCH_OVERFETCH debe ser >= 1.0")
+        if not 0 <= self.image_dup_distance <= 64:
+            raise ValueError("IMAGE_DUP_DISTANCE debe estar entre 0 y 64 (bits de dHash)")
+        if self.video_motion_zoom < 1.0:
+            raise ValueError("VIDEO_MOTION_ZOOM debe ser >= 1.0")
+        if not 0 < self.video_draft_scale <= 1:
+            raise ValueError("VIDEO_DRAFT_SCALE debe estar en (0, 1]")
+        if self.video_draft_fps < 1:
+            raise ValueError("VIDEO_DRAFT_FPS debe ser positivo")
+
+    @classmethod
+    def from_env(cls, environ=None, **overrides) -> "JobConfig":
+        """
+        Toma una instantánea de la configuración desde el entorno.
+
+        Args:
+            environ: mapa de variables (por defecto os.environ)
+            **overrides: valores que sustituyen a los del entorno (p. ej. para un trabajo programado)
+        """
+        environ = os.environ if environ is None else environ
+        values = {}
+        for f in dataclasses.fields(cls):
+            raw = environ.get(f.name.upper())
+            if raw is None:
+                continue
+            try:
+                values[f.name] = _cast(f.name, f.default, raw)
+            except ValueError:
+                raise ValueError(f"{f.name.upper()}: valor no válido '{raw}'") from None
+        values = {k: v for k, v in values.items() if v is not None}
+        values.update(overrides)
+        return cls(**values)
+
+    def replace(self, **changes) -> "JobConfig":
+        """Copia con algunos campos cambiados (se vuelve a validar)"""
+        return dataclasses.replace(self, **changes)
+
+    def to_dict(self) -> dict:
+        """Representación serializable en JSON (para guardar junto a cada ejecución)"""
+        data = dataclasses.asdict(self)
+        data["video_canvas"] = f"{self.video_canvas[0]}x{self.video_canvas[1]}"
+        data["video_renditions"] = ",".join(f"{w}x{h}" for w, h in self.video_renditions)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "JobConfig":
+        known = {f.name for f in dataclasses.fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"Campos de configuración desconocidos: {sorted(unknown)}")
+        return cls(**data)
+
+def _parse_canvas(value: str) -> tuple[int, int]:
+    m = re.fullmatch(r"\s*(\d+)\s*[xX]\s*(\d+)\s*", value)
+    if not m or int(m.group(1)) < 2 or int(m.group(2)) < 2:
+        raise ValueError(f"VIDEO_CANVAS debe tener la forma ANCHOxALTO, no '{value}'")
+    return int(m.group(1)), int(m.group(2))
+
+def _parse_renditions(value: str) -> tuple[tuple[int, int], ...]:
+    """'1920x1080, 1080x1080' → ((1920, 1080), (1080, 1080)); vacío → sin versiones extra"""
+    return tuple(_parse_canvas(item) for item in value.split(",") if item.strip())
+
+def _cast(name: str, default, raw: str):
+    """Convierte el texto de una variable de entorno al tipo del campo"""
+    if isinstance(default, bool):
+        return raw.strip().lower() == "true"
+    if name == "video_renditions":
+        return _parse_renditions(raw)
+    if name in _OPTIONAL_CASTS:
+        return _OPTIONAL_CASTS[name](raw) if raw.strip() else None
+    if isinstance(default, int):
+        return int(raw) if raw.strip() else None
+    if isinstance(default, float):
+        return float(raw) if raw.strip() else None
+    if isinstance(default, tuple):
+        return _parse_canvas(raw) if raw.strip() else None
+    if default is None and not raw.strip():
+        return None
+    return raw
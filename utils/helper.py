@@ -1,5 +1,4 @@
 import os
-import datetime
 import logging
 import shutil
 from dotenv import load_dotenv
@@ -28,11 +27,10 @@ def bootstrap(env_file: str = ".env", log_dir: str = "runs") -> None:
         logging.getLogger(noisy).setLevel(logging.WARNING)
 
 
-def new_run_dir(root: str = "runs") -> str:
-    ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    path = os.path.join(root, f"run_{ts}")
-    os.makedirs(path, exist_ok=True)
-    return path
+def new_run_dir(root: str | None = None, topic: str | None = None) -> str:
+    """Crea <RUNS_DIR>/run_<fecha>_<hora>_<sufijo> y lo registra en el catálogo (ver utils.run_store)."""
+    from utils.run_store import create_run
+    return create_run(root, topic=topic)
 
 
 def move_into(target_dir: str, *files: str) -> list[str]:
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Entrega en memoria de las imágenes de un trabajo, de la obtención al render.
+
+Los agentes de imágenes devuelven ImageArtifact: es la ruta del fichero de la ejecución
+(un str, así que todo lo que espera rutas sigue funcionando) y además lleva la imagen ya
+decodificada. El fichero se escribe en segundo plano como artefacto de la ejecución; el
+render usa la imagen en memoria y no vuelve a decodificarla:
+
+    art = image_artifact.persist(img, run_dir / "img_1.jpg", format="JPEG", quality=90)
+    ...
+    img = image_artifact.load(art)      # en memoria; con una ruta normal, desde disco
+    image_artifact.release(art)         # segmento codificado: la imagen ya no ocupa memoria
+    image_artifact.flush()              # al final del trabajo: todos los ficheros escritos
+
+Con los bytes originales (p. ej. el PNG que devuelve la API), persist(img, path, data=...)
+los escribe tal cual, sin recodificar.
+"""
+import os
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PIL import Image
+
+from utils import trace_helper
+
+log = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-persist")
+_pending: set[Future] = set()
+_lock = threading.Lock()
+
+class ImageArtifact(str):
+    """Ruta de una imagen de la ejecución con la imagen decodificada adjunta"""
+
+    image: Image.Image | None
+    _future: Future | None
+
+    def __new__(cls, path: str, image: Image.Image | None = None, future: Future | None = None):
+        obj = super().__new__(cls, os.fspath(path))
+        obj.image = image
+        obj._future = future
+        return obj
+
+    def __reduce__(self):
+        # Entre procesos viaja solo la ruta (la imagen en memoria no se serializa)
+        return str, (str(self),)
+
+    def wait(self, timeout: float | None = None) -> str:
+        """Espera a que el fichero esté escrito (relanza el error de escritura, si lo hubo)"""
+        if self._future is not None:
+            self._future.result(timeout)
+        return str(self)
+
+    def release(self) -> None:
+        """
+        Suelta la imagen en memoria; a partir de aquí load() lee el fichero. Si el fichero aún
+        se está escribiendo, la imagen se suelta al terminar la escritura (hasta entonces
+        load() la necesita y el hilo de escritura la retiene de todos modos).
+        """
+        if self._future is None or self._future.done():
+            self.image = None
+        else:
+            self._future.add_done_callback(lambda _: setattr(self, "image", None))
+
+def _write(image: Image.Image, path: str, data: bytes | None, fmt: str | None, save_kwargs: dict) -> str:
+    with trace_helper.span("images.persist", file=os.path.basename(path)):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.part"
+        if data is not None:
+            with open(tmp, "wb") as f:
+                f.write(data)
+        else:
+            image.save(tmp, format=fmt, **save_kwargs)
+        os.replace(tmp, path)
+    return path
+
+def persist(image: Image.Image, path, data: bytes | None = None, format: str | None = None,
+            **save_kwargs) -> ImageArtifact:
+    """
+    Devuelve al momento un ImageArtifact con `image` y escribe el fichero en segundo plano.
+
+    Args:
+        image: imagen decodificada (se carga ya, para que el hilo de escritura no decodifique)
+        path: ruta final del fichero
+        data: bytes ya codificados para escribir tal cual; si no, image.save(format, **save_kwargs)
+    """
+    image.load()
+    path = os.fspath(path)
+    future = _executor.submit(trace_helper.bind(_write), image, path, data, format, save_kwargs)
+    with _lock:
+        _pending.add(future)
+    future.add_done_callback(_done)
+    return ImageArtifact(path, image, future)
+
+def _done(future: Future) -> None:
+    with _lock:
+        _pending.discard(future)
+    if future.exception() is not None:
+        log.error("[ImageArtifact] No se pudo guardar una imagen: %s", future.exception())
+
+def load(src, draft: tuple[int, int] | None = None) -> Image.Image:
+    """
+    Imagen RGB de una ruta o de un ImageArtifact (sin tocar disco si está en memoria).
+
+    draft: con ficheros JPEG, decodifica directamente a una escala reducida cercana a este tamaño.
+    """
+    image = getattr(src, "image", None)
+    if image is not None:
+        return image if image.mode == "RGB" else image.convert("RGB")
+    with Image.open(src) as img:
+        if draft:
+            img.draft("RGB", draft)
+        return img.convert("RGB")
+
+def release(src) -> None:
+    """Suelta la imagen en memoria de un ImageArtifact en cuanto el render ya no la necesita (rutas: nada)"""
+    if isinstance(src, ImageArtifact):
+        src.release()
+
+def flush(timeout: float | None = None) -> int:
+    """Espera a las escrituras pendientes; devuelve cuántas fallaron"""
+    with _lock:
+        pending = list(_pending)
+    failed = 0
+    for future in pending:
+        try:
+            future.result(timeout)
+        except Exception:
+            failed += 1
+    return failed
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Carrera entre fuentes de imágenes (IMAGE_SOURCE=race).
+
+En lugar de esperar a que Bing termine (o falle) para empezar a generar con la API, las
+fuentes corren a la vez y los huecos se llenan con la primera imagen válida que llegue:
+
+    result = image_race.race([
+        ("web", 0.0, lambda n, cancel, deliver: fetch_images_via_bing(..., cancel=cancel, on_image=deliver)),
+        ("api", 4.0, lambda n, cancel, deliver: make_images(..., cancel=cancel, on_image=deliver)),
+    ], count=3)
+
+Cada fuente es (nombre, retardo de arranque en s, fn(count, cancel, deliver)). Con retardo,
+la fuente es una cobertura: solo arranca si pasado ese tiempo aún faltan imágenes, o antes
+si las fuentes que ya corrían terminan sin llenar los huecos. Al completar `count` se activa
+`cancel` y se vuelve sin esperar a las demás; lo que entreguen después se descarta. Las
+fuentes deben consultar `cancel` entre imágenes (una descarga o llamada en curso no se corta).
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+import collections
+from dataclasses import dataclass, field
+from typing import Callable
+
+from PIL import Image
+
+from utils import trace_helper
+
+log = logging.getLogger(__name__)
+
+# fn(count, cancel, deliver) → rutas (opcional: las no entregadas con deliver se entregan al terminar)
+SourceFn = Callable[[int, threading.Event, Callable[[str], None]], list[str] | None]
+
+@dataclass
+class RaceResult:
+    files: list[str]
+    sources: list[str]                     # fuente de cada imagen de files
+    winner: str | None                     # fuente que aportó más imágenes
+    first_image: dict[str, float] = field(default_factory=dict)  # fuente → s hasta su primera imagen
+    started: list[str] = field(default_factory=list)             # fuentes que llegaron a arrancar
+
+def _valid(path: str) -> bool:
+    if getattr(path, "image", None) is not None:
+        return True  # ImageArtifact: ya decodificada por la fuente
+    try:
+        with Image.open(path) as img:
+            img.verify()
+        return True
+    except Exception as e:
+        log.warning("[ImageRace] Imagen descartada (%s): %s", e.__class__.__name__, path)
+        return False
+
+def race(sources: list[tuple[str, float, SourceFn]], count: int, timeout: float | None = None) -> RaceResult:
+    """
+    Llena `count` huecos con las imágenes de la fuente que antes las entregue.
+
+    Args:
+        sources: (nombre, retardo de arranque en s, función) por fuente
+        count: imágenes necesarias
+        timeout: espera máxima total (None = hasta que terminen todas las fuentes)
+
+    Returns:
+        RaceResult con las imágenes en orden de llegada (puede traer menos de `count`
+        si todas las fuentes terminan sin llenarlos)
+    """
+    t0 = time.monotonic()
+    cv = threading.Condition()
+    cancel = threading.Event()
+    files: list[str] = []
+    labels: list[str] = []
+    first_image: dict[str, float] = {}
+    started: list[str] = []
+    finished: set[str] = set()
+
+    def deliver_for(name: str):
+        def deliver(path: str) -> None:
+            if not path or not _valid(path):
+                return
+            with cv:
+                if path in files:
+                    return
+                if len(files) < count:
+                    files.append(path)
+                    labels.append(name)
+                    first_image.setdefault(name, round(time.monotonic() - t0, 2))
+                    if len(files) >= count:
+                        cancel.set()
+                    cv.notify_all()
+                    return
+            # Huecos ya llenos: la imagen de la fuente perdedora sobra
+            try:
+                if hasattr(path, "wait"):
+                    path.wait()  # ImageArtifact: que la escritura en curso no la recree después
+                os.remove(path)
+            except OSError:
+                pass
+        return deliver
+
+    def runner(name: str, delay: float, fn: SourceFn):
+        earlier = [n for n, d, _ in sources if d < delay]
+        with cv:
+            cv.wait_for(lambda: cancel.is_set() or time.monotonic() - t0 >= delay
+                        or all(n in finished for n in earlier), timeout=delay)
+            if cancel.is_set():
+                finished.add(name)
+                cv.notify_all()
+                return
+            started.append(name)
+        log.info("[ImageRace] Arranca la fuente '%s' (%.1fs)", name, time.monotonic() - t0)
+        deliver = deliver_for(name)
+        try:
+            with trace_helper.span(f"images.race.{name}", delay=delay):
+                for path in fn(count, cancel, deliver) or []:
+                    deliver(path)
+        except Exception as e:
+            log.warning("[ImageRace] La fuente '%s' falló: %s", name, e)
+        finally:
+            with cv:
+                finished.add(name)
+                cv.notify_all()
+
+    with trace_helper.span("images.race", count=count) as attrs:
+        for name, delay, fn in sources:
+            # Cada hilo hereda el contexto (traza, trabajo del planificador de OpenAI)
+            ctx = contextvars.copy_context()
+            threading.Thread(target=ctx.run, args=(runner, name, delay, fn),
+                             name=f"image-race-{name}", daemon=True).start()
+        with cv:
+            cv.wait_for(lambda: cancel.is_set() or len(finished) == len(sources), timeout=timeout)
+            cancel.set()  # las fuentes que sigan corriendo paran en su siguiente comprobación
+            result = RaceResult(list(files), list(labels), None, dict(first_image), list(started))
+
+        counts = collections.Counter(result.sources)
+        if counts:
+            result.winner = counts.most_common(1)[0][0]
+        attrs.update(winner=result.winner or "", filled=len(result.files),
+                     **{f"from_{name}": n for name, n in counts.items()})
+    log.info("[ImageRace] %d/%d imágenes en %.1fs; ganadora: %s (%s)", len(result.files), count,
+             time.monotonic() - t0, result.winner, dict(counts))
+    return result
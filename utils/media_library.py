@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Biblioteca de imágenes locales (IMAGE_SOURCE=local) con índice en disco.
+
+El índice SQLite (media/.library.sqlite) guarda por imagen sus dimensiones, orientación,
+hash y número de usos. El escaneo es incremental: solo se abren las imágenes nuevas o
+modificadas, y las carpetas cuyo mtime no cambió no se vuelven a recorrer fichero a fichero.
+
+La selección es una consulta indexada según la política (alphabetical, least_used o
+random) y el reparto es atómico (BEGIN IMMEDIATE). Dos workers que piden imágenes a la vez
+nunca reciben la misma.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+from contextlib import closing
+from PIL import Image, UnidentifiedImageError
+
+log = logging.getLogger(__name__)
+
+IMG_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+POLICIES = ("alphabetical", "least_used", "random")
+ORIENTATIONS = ("any", "portrait", "landscape", "square")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path        TEXT PRIMARY KEY,
+    dir         TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime       REAL NOT NULL,
+    sha256      TEXT,
+    width       INTEGER,
+    height      INTEGER,
+    orientation TEXT,
+    uses        INTEGER DEFAULT 0,
+    last_used   REAL,
+    claimed_by  TEXT,
+    claimed_at  REAL
+);
+CREATE INDEX IF NOT EXISTS images_free ON images (claimed_by, orientation, path);
+CREATE INDEX IF NOT EXISTS images_uses ON images (claimed_by, orientation, uses, path);
+CREATE INDEX IF NOT EXISTS images_dir ON images (dir);
+CREATE TABLE IF NOT EXISTS dirs (
+    path  TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+"""
+
+def _orientation(width: int, height: int) -> str:
+    if height > width * 1.05:
+        return "portrait"
+    if width > height * 1.05:
+        return "landscape"
+    return "square"
+
+def _probe(path: str) -> tuple[str, int, int]:
+    """Hash del contenido y dimensiones (PIL solo lee la cabecera)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    with Image.open(path) as img:
+        width, height = img.size
+    return h.hexdigest(), width, height
+
+class MediaLibrary:
+    """
+    Índice de la carpeta de medios.
+
+    Uso:
+        lib = MediaLibrary("media")
+        lib.scan()
+        paths = lib.claim(5, owner="run_x", policy="least_used")
+        ...  # mover o enlazar las imágenes
+        lib.consume(p) / lib.release(p, used=True)
+    """
+
+    def __init__(self, media_dir: str, db_path: str | None = None):
+        self.media_dir = os.path.abspath(media_dir)
+        self.db_path = db_path or os.getenv("MEDIA_LIBRARY_DB") or os.path.join(self.media_dir, ".library.sqlite")
+        os.makedirs(self.media_dir, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # ------------------------------------------------------------------
+    # Escaneo incremental
+    # ------------------------------------------------------------------
+    def scan(self) -> dict:
+        """Sincroniza el índice con el disco; devuelve cuántas imágenes se añadieron, actualizaron y quitaron"""
+        t0 = time.perf_counter()
+        added = updated = removed = 0
+        with closing(self._connect()) as conn:
+            known_dirs = {r["path"]: r["mtime"] for r in conn.execute("SELECT path, mtime FROM dirs")}
+            seen_dirs = set()
+            stack = [self.media_dir]
+            while stack:
+                folder = stack.pop()
+                seen_dirs.add(folder)
+                try:
+                    entries = list(os.scandir(folder))
+                    dir_mtime = os.stat(folder).st_mtime
+                except OSError:
+                    continue
+                stack.extend(e.path for e in entries if e.is_dir(follow_symlinks=False))
+                if known_dirs.get(folder) == dir_mtime:
+                    continue  # sin altas ni bajas en esta carpeta desde el último escaneo
+
+                indexed = {r["path"]: (r["size"], r["mtime"]) for r in
+                           conn.execute("SELECT path, size, mtime FROM images WHERE dir = ?", (folder,))}
+                present, upserts = set(), []
+                # Lectura de imágenes fuera de la transacción: no bloquea los claim() de otros workers
+                for entry in entries:
+                    name = entry.name
+                    if not entry.is_file() or not name.lower().endswith(IMG_EXTENSIONS):
+                        continue
+                    st = entry.stat()
+                    present.add(entry.path)
+                    if indexed.get(entry.path) == (st.st_size, st.st_mtime):
+                        continue
+                    try:
+                        digest, width, height = _probe(entry.path)
+                    except (OSError, UnidentifiedImageError) as e:
+                        log.warning("[MediaLibrary] Imagen ilegible %s: %s", entry.path, e)
+                        continue
+                    upserts.append((entry.path, folder, st.st_size, st.st_mtime, digest, width, height,
+                                    _orientation(width, height)))
+                    if entry.path in indexed:
+                        updated += 1
+                    else:
+                        added += 1
+                gone = [p for p in indexed if p not in present]
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT INTO images (path, dir, size, mtime, sha256, width, height, orientation) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET "
+                    "size = excluded.size, mtime = excluded.mtime, sha256 = excluded.sha256, "
+                    "width = excluded.width, height = excluded.height, orientation = excluded.orientation",
+                    upserts)
+                conn.executemany("DELETE FROM images WHERE path = ?", [(p,) for p in gone])
+                removed += len(gone)
+                conn.execute("INSERT OR REPLACE INTO dirs (path, mtime) VALUES (?, ?)", (folder, dir_mtime))
+                conn.execute("COMMIT")
+
+            # Carpetas que ya no existen
+            for folder in set(known_dirs) - seen_dirs:
+                conn.execute("BEGIN IMMEDIATE")
+                removed += conn.execute("DELETE FROM images WHERE dir = ?", (folder,)).rowcount
+                conn.execute("DELETE FROM dirs WHERE path = ?", (folder,))
+                conn.execute("COMMIT")
+
+        result = {"added": added, "updated": updated, "removed": removed}
+        log.info("[MediaLibrary] Índice sincronizado en %.2fs: %s", time.perf_counter() - t0, result)
+        return result
+
+    # ------------------------------------------------------------------
+    # Reparto atómico
+    # ------------------------------------------------------------------
+    def claim(self, count: int, owner: str, policy: str = "alphabetical", orientation: str = "any",
+              claim_timeout: float | None = None) -> list[str]:
+        """
+        Reserva hasta count imágenes libres para owner y devuelve sus rutas.
+
+        Las reservas de más de claim_timeout segundos (MEDIA_LIBRARY_CLAIM_TIMEOUT) se
+        consideran de un worker caído y se liberan antes de elegir.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Política de selección desconocida: {policy} (opciones: {POLICIES})")
+        if orientation not in ORIENTATIONS:
+            raise ValueError(f"Orientación desconocida: {orientation} (opciones: {ORIENTATIONS})")
+        if claim_timeout is None:
+            claim_timeout = float(os.getenv("MEDIA_LIBRARY_CLAIM_TIMEOUT", "3600"))
+
+        where = "claimed_by IS NULL" + ("" if orientation == "any" else " AND orientation = ?")
+        args = () if orientation == "any" else (orientation,)
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("UPDATE images SET claimed_by = NULL, claimed_at = NULL "
+                             "WHERE claimed_by IS NOT NULL AND claimed_at < ?", (now - claim_timeout,))
+                if policy == "least_used":
+                    rows = conn.execute(f"SELECT rowid, path FROM images WHERE {where} "
+                                        "ORDER BY uses, path LIMIT ?", (*args, count)).fetchall()
+                elif policy == "random":
+                    # Punto de arranque aleatorio sobre el rowid y vuelta al principio: sin ordenar toda la tabla
+                    rows = conn.execute(f"SELECT rowid, path FROM images WHERE {where} AND rowid >= "
+                                        "(SELECT abs(random()) % (max(rowid) + 1) FROM images) "
+                                        "ORDER BY rowid LIMIT ?", (*args, count)).fetchall()
+                    if len(rows) < count:
+                        taken = [r["rowid"] for r in rows] or [-1]
+                        rows += conn.execute(
+                            f"SELECT rowid, path FROM images WHERE {where} AND rowid NOT IN "
+                            f"({','.join('?' * len(taken))}) ORDER BY rowid LIMIT ?",
+                            (*args, *taken, count - len(rows))).fetchall()
+                else:
+                    rows = conn.execute(f"SELECT rowid, path FROM images WHERE {where} "
+                                        "ORDER BY path LIMIT ?", (*args, count)).fetchall()
+                conn.executemany("UPDATE images SET claimed_by = ?, claimed_at = ? WHERE rowid = ?",
+                                 [(owner, now, r["rowid"]) for r in rows])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        paths = []
+        for r in rows:
+            if os.path.isfile(r["path"]):
+                paths.append(r["path"])
+            else:
+                self.forget(r["path"])  # borrada fuera de la biblioteca
+        log.info("[MediaLibrary] %d/%d imágenes reservadas para %s (%s, %s)",
+                 len(paths), count, owner, policy, orientation)
+        return paths
+
+    def release(self, path: str, used: bool = False) -> None:
+        """Libera una reserva; con used=True cuenta un uso más (la imagen sigue en la biblioteca)"""
+        with closing(self._connect()) as conn:
+            if used:
+                conn.execute("UPDATE images SET claimed_by = NULL, claimed_at = NULL, uses = uses + 1, "
+                             "last_used = ? WHERE path = ?", (time.time(), os.path.abspath(path)))
+            else:
+                conn.execute("UPDATE images SET claimed_by = NULL, claimed_at = NULL WHERE path = ?",
+                             (os.path.abspath(path),))
+
+    def forget(self, path: str) -> None:
+        """Quita una imagen del índice (se movió fuera de media/ o ya no existe)"""
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM images WHERE path = ?", (os.path.abspath(path),))
+
+    def consume(self, path: str) -> None:
+        """La imagen se movió a una ejecución: sale de la biblioteca"""
+        self.forget(path)
+
+    def stats(self) -> dict:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT orientation, count(*) AS n, sum(claimed_by IS NOT NULL) AS claimed "
+                                "FROM images GROUP BY orientation").fetchall()
+        return {r["orientation"]: {"images": r["n"], "claimed": r["claimed"]} for r in rows}
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motor de movimiento pan/zoom (Ken Burns) para segmentos de imagen fija.
+
+Los rectángulos de recorte de todo el segmento se calculan de una vez como arrays
+de NumPy; cada fotograma es un muestreo por índices sobre un único buffer de la
+imagen pre-escalada, sin llamadas a PIL ni lambdas de moviepy por fotograma.
+"""
+import numpy as np
+from PIL import Image
+from moviepy.editor import VideoClip
+
+# Trayectorias alternadas por segmento: (zoom_in, dirección de desplazamiento x, y)
+_VARIANTS = [
+    (True, 0.0, 0.0),
+    (False, 1.0, 0.0),
+    (True, -1.0, 0.5),
+    (False, 0.0, -1.0),
+]
+
+def plan_ken_burns(n_frames: int, out_size: tuple[int, int], zoom: float = 1.15,
+                   variant: int = 0) -> np.ndarray:
+    """
+    Calcula los rectángulos de recorte (x, y, w, h) de cada fotograma.
+
+    Las coordenadas están en el espacio del buffer pre-escalado (out_size * zoom),
+    de modo que con el zoom máximo el recorte coincide 1:1 con la salida.
+
+    Returns:
+        Array float64 de forma (n_frames, 4)
+    """
+    out_w, out_h = out_size
+    buf_w, buf_h = out_w * zoom, out_h * zoom
+    zoom_in, dx, dy = _VARIANTS[variant % len(_VARIANTS)]
+
+    # Interpolación suavizada (smoothstep) entre el encuadre inicial y el final
+    t = np.linspace(0.0, 1.0, max(1, n_frames))
+    t = t * t * (3.0 - 2.0 * t)
+    if not zoom_in:
+        t = 1.0 - t
+
+    # Escala del recorte: de todo el buffer (1.0) a la salida exacta (1/zoom)
+    scale = 1.0 + (1.0 / zoom - 1.0) * t
+    w = buf_w * scale
+    h = buf_h * scale
+
+    # El centro se desplaza en la dirección elegida, sin salirse del buffer
+    cx = buf_w / 2 + dx * (buf_w - w) / 2 * t
+    cy = buf_h / 2 + dy * (buf_h - h) / 2 * t
+    return np.stack([cx - w / 2, cy - h / 2, w, h], axis=1)
+
+def _index_maps(rects: np.ndarray, out_size: tuple[int, int], buf_size: tuple[int, int]):
+    """Convierte los rectángulos en mapas de índices de filas/columnas (vecino más cercano)"""
+    out_w, out_h = out_size
+    buf_w, buf_h = buf_size
+    x, y, w, h = rects.T
+    cols = x[:, None] + (np.arange(out_w) + 0.5)[None, :] * (w / out_w)[:, None]
+    rows = y[:, None] + (np.arange(out_h) + 0.5)[None, :] * (h / out_h)[:, None]
+    cols = np.clip(cols.astype(np.int32), 0, buf_w - 1)
+    rows = np.clip(rows.astype(np.int32), 0, buf_h - 1)
+    return rows, cols
+
+def zoompan_filter(n_frames: int, out_size: tuple[int, int], fps: int, zoom: float = 1.15,
+                   variant: int = 0) -> str:
+    """Filtro zoompan de ffmpeg equivalente, para los backends que codifican sin pasar por Python"""
+    out_w, out_h = out_size
+    zoom_in, dx, dy = _VARIANTS[variant % len(_VARIANTS)]
+    n = max(1, n_frames - 1)
+    # Progreso suavizado igual que en plan_ken_burns
+    p = f"(on/{n})*(on/{n})*(3-2*on/{n})"
+    if not zoom_in:
+        p = f"(1-{p})"
+    # zoompan recorta iw/zoom: el inverso de la escala del recorte de plan_ken_burns
+    z = f"1/(1+({1 / zoom - 1:.9f})*{p})"
+    x = f"round((iw-iw/zoom)/2*(1+({dx})*{p}))"
+    y = f"round((ih-ih/zoom)/2*(1+({dy})*{p}))"
+    return f"zoompan=z='{z}':x='{x}':y='{y}':d={n_frames}:s={out_w}x{out_h}:fps={fps}"
+
+def motion_frame_sampler(img: Image.Image, layer: Image.Image, n_frames: int,
+                         out_size: tuple[int, int], zoom: float = 1.15, variant: int = 0):
+    """
+    Prepara un segmento con movimiento Ken Burns y devuelve una función frame_at(i).
+
+    La capa de texto RGBA se compone encima de cada fotograma, pero solo dentro de
+    su caja envolvente, ya que los subtítulos ocupan una fracción pequeña del lienzo.
+    """
+    out_w, out_h = out_size
+    buf_size = (max(out_w, round(out_w * zoom)), max(out_h, round(out_h * zoom)))
+    # Pre-escalado único: con el zoom máximo el muestreo es 1:1
+    buf = np.asarray(img.resize(buf_size, Image.LANCZOS))
+
+    n_frames = max(1, n_frames)
+    rows, cols = _index_maps(plan_ken_burns(n_frames, out_size, zoom, variant), out_size, buf_size)
+
+    # Capa de texto premultiplicada, recortada a su caja envolvente
+    bbox = layer.getbbox()
+    if bbox:
+        left, top, right, bottom = bbox
+        rgba = np.asarray(layer.crop(bbox), dtype=np.float32) / 255.0
+        alpha = rgba[..., 3:4]
+        premult = rgba[..., :3] * alpha * 255.0
+        inv_alpha = 1.0 - alpha
+
+    def frame_at(i: int) -> np.ndarray:
+        i = min(max(i, 0), n_frames - 1)
+        frame = buf[rows[i][:, None], cols[i][None, :]]
+        if bbox:
+            region = frame[top:bottom, left:right]
+            frame[top:bottom, left:right] = (region * inv_alpha + premult).astype(np.uint8)
+        return frame
+
+    return frame_at
+
+def make_motion_clip(img: Image.Image, layer: Image.Image, duration: float, fps: int,
+                     out_size: tuple[int, int], zoom: float = 1.15, variant: int = 0) -> VideoClip:
+    """Crea un clip de moviepy con movimiento Ken Burns a partir de una imagen ya normalizada al lienzo"""
+    n_frames = max(1, int(round(duration * fps)))
+    frame_at = motion_frame_sampler(img, layer, n_frames, out_size, zoom, variant)
+    return VideoClip(lambda t: frame_at(int(t * fps)), duration=duration)
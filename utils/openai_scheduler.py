@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Planificador compartido de llamadas a OpenAI: límites de peticiones y tokens por modelo.
+
+Todas las llamadas de los agentes (chat vía Agents SDK, imágenes y voz) pasan por run():
+
+    result = openai_scheduler.run(lambda: Runner.run_sync(agent, prompt),
+                                  model=model, stage="script", tokens=estimate_tokens(prompt))
+
+Para cada modelo hay dos cubos de fichas (peticiones/min y tokens/min) y un límite de
+concurrencia AIMD: sube +1/límite con cada éxito y se divide por dos con cada 429. Las
+llamadas que esperan se atienden por prioridad (etapa) y, a igualdad, por orden de
+llegada de su trabajo, para que los trabajos antiguos terminen antes.
+
+Los límites salen de OPENAI_RATE_LIMITS ("modelo=rpm:tpm,...") o se aprenden de las
+cabeceras x-ratelimit-* de cada respuesta. install_hooks() engancha los clientes HTTP de
+openai y del Agents SDK para observar todas las respuestas, incluidos los reintentos internos.
+Los límites son por proceso; con varios procesos, OPENAI_BUDGET_SHARE indica la fracción
+de la cuenta que corresponde a cada uno (un pool que reparte su parte entre sus procesos
+la pasa con install_hooks(share=...)).
+"""
+import os
+import json
+import time
+import heapq
+import logging
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+log = logging.getLogger(__name__)
+
+# Prioridad por etapa (menor = antes). La voz y el vídeo dependen de todo lo anterior,
+# así que las etapas finales de un trabajo tienen preferencia sobre el arranque de otro.
+STAGE_PRIORITY = {
+    "tts": 1,
+    "title": 2,
+    "langcheck": 2,
+    "transform": 2,
+    "script": 3,
+    "image_prompt": 3,
+    "image": 3,
+    "websearch": 4,
+}
+DEFAULT_PRIORITY = 5
+
+_job = contextvars.ContextVar("openai_job", default=None)
+
+@contextmanager
+def job_context(job: str, priority: int | None = None):
+    """Asocia las llamadas del bloque a un trabajo (y opcionalmente a una prioridad fija)"""
+    token = _job.set((job, priority))
+    try:
+        yield
+    finally:
+        _job.reset(token)
+
+def estimate_tokens(*texts: str, output: int = 512) -> int:
+    """Estimación barata (≈4 caracteres por token) más la salida esperada"""
+    return sum(len(t or "") for t in texts) // 4 + output
+
+def _parse_duration(value: str | None) -> float | None:
+    """'1s', '6m0s', '20ms', '1h2m3.5s' → segundos"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total, num = 0.0, ""
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    i = 0
+    while i < len(value):
+        c = value[i]
+        if c.isdigit() or c == ".":
+            num += c
+            i += 1
+            continue
+        unit = "ms" if value[i:i + 2] == "ms" else c
+        if unit not in units or not num:
+            return None
+        total += float(num) * units[unit]
+        num = ""
+        i += len(unit)
+    return total
+
+class _Bucket:
+    """Cubo de fichas que se rellena de forma continua (capacidad por minuto); 0 = sin límite"""
+
+    def __init__(self, per_minute: float, pinned: bool = False):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.pinned = pinned  # límite fijado por configuración: las cabeceras no lo cambian
+        self._last = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + (now - self._last) * self.capacity / 60)
+        self._last = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        need = min(amount, self.capacity) - self.level
+        return 0.0 if need <= 0 else need * 60 / self.capacity
+
+    def take(self, amount: float) -> None:
+        if self.capacity > 0:
+            self.level -= amount
+
+    def learn(self, limit: float | None, remaining: float | None, now: float) -> None:
+        if limit and not self.pinned:
+            self.capacity = limit
+        if remaining is not None and self.capacity > 0:
+            self._refill(now)
+            self.level = min(self.level, remaining)
+
+@dataclass
+class _ModelState:
+    rpm: _Bucket
+    tpm: _Bucket
+    limit: float
+    max_limit: int
+    inflight: int = 0
+    paused_until: float = 0.0
+    queue: list = field(default_factory=list)
+    calls: int = 0
+    rate_limited: int = 0
+    waited: float = 0.0
+
+@dataclass(order=True)
+class _Ticket:
+    priority: int
+    job_seq: int
+    seq: int
+    model: str = field(compare=False)
+    tokens: int = field(compare=False)
+    stage: str = field(compare=False)
+
+class OpenAIScheduler:
+    """Presupuestos por modelo y cola con prioridad compartidos por todos los hilos del proceso"""
+
+    def __init__(self, limits: dict | None = None, max_concurrency: int = 4, share: float = 1.0):
+        self.limits = limits or {}
+        self.max_concurrency = max(1, max_concurrency)
+        self.share = share
+        self.hooks_installed = False
+        self._models: dict[str, _ModelState] = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._jobs: dict = {}
+
+    @classmethod
+    def from_env(cls, share: float | None = None) -> "OpenAIScheduler":
+        """Límites y concurrencia del entorno; share sustituye a OPENAI_BUDGET_SHARE"""
+        limits = {}
+        for item in os.getenv("OPENAI_RATE_LIMITS", "").split(","):
+            if "=" not in item:
+                continue
+            name, _, spec = item.partition("=")
+            rpm, _, tpm = spec.partition(":")
+            limits[name.strip()] = (float(rpm or 0), float(tpm or 0))
+        return cls(limits, max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "4")),
+                   share=share if share is not None else float(os.getenv("OPENAI_BUDGET_SHARE", "1")))
+
+    def _state(self, model: str) -> _ModelState:
+        st = self._models.get(model)
+        if st is None:
+            rpm, tpm = self.limits.get(model, (0, 0))
+            st = _ModelState(_Bucket(rpm * self.share, pinned=bool(rpm)),
+                             _Bucket(tpm * self.share, pinned=bool(tpm)),
+                             limit=float(self.max_concurrency), max_limit=self.max_concurrency)
+            self._models[model] = st
+        return st
+
+    # ------------------------------------------------------------------
+    def acquire(self, model: str, tokens: int = 0, stage: str = "", priority: int | None = None) -> _Ticket:
+        """Bloquea hasta que la llamada es la primera de su cola y hay presupuesto y concurrencia"""
+        job, job_priority = _job.get() or (None, None)
+        if priority is None:
+            priority = job_priority if job_priority is not None else STAGE_PRIORITY.get(stage, DEFAULT_PRIORITY)
+        t0 = time.monotonic()
+        with self._cond:
+            seq = next(self._seq)
+            # Orden de llegada del trabajo: todas sus llamadas heredan el puesto de la primera
+            job_seq = self._jobs.setdefault(job, seq) if job is not None else seq
+            ticket = _Ticket(priority, job_seq, seq, model, tokens, stage)
+            st = self._state(model)
+            heapq.heappush(st.queue, ticket)
+            while True:
+                now = time.monotonic()
+                timeout = 1.0
+                if st.queue[0] is ticket and st.inflight < max(1, int(st.limit)) and now >= st.paused_until:
+                    wait = max(st.rpm.wait_time(1, now), st.tpm.wait_time(tokens, now))
+                    if wait <= 0:
+                        heapq.heappop(st.queue)
+                        st.rpm.take(1)
+                        st.tpm.take(tokens)
+                        st.inflight += 1
+                        st.calls += 1
+                        st.waited += now - t0
+                        self._cond.notify_all()
+                        return ticket
+                    timeout = min(timeout, wait)
+                elif now < st.paused_until:
+                    timeout = min(timeout, st.paused_until - now)
+                self._cond.wait(timeout)
+
+    def try_acquire(self, model: str, tokens: int = 0, stage: str = "") -> _Ticket | None:
+        """
+        Reserva sin esperar, solo con presupuesto sobrante: nadie en cola, concurrencia libre
+        y fichas disponibles ya. Para peticiones opcionales (p. ej. coberturas de call_policy).
+        """
+        with self._cond:
+            st = self._state(model)
+            now = time.monotonic()
+            if st.queue or st.inflight >= max(1, int(st.limit)) or now < st.paused_until:
+                return None
+            if st.rpm.wait_time(1, now) > 0 or st.tpm.wait_time(tokens, now) > 0:
+                return None
+            st.rpm.take(1)
+            st.tpm.take(tokens)
+            st.inflight += 1
+            st.calls += 1
+            seq = next(self._seq)
+            return _Ticket(DEFAULT_PRIORITY, seq, seq, model, tokens, stage)
+
+    def release(self, ticket: _Ticket, used_tokens: int | None = None, rate_limited: bool = False,
+                retry_after: float | None = None) -> None:
+        with self._cond:
+            st = self._state(ticket.model)
+            st.inflight -= 1
+            if used_tokens is not None:
+                # Ajuste de la estimación con el consumo real
+                st.tpm.take(used_tokens - ticket.tokens)
+            if rate_limited:
+                if not self.hooks_installed:
+                    self._on_rate_limited(st, retry_after)
+            else:
+                st.limit = min(st.max_limit, st.limit + 1 / st.limit)
+            self._cond.notify_all()
+
+    def _on_rate_limited(self, st: _ModelState, retry_after: float | None) -> None:
+        st.rate_limited += 1
+        st.limit = max(1.0, st.limit / 2)
+        st.paused_until = max(st.paused_until, time.monotonic() + (retry_after or 1.0))
+
+    def observe(self, model: str, status: int, headers) -> None:
+        """Actualiza presupuestos y concurrencia con las cabeceras de una respuesta de la API"""
+        def num(name):
+            try:
+                return float(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        with self._cond:
+            st = self._state(model)
+            now = time.monotonic()
+            limit_req, remaining_req = num("x-ratelimit-limit-requests"), num("x-ratelimit-remaining-requests")
+            limit_tok, remaining_tok = num("x-ratelimit-limit-tokens"), num("x-ratelimit-remaining-tokens")
+            st.rpm.learn(limit_req and limit_req * self.share, remaining_req and remaining_req * self.share, now)
+            st.tpm.learn(limit_tok and limit_tok * self.share, remaining_tok and remaining_tok * self.share, now)
+            if status == 429:
+                retry_after = _retry_after(headers) or _parse_duration(headers.get("x-ratelimit-reset-requests"))
+                self._on_rate_limited(st, retry_after)
+                log.warning("[OpenAIScheduler] 429 en %s: concurrencia %.1f, pausa %.1fs",
+                            model, st.limit, retry_after or 1.0)
+            self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    def run(self, fn, model: str, stage: str = "", tokens: int | None = None, priority: int | None = None):
+        """
+        Ejecuta fn() dentro del presupuesto del modelo.
+
+        Los 429 que llegan hasta aquí (agotados los reintentos del cliente) se reintentan
+        tras la pausa indicada por la API, hasta OPENAI_RATE_LIMIT_RETRIES veces.
+        """
+        import openai
+
+        retries = int(os.getenv("OPENAI_RATE_LIMIT_RETRIES", "5"))
+        tokens = tokens if tokens is not None else estimate_tokens()
+        for attempt in range(retries + 1):
+            ticket = self.acquire(model, tokens, stage, priority)
+            try:
+                result = fn()
+            except openai.RateLimitError as e:
+                headers = getattr(getattr(e, "response", None), "headers", {}) or {}
+                self.release(ticket, rate_limited=True, retry_after=_retry_after(headers))
+                if attempt == retries:
+                    raise
+                log.warning("[OpenAIScheduler] %s/%s limitado (intento %d/%d)", model, stage, attempt + 1, retries)
+                continue
+            except BaseException:
+                self.release(ticket)
+                raise
+            self.release(ticket, used_tokens=_usage_tokens(result))
+            return result
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                model: {
+                    "concurrency": round(st.limit, 2), "inflight": st.inflight, "queued": len(st.queue),
+                    "calls": st.calls, "rate_limited": st.rate_limited,
+                    "avg_wait_s": round(st.waited / st.calls, 3) if st.calls else 0.0,
+                    "rpm": st.rpm.capacity, "tpm": st.tpm.capacity,
+                }
+                for model, st in self._models.items()
+            }
+
+def _retry_after(headers) -> float | None:
+    ms = _parse_duration(headers.get("retry-after-ms"))
+    return ms / 1000 if ms else _parse_duration(headers.get("retry-after"))
+
+def _usage_tokens(result) -> int | None:
+    """Tokens reales de un RunResult del Agents SDK (None si no se conocen)"""
+    usage = getattr(getattr(result, "context_wrapper", None), "usage", None)
+    total = getattr(usage, "total_tokens", None)
+    return total if isinstance(total, int) and total > 0 else None
+
+# ---------------------------------------------------------------------------
+# Instancia compartida del proceso
+# ---------------------------------------------------------------------------
+_scheduler = None
+_lock = threading.Lock()
+
+def get() -> OpenAIScheduler:
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = OpenAIScheduler.from_env()
+        return _scheduler
+
+def run(fn, model: str, stage: str = "", tokens: int | None = None, priority: int | None = None):
+    return get().run(fn, model=model, stage=stage, tokens=tokens, priority=priority)
+
+def _model_of(request) -> str | None:
+    try:
+        return json.loads(request.content or b"{}").get("model")
+    except (ValueError, AttributeError, UnicodeDecodeError):
+        return None
+
+def install_hooks(share: float | None = None) -> bool:
+    """
+    Engancha los clientes HTTP de openai (imágenes, voz) y del Agents SDK para que cada
+    respuesta, incluidos los reintentos internos, alimente los presupuestos.
+
+    share: fracción de los límites de la cuenta para este proceso (p. ej. la que un pool de
+    procesos reparte entre ellos); por defecto, OPENAI_BUDGET_SHARE.
+    """
+    import openai
+
+    global _scheduler
+    if share is not None:
+        with _lock:
+            if _scheduler is None:
+                _scheduler = OpenAIScheduler.from_env(share=share)
+            else:
+                # Antes de la primera llamada: los presupuestos por modelo se crean con esta fracción
+                _scheduler.share = share
+    scheduler = get()
+    if scheduler.hooks_installed:
+        return True
+
+    def on_response(response):
+        model = _model_of(response.request)
+        if model:
+            scheduler.observe(model, response.status_code, response.headers)
+
+    async def on_response_async(response):
+        on_response(response)
+
+    try:
+        # Clientes httpx por defecto de openai (mismos timeouts y límites de conexión) con el hook
+        openai.http_client = openai.DefaultHttpxClient(event_hooks={"response": [on_response]})
+        from agents import set_default_openai_client
+        set_default_openai_client(openai.AsyncOpenAI(
+            http_client=openai.DefaultAsyncHttpxClient(event_hooks={"response": [on_response_async]})))
+    except Exception as e:  # p. ej. sin OPENAI_API_KEY: se sigue sin observar cabeceras
+        log.warning("[OpenAIScheduler] No se pudieron instalar los hooks HTTP: %s", e)
+        return False
+    scheduler.hooks_installed = True
+    return True
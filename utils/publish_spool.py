@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cola (spool) de publicación persistente en disco.
+
+El render deja trabajos en el spool y un worker independiente los publica en
+WhatsApp Web, con reintentos y backoff. Estructura del directorio:
+
+    pending/<id>.json   trabajos pendientes (o esperando a su próximo reintento)
+    claimed/<id>.json   trabajos reclamados por un worker (rename atómico)
+    done/<id>.json      marcas de éxito: un trabajo con marca nunca se vuelve a publicar
+    failed/<id>.json    trabajos que agotaron los reintentos
+
+El id del trabajo es un hash del contenido del vídeo, del caption y de la cuenta,
+así que encolar dos veces el mismo estado no lo publica dos veces.
+
+Uso:
+    python -m utils.publish_spool          # worker continuo
+    python -m utils.publish_spool --once   # procesa lo pendiente y termina
+    python -m utils.publish_spool --stats  # profundidad de la cola y latencias
+"""
+import os
+import json
+import time
+import socket
+import random
+import hashlib
+import logging
+import argparse
+from concurrent.futures import FIRST_COMPLETED, wait
+
+log = logging.getLogger(__name__)
+
+STATES = ("pending", "claimed", "done", "failed")
+
+def spool_dir() -> str:
+    return os.getenv("PUBLISH_SPOOL_DIR", os.path.join("runs", "spool"))
+
+def _path(state: str, job_id: str, root: str | None = None) -> str:
+    return os.path.join(root or spool_dir(), state, f"{job_id}.json")
+
+def _ensure_dirs(root: str) -> None:
+    for state in STATES:
+        os.makedirs(os.path.join(root, state), exist_ok=True)
+
+def _write_json(path: str, data: dict) -> None:
+    """Escritura atómica: fichero temporal + rename"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def _read_json(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def job_id_for(video_path: str, caption: str, account: str | None = None) -> str:
+    """Id idempotente: hash del contenido del vídeo + caption (+ cuenta, si no es la de por defecto)"""
+    h = hashlib.sha256()
+    with open(video_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    h.update(caption.encode("utf-8"))
+    if account:
+        h.update(f"\0{account}".encode("utf-8"))
+    return h.hexdigest()[:24]
+
+def enqueue(video_path: str, caption: str, not_before: float | None = None,
+            account: str | None = None, **extra) -> str:
+    """
+    Añade un vídeo al spool y devuelve el id del trabajo.
+
+    Si el mismo vídeo+caption ya está encolado o publicado en esa cuenta no se duplica.
+    not_before (epoch) permite programar la publicación para más tarde; account elige
+    el perfil de WHATSAPP_ACCOUNTS (por defecto, WHATSAPP_PROFILE_DIR).
+    """
+    root = spool_dir()
+    _ensure_dirs(root)
+    account = None if account in (None, "", "default") else account
+    video_abs = os.path.abspath(video_path)
+    if not os.path.isfile(video_abs):
+        raise FileNotFoundError(f"El video no existe en {video_abs}")
+
+    job_id = job_id_for(video_abs, caption, account)
+    for state in ("pending", "claimed", "done"):
+        if os.path.exists(_path(state, job_id, root)):
+            log.info("[Spool] Trabajo %s ya está en '%s'; no se encola de nuevo", job_id, state)
+            return job_id
+
+    now = time.time()
+    _write_json(_path("pending", job_id, root), {
+        "id": job_id,
+        "video_path": video_abs,
+        "caption": caption,
+        "account": account,
+        "enqueued_at": now,
+        "not_before": not_before or now,
+        "attempts": 0,
+        "last_error": None,
+        **extra,
+    })
+    log.info("[Spool] Trabajo %s encolado: %s", job_id, video_abs)
+    return job_id
+
+def claim(root: str | None = None, busy_accounts=()) -> dict | None:
+    """
+    Reclama atómicamente el siguiente trabajo pendiente cuyo momento ya ha llegado.
+
+    busy_accounts: cuentas con una publicación en curso (None = la de por defecto); sus
+    trabajos se dejan en pending/ para no bloquear a los de otras cuentas.
+    """
+    root = root or spool_dir()
+    _ensure_dirs(root)
+    now = time.time()
+    candidates = []
+    for name in os.listdir(os.path.join(root, "pending")):
+        if not name.endswith(".json"):
+            continue
+        try:
+            job = _read_json(os.path.join(root, "pending", name))
+        except (OSError, ValueError):
+            continue  # otro worker lo acaba de mover, o aún se está escribiendo
+        if job.get("not_before", 0) <= now and job.get("account") not in busy_accounts:
+            candidates.append(job)
+
+    for job in sorted(candidates, key=lambda j: (j.get("not_before", 0), j.get("enqueued_at", 0))):
+        src = _path("pending", job["id"], root)
+        dst = _path("claimed", job["id"], root)
+        try:
+            # rename es atómico: solo un worker gana el trabajo
+            os.rename(src, dst)
+        except FileNotFoundError:
+            continue
+        job["claimed_at"] = time.time()
+        job["worker"] = f"{socket.gethostname()}:{os.getpid()}"
+        _write_json(dst, job)
+        return job
+    return None
+
+def complete(job: dict, result: dict | None = None, root: str | None = None) -> None:
+    """Escribe la marca de éxito y retira el trabajo de claimed/"""
+    root = root or spool_dir()
+    job = {**job, "done_at": time.time(), "result": result or {}}
+    job["latency"] = round(job["done_at"] - job["enqueued_at"], 3)
+    _write_json(_path("done", job["id"], root), job)
+    try:
+        os.remove(_path("claimed", job["id"], root))
+    except FileNotFoundError:
+        pass
+
+def fail(job: dict, error: Exception, max_attempts: int, backoff: float, max_backoff: float,
+         root: str | None = None) -> None:
+    """Devuelve el trabajo a pending/ con backoff exponencial, o lo pasa a failed/"""
+    root = root or spool_dir()
+    job = {**job, "attempts": job.get("attempts", 0) + 1, "last_error": f"{error.__class__.__name__}: {error}"}
+    if job["attempts"] >= max_attempts:
+        _write_json(_path("failed", job["id"], root), job)
+        log.error("[Spool] Trabajo %s descartado tras %d intentos: %s", job["id"], job["attempts"], job["last_error"])
+    else:
+        delay = min(max_backoff, backoff * (2 ** (job["attempts"] - 1)))
+        job["not_before"] = time.time() + delay * random.uniform(0.8, 1.2)
+        _write_json(_path("pending", job["id"], root), job)
+        log.warning("[Spool] Trabajo %s falló (intento %d/%d), reintento en %.0fs: %s",
+                    job["id"], job["attempts"], max_attempts, delay, job["last_error"])
+    os.remove(_path("claimed", job["id"], root))
+
+def _record_run(job: dict, root: str) -> None:
+    """Refleja el resultado en el catálogo de runs/ (utils.run_store) si el trabajo trae su run_dir"""
+    if not job.get("run_dir"):
+        return
+    if os.path.exists(_path("done", job["id"], root)):
+        status = "published"
+    elif os.path.exists(_path("failed", job["id"], root)):
+        status = "failed"
+    else:
+        return  # sigue pendiente de reintento
+    try:
+        from utils.run_store import update_run
+        update_run(job["run_dir"], status=status)
+    except Exception as e:
+        # El catálogo es informativo: nunca debe parar la publicación
+        log.debug("[Spool] No se pudo actualizar el catálogo de %s: %s", job["run_dir"], e)
+
+def requeue_stale(max_age: float, root: str | None = None) -> int:
+    """Devuelve a pending/ los trabajos reclamados por workers que murieron sin terminarlos"""
+    root = root or spool_dir()
+    _ensure_dirs(root)
+    now = time.time()
+    requeued = 0
+    for name in os.listdir(os.path.join(root, "claimed")):
+        path = os.path.join(root, "claimed", name)
+        try:
+            job = _read_json(path)
+        except (OSError, ValueError):
+            continue
+        if now - job.get("claimed_at", now) > max_age:
+            os.rename(path, _path("pending", job["id"], root))
+            requeued += 1
+            log.warning("[Spool] Trabajo %s recuperado de un worker caído (%s)", job["id"], job.get("worker"))
+    return requeued
+
+def jobs(states=STATES, root: str | None = None):
+    """Itera (estado, trabajo) sobre los trabajos del spool en los estados indicados"""
+    root = root or spool_dir()
+    for state in states:
+        folder = os.path.join(root, state)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if not name.endswith(".json"):
+                continue
+            try:
+                yield state, _read_json(os.path.join(folder, name))
+            except (OSError, ValueError):
+                continue  # movido por otro worker mientras listábamos
+
+def stats(root: str | None = None) -> dict:
+    """Profundidad de cada estado y latencias encolado→publicado de los trabajos terminados"""
+    root = root or spool_dir()
+    _ensure_dirs(root)
+    counts = {state: len([n for n in os.listdir(os.path.join(root, state)) if n.endswith(".json")])
+              for state in STATES}
+    latencies = []
+    for name in os.listdir(os.path.join(root, "done")):
+        try:
+            latencies.append(_read_json(os.path.join(root, "done", name))["latency"])
+        except (OSError, ValueError, KeyError):
+            continue
+    latencies.sort()
+    result = {"depth": counts}
+    if latencies:
+        result["latency"] = {
+            "count": len(latencies),
+            "p50": latencies[len(latencies) // 2],
+            "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            "max": latencies[-1],
+        }
+    return result
+
+def run_worker(once: bool = False, poll_interval: float | None = None, pool=None) -> int:
+    """
+    Procesa el spool publicando cada trabajo en la cuenta indicada por su clave 'account'.
+
+    Cada cuenta tiene su propio navegador reutilizado entre trabajos; los trabajos de
+    cuentas distintas se publican en paralelo.
+
+    Args:
+        once: si es True, termina cuando no quedan trabajos listos
+        pool: objeto con submit(account, video_path, caption) -> Future y close();
+              por defecto PublisherPool
+
+    Returns:
+        Número de trabajos publicados
+    """
+    root = spool_dir()
+    poll_interval = poll_interval if poll_interval is not None else float(os.getenv("PUBLISH_SPOOL_POLL", "5"))
+    max_attempts = int(os.getenv("PUBLISH_MAX_ATTEMPTS", "5"))
+    backoff = float(os.getenv("PUBLISH_BACKOFF", "30"))
+    max_backoff = float(os.getenv("PUBLISH_MAX_BACKOFF", "1800"))
+    claim_timeout = float(os.getenv("PUBLISH_SPOOL_CLAIM_TIMEOUT", "1800"))
+
+    if pool is None:
+        from utils.selenium_helper import PublisherPool
+        pool = PublisherPool()
+    # Un trabajo en curso por cuenta (cada cuenta tiene un solo navegador) y, en total, como
+    # mucho PUBLISH_SPOOL_INFLIGHT; por defecto, tantos como cuentas
+    max_inflight = int(os.getenv("PUBLISH_SPOOL_INFLIGHT", str(len(getattr(pool, "accounts", {})) or 1)))
+
+    published = 0
+    inflight: dict = {}
+    try:
+        while True:
+            requeue_stale(claim_timeout, root)
+            while len(inflight) < max_inflight:
+                busy = {j.get("account") for j in inflight.values()}
+                job = claim(root, busy_accounts=busy)
+                if job is None:
+                    break
+                if os.path.exists(_path("done", job["id"], root)):
+                    # Ya publicado por otro worker: solo retiramos el duplicado
+                    os.remove(_path("claimed", job["id"], root))
+                    continue
+                log.info("[Spool] Publicando %s en '%s' (intento %d)",
+                         job["id"], job.get("account") or "default", job.get("attempts", 0) + 1)
+                try:
+                    inflight[pool.submit(job.get("account"), job["video_path"], job["caption"])] = job
+                except KeyError as e:
+                    # Cuenta desconocida: reintentar no sirve de nada
+                    fail(job, e, 1, backoff, max_backoff, root)
+                    _record_run(job, root)
+
+            if not inflight:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            finished, _ = wait(list(inflight), timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                job = inflight.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    # retryable=False (p. ej. SendUnconfirmed): puede estar publicado, no se repite
+                    fail(job, e, max_attempts if getattr(e, "retryable", True) else 1,
+                         backoff, max_backoff, root)
+                    _record_run(job, root)
+                    continue
+                complete(job, result, root)
+                _record_run(job, root)
+                published += 1
+                log.info("[Spool] Trabajo %s publicado. Estado de la cola: %s", job["id"], stats(root))
+    finally:
+        pool.close()
+    return published
+
+if __name__ == "__main__":
+    from utils.helper import bootstrap
+
+    parser = argparse.ArgumentParser(description="Worker del spool de publicación en WhatsApp")
+    parser.add_argument("--once", action="store_true", help="Procesa lo pendiente y termina")
+    parser.add_argument("--stats", action="store_true", help="Muestra el estado de la cola y termina")
+    args = parser.parse_args()
+
+    bootstrap()
+    if args.stats:
+        print(json.dumps(stats(), indent=2))
+    else:
+        run_worker(once=args.once)
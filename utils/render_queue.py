@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cola de render compartida entre varias máquinas.
+
+Los trabajos (una instantánea de JobConfig) se dejan en un directorio de almacenamiento
+compartido y los workers de render de cualquier host los reclaman con un lease que
+renuevan con latidos mientras renderizan. Cada vídeo terminado se entrega al spool de
+publicación (utils.publish_spool), que consume un único nodo publicador. Estructura:
+
+    pending/<id>.json   trabajos esperando worker (o su próximo reintento)
+    leased/<id>.json    trabajos en render; cada latido renueva el lease (mtime del fichero)
+    done/<id>.json      trabajos renderizados y entregados al spool
+    failed/<id>.json    trabajos que agotaron los reintentos
+
+Un worker que muere deja de renovar su lease; cuando vence, cualquier otro worker
+devuelve el trabajo a pending/. Si un worker pierde su lease (p. ej. se quedó colgado
+más que RENDER_LEASE segundos), descarta su resultado en lugar de entregarlo.
+
+Requisitos del modo distribuido: RENDER_QUEUE_DIR, RUNS_DIR y PUBLISH_SPOOL_DIR en el
+almacenamiento compartido, montado en la misma ruta en todos los hosts, y relojes
+sincronizados (NTP), porque el vencimiento del lease es una hora absoluta.
+
+Uso:
+    python -m utils.render_queue             # worker de render continuo
+    python -m utils.render_queue --once      # renderiza lo pendiente y termina
+    python -m utils.render_queue --enqueue   # encola un trabajo con la configuración del entorno
+    python -m utils.render_queue --stats     # profundidad de la cola
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import random
+import logging
+import argparse
+import threading
+
+from utils.config import JobConfig
+from utils import run_store
+from utils import publish_spool
+from utils import call_policy, trace_helper
+from utils.publish_spool import _read_json, _write_json
+
+log = logging.getLogger(__name__)
+
+STATES = ("pending", "leased", "done", "failed")
+
+def queue_dir() -> str:
+    return os.getenv("RENDER_QUEUE_DIR", os.path.join("runs", "render_queue"))
+
+def _path(state: str, job_id: str, root: str | None = None) -> str:
+    return os.path.join(root or queue_dir(), state, f"{job_id}.json")
+
+def _ensure_dirs(root: str) -> None:
+    for state in STATES:
+        os.makedirs(os.path.join(root, state), exist_ok=True)
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def enqueue(cfg: JobConfig, job_id: str | None = None, publish_at: float | None = None,
+            root: str | None = None, **extra) -> str:
+    """
+    Añade un trabajo de render y devuelve su id.
+
+    Con job_id explícito (p. ej. uno por franja) la operación es idempotente: si el trabajo
+    ya está pendiente, en render o hecho, no se duplica; si falló, se vuelve a intentar.
+    publish_at (epoch) se pasa al spool como not_before del vídeo; extra viaja con el
+    trabajo hasta el spool (p. ej. slot).
+    """
+    root = root or queue_dir()
+    _ensure_dirs(root)
+    job_id = job_id or uuid.uuid4().hex[:16]
+    for state in ("pending", "leased", "done"):
+        if os.path.exists(_path(state, job_id, root)):
+            log.info("[RenderQueue] Trabajo %s ya está en '%s'; no se encola de nuevo", job_id, state)
+            return job_id
+    now = time.time()
+    _write_json(_path("pending", job_id, root), {
+        "id": job_id,
+        "config": cfg.to_dict(),
+        "publish_at": publish_at,
+        "enqueued_at": now,
+        "not_before": now,
+        "attempts": 0,
+        "last_error": None,
+        **extra,
+    })
+    try:
+        os.remove(_path("failed", job_id, root))
+    except FileNotFoundError:
+        pass
+    log.info("[RenderQueue] Trabajo %s encolado", job_id)
+    return job_id
+
+def claim(lease: float, worker: str | None = None, root: str | None = None) -> dict | None:
+    """Reclama atómicamente el trabajo pendiente más antiguo y le asigna un lease de `lease` s"""
+    root = root or queue_dir()
+    _ensure_dirs(root)
+    now = time.time()
+    candidates = []
+    for name in os.listdir(os.path.join(root, "pending")):
+        if not name.endswith(".json"):
+            continue
+        try:
+            job = _read_json(os.path.join(root, "pending", name))
+        except (OSError, ValueError):
+            continue  # otro worker lo acaba de mover, o aún se está escribiendo
+        if job.get("not_before", 0) <= now:
+            candidates.append(job)
+
+    for job in sorted(candidates, key=lambda j: (j.get("not_before", 0), j.get("enqueued_at", 0))):
+        dst = _path("leased", job["id"], root)
+        try:
+            # rename es atómico también en NFS: solo un worker gana el trabajo
+            os.rename(_path("pending", job["id"], root), dst)
+        except FileNotFoundError:
+            continue
+        job.update(worker=worker or worker_name(), lease_token=uuid.uuid4().hex,
+                   claimed_at=time.time(), lease=lease, lease_until=time.time() + lease)
+        _write_json(dst, job)
+        return job
+    return None
+
+def _lease_until(job: dict, path: str) -> float:
+    """Vencimiento del lease: el de la reclamación o el último latido (mtime), el más tardío"""
+    if "lease_until" not in job:
+        return float("inf")  # recién reclamado: claim aún no ha escrito el lease
+    return max(job.get("lease_until", 0), os.stat(path).st_mtime + job.get("lease", 0))
+
+def _holds(job: dict, root: str) -> dict | None:
+    """Trabajo en leased/ si el lease sigue siendo de este worker"""
+    try:
+        current = _read_json(_path("leased", job["id"], root))
+    except (OSError, ValueError):
+        return None
+    return current if current.get("lease_token") == job["lease_token"] else None
+
+def heartbeat(job: dict, lease: float, root: str | None = None) -> bool:
+    """
+    Renueva el lease; False si el trabajo ya no es de este worker.
+
+    El latido solo toca el mtime de leased/<id>.json (el lease dura `lease` s desde ahí) y
+    nunca reescribe el fichero: si requeue_expired se lo lleva entre la comprobación y la
+    renovación, utime falla con FileNotFoundError en lugar de recrear un lease obsoleto
+    junto al trabajo ya devuelto a pending/.
+    """
+    root = root or queue_dir()
+    if _holds(job, root) is None:
+        return False
+    now = time.time()
+    try:
+        os.utime(_path("leased", job["id"], root), (now, now))
+    except FileNotFoundError:
+        return False
+    return True
+
+class _Heartbeat:
+    """Renueva el lease en segundo plano cada lease/3 s mientras dura el bloque"""
+
+    def __init__(self, job: dict, lease: float, root: str):
+        self.job, self.lease, self.root = job, lease, root
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"lease-{job['id']}", daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.lease / 3):
+            try:
+                alive = heartbeat(self.job, self.lease, self.root)
+            except OSError as e:
+                log.warning("[RenderQueue] Latido fallido de %s: %s", self.job["id"], e)
+                continue
+            if not alive:
+                self.lost.set()
+                log.error("[RenderQueue] Lease de %s perdido: el resultado se descartará", self.job["id"])
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def complete(job: dict, result: dict, root: str | None = None) -> bool:
+    """Marca el trabajo como hecho si este worker aún tiene el lease"""
+    root = root or queue_dir()
+    if _holds(job, root) is None:
+        return False
+    job = {**job, "done_at": time.time(), "result": result}
+    job["latency"] = round(job["done_at"] - job["enqueued_at"], 3)
+    _write_json(_path("done", job["id"], root), job)
+    os.remove(_path("leased", job["id"], root))
+    return True
+
+def _retry_or_fail(job: dict, error: str, max_attempts: int, backoff: float, max_backoff: float,
+                   root: str) -> None:
+    job = {**job, "attempts": job.get("attempts", 0) + 1, "last_error": error}
+    for key in ("lease_token", "lease", "lease_until", "worker", "claimed_at"):
+        job.pop(key, None)
+    if job["attempts"] >= max_attempts:
+        job["failed_at"] = time.time()
+        _write_json(_path("failed", job["id"], root), job)
+        log.error("[RenderQueue] Trabajo %s descartado tras %d intentos: %s", job["id"], job["attempts"], error)
+    else:
+        delay = min(max_backoff, backoff * (2 ** (job["attempts"] - 1)))
+        job["not_before"] = time.time() + delay * random.uniform(0.8, 1.2)
+        _write_json(_path("pending", job["id"], root), job)
+        log.warning("[RenderQueue] Trabajo %s falló (intento %d/%d), reintento en %.0fs: %s",
+                    job["id"], job["attempts"], max_attempts, delay, error)
+
+def fail(job: dict, error: Exception, max_attempts: int, backoff: float, max_backoff: float,
+         root: str | None = None) -> bool:
+    """Devuelve el trabajo a pending/ con backoff, o a failed/, si este worker aún tiene el lease"""
+    root = root or queue_dir()
+    if _holds(job, root) is None:
+        return False
+    _retry_or_fail(job, f"{error.__class__.__name__}: {error}", max_attempts, backoff, max_backoff, root)
+    os.remove(_path("leased", job["id"], root))
+    return True
+
+def requeue_expired(max_attempts: int, backoff: float = 0, max_backoff: float = 0,
+                    root: str | None = None) -> int:
+    """Devuelve a pending/ (o a failed/) los trabajos cuyo lease venció: su worker murió o se colgó"""
+    root = root or queue_dir()
+    _ensure_dirs(root)
+    now = time.time()
+    requeued = 0
+    for name in os.listdir(os.path.join(root, "leased")):
+        path = os.path.join(root, "leased", name)
+        try:
+            job = _read_json(path)
+        except (OSError, ValueError):
+            continue
+        try:
+            if _lease_until(job, path) >= now:
+                continue
+        except FileNotFoundError:
+            continue
+        # Un solo worker gana la recuperación (rename atómico); el resto ve FileNotFoundError
+        expired = f"{path}.{os.getpid()}.expired"
+        try:
+            os.rename(path, expired)
+        except FileNotFoundError:
+            continue
+        if _lease_until(job, expired) >= time.time():
+            os.rename(expired, path)  # latió entre la lectura y el rename: sigue vivo
+            continue
+        _retry_or_fail(job, f"lease vencido ({job.get('worker')})", max_attempts, backoff, max_backoff, root)
+        os.remove(expired)
+        requeued += 1
+        log.warning("[RenderQueue] Trabajo %s recuperado de un worker caído (%s)", job["id"], job.get("worker"))
+    return requeued
+
+def jobs(states=STATES, root: str | None = None):
+    """Itera (estado, trabajo) sobre los trabajos de la cola en los estados indicados"""
+    root = root or queue_dir()
+    for state in states:
+        folder = os.path.join(root, state)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if not name.endswith(".json"):
+                continue
+            try:
+                yield state, _read_json(os.path.join(folder, name))
+            except (OSError, ValueError):
+                continue  # movido por otro worker mientras listábamos
+
+def stats(root: str | None = None) -> dict:
+    """Profundidad de cada estado y workers con trabajos en render"""
+    root = root or queue_dir()
+    _ensure_dirs(root)
+    depth = {state: len([n for n in os.listdir(os.path.join(root, state)) if n.endswith(".json")])
+             for state in STATES}
+    return {"depth": depth, "workers": sorted({j.get("worker") for _, j in jobs(("leased",), root)})}
+
+def render_job(job: dict) -> dict:
+    """Flujo completo hasta el vídeo de un trabajo de la cola (sin publicar)"""
+    from main import build_status
+
+    cfg = JobConfig.from_dict(job["config"])
+    run_store.enforce_retention()
+    run_dir = run_store.create_run(topic=cfg.web_search_topic or cfg.script_topic)
+    log.info("[RenderQueue] Renderizando %s en %s", job["id"], run_dir)
+    timings = {}
+    try:
+        with trace_helper.start(run_dir):
+            video_path, video_title = build_status(cfg, run_dir, draft=False, timings=timings)
+    except BaseException:
+        run_store.finish_run(run_dir, "failed", timings=timings)
+        raise
+    finally:
+        call_policy.save_latencies()
+    # 'queued': la retención no lo borra mientras espera al publicador
+    run_store.finish_run(run_dir, "queued", video_path=video_path, timings=timings)
+    return {"run_dir": os.path.abspath(run_dir), "video_path": video_path,
+            "video_title": video_title, "timings": timings, "account": cfg.whatsapp_account}
+
+def run_worker(once: bool = False, poll_interval: float | None = None, render=render_job) -> int:
+    """
+    Reclama y renderiza trabajos uno a uno; cada vídeo terminado se encola en el spool.
+
+    Para más capacidad, se arrancan más workers (en este host o en otros).
+
+    Returns:
+        Número de trabajos renderizados y entregados
+    """
+    root = queue_dir()
+    poll_interval = poll_interval if poll_interval is not None else float(os.getenv("RENDER_QUEUE_POLL", "5"))
+    lease = float(os.getenv("RENDER_LEASE", "120"))
+    max_attempts = int(os.getenv("RENDER_MAX_ATTEMPTS", "3"))
+    backoff = float(os.getenv("RENDER_BACKOFF", "60"))
+    max_backoff = float(os.getenv("RENDER_MAX_BACKOFF", "1800"))
+    me = worker_name()
+
+    rendered = 0
+    while True:
+        requeue_expired(max_attempts, backoff, max_backoff, root)
+        job = claim(lease, me, root)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        log.info("[RenderQueue] %s renderiza %s (intento %d)", me, job["id"], job.get("attempts", 0) + 1)
+        with _Heartbeat(job, lease, root) as beat:
+            try:
+                result = render(job)
+            except Exception as e:
+                if not fail(job, e, max_attempts, backoff, max_backoff, root):
+                    log.warning("[RenderQueue] %s falló tras perder su lease: %s", job["id"], e)
+                continue
+        if beat.lost.is_set() or _holds(job, root) is None:
+            # Otro worker ya lo está rehaciendo: entregar este vídeo podría publicarlo dos veces
+            if result.get("run_dir"):
+                run_store.update_run(result["run_dir"], status="failed")
+            continue
+        try:
+            result["publish_job"] = publish_spool.enqueue(
+                result["video_path"], result["video_title"], not_before=job.get("publish_at"),
+                account=result.get("account"), run_dir=result.get("run_dir"),
+                **{k: job[k] for k in ("slot",) if k in job},
+            )
+        except Exception as e:
+            fail(job, e, max_attempts, backoff, max_backoff, root)
+            continue
+        complete(job, result, root)
+        rendered += 1
+        log.info("[RenderQueue] Trabajo %s entregado al spool (%s). Cola: %s",
+                 job["id"], result["publish_job"], stats(root)["depth"])
+    return rendered
+
+if __name__ == "__main__":
+    from utils.helper import bootstrap
+
+    parser = argparse.ArgumentParser(description="Worker de render de la cola compartida")
+    parser.add_argument("--once", action="store_true", help="Renderiza lo pendiente y termina")
+    parser.add_argument("--enqueue", action="store_true", help="Encola un trabajo con la configuración del entorno")
+    parser.add_argument("--stats", action="store_true", help="Muestra el estado de la cola y termina")
+    args = parser.parse_args()
+
+    bootstrap()
+    if args.stats:
+        print(json.dumps(stats(), indent=2))
+    elif args.enqueue:
+        print(enqueue(JobConfig.from_env()))
+    else:
+        import openai
+        from utils import openai_scheduler
+
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        openai_scheduler.install_hooks()
+        run_worker(once=args.once)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Almacén de ejecuciones: carpetas runs/run_*, catálogo, retención y deduplicación.
+
+    runs/run_<fecha>_<hora>_<sufijo>/   una carpeta por ejecución (id sin colisiones)
+    runs/catalog.sqlite                 catálogo: tema, estado, tamaño, tiempos, vídeo
+    runs/.blobs/<aa>/<sha256>           artefactos únicos; las ejecuciones los enlazan (hardlink)
+
+La retención borra las ejecuciones terminadas más antiguas por edad (RUNS_MAX_AGE_DAYS)
+y por cuota de disco (RUNS_MAX_MB). Nunca borra ejecuciones en curso ni vídeos que
+esperan publicación en el spool. Los ficheros deduplicados se comparten por hardlink, así que
+el pipeline nunca debe modificarlos in situ (siempre escribe ficheros nuevos).
+
+Uso:
+    python -m utils.run_store --list    # últimas ejecuciones del catálogo
+    python -m utils.run_store --prune   # aplica la retención y muestra el uso de disco
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import logging
+import argparse
+import datetime
+from contextlib import closing
+
+log = logging.getLogger(__name__)
+
+DEFAULT_ROOT = "runs"
+BLOBS = ".blobs"
+CATALOG = "catalog.sqlite"
+
+# Estados en los que la carpeta sigue haciendo falta
+ACTIVE_STATES = ("running", "queued")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id          TEXT PRIMARY KEY,
+    path        TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    finished_at REAL,
+    status      TEXT NOT NULL,
+    topic       TEXT,
+    video_path  TEXT,
+    bytes       INTEGER DEFAULT 0,
+    timings     TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created_at);
+"""
+
+def runs_root() -> str:
+    return os.getenv("RUNS_DIR", DEFAULT_ROOT)
+
+def _connect(root: str) -> sqlite3.Connection:
+    os.makedirs(root, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(root, CATALOG), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _root_of(run_dir: str) -> str:
+    return os.path.dirname(os.path.abspath(run_dir))
+
+def new_run_id() -> str:
+    """Id legible y ordenable por fecha, con sufijo aleatorio para que dos arranques en el mismo segundo no choquen"""
+    ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"run_{ts}_{uuid.uuid4().hex[:6]}"
+
+def create_run(root: str | None = None, topic: str | None = None) -> str:
+    """Crea la carpeta de una ejecución nueva, la registra como 'running' y devuelve su ruta"""
+    root = root or runs_root()
+    os.makedirs(root, exist_ok=True)
+    while True:
+        run_id = new_run_id()
+        path = os.path.join(root, run_id)
+        try:
+            os.makedirs(path)  # sin exist_ok: falla si otro proceso ganó el mismo id
+            break
+        except FileExistsError:
+            continue
+    with closing(_connect(root)) as conn, conn:
+        conn.execute("INSERT INTO runs (id, path, created_at, status, topic) VALUES (?, ?, ?, ?, ?)",
+                     (run_id, os.path.abspath(path), time.time(), "running", topic))
+    return path
+
+def update_run(run_dir: str, **fields) -> None:
+    """Actualiza campos del catálogo de una ejecución (status, topic, video_path, timings...)"""
+    if not fields:
+        return
+    if "timings" in fields and not isinstance(fields["timings"], (str, type(None))):
+        fields["timings"] = json.dumps(fields["timings"])
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    with closing(_connect(_root_of(run_dir))) as conn, conn:
+        conn.execute(f"UPDATE runs SET {cols} WHERE id = ?", (*fields.values(), os.path.basename(os.path.normpath(run_dir))))
+
+def finish_run(run_dir: str, status: str, dedupe: bool | None = None, **fields) -> None:
+    """
+    Cierra una ejecución: deduplica sus artefactos, mide su tamaño y guarda el estado final.
+
+    status: 'rendered', 'draft', 'queued' (esperando al spool), 'published' o 'failed'
+    """
+    if dedupe is None:
+        dedupe = os.getenv("RUNS_DEDUPE", "true").lower() == "true"
+    if dedupe:
+        dedupe_run(run_dir)
+    update_run(run_dir, status=status, finished_at=time.time(),
+               bytes=run_bytes(run_dir), **fields)
+
+def list_runs(root: str | None = None, limit: int = 20) -> list[dict]:
+    with closing(_connect(root or runs_root())) as conn:
+        rows = conn.execute("SELECT * FROM runs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+    return [dict(r) for r in rows]
+
+# ---------------------------------------------------------------------------
+# Deduplicación por contenido
+# ---------------------------------------------------------------------------
+def _digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _blob_path(root: str, digest: str) -> str:
+    return os.path.join(root, BLOBS, digest[:2], digest)
+
+def _link_to_blob(path: str, root: str) -> bool:
+    """Sustituye path por un hardlink a su blob (creándolo si es nuevo). Devuelve True si ahorró espacio"""
+    blob = _blob_path(root, _digest(path))
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    if not os.path.exists(blob):
+        try:
+            os.link(path, blob)
+        except FileExistsError:
+            pass  # otro proceso lo acaba de crear: seguimos y enlazamos al suyo
+        else:
+            return False
+    if os.path.samefile(path, blob):
+        return False
+    tmp = f"{path}.{os.getpid()}.tmp"
+    os.link(blob, tmp)
+    os.replace(tmp, path)  # atómico: el fichero nunca desaparece
+    return True
+
+def dedupe_run(run_dir: str, min_bytes: int | None = None) -> int:
+    """Enlaza contra .blobs los ficheros de la ejecución a partir de cierto tamaño; devuelve los bytes ahorrados"""
+    root = _root_of(run_dir)
+    min_bytes = min_bytes if min_bytes is not None else int(os.getenv("RUNS_DEDUPE_MIN_KB", "64")) * 1024
+    saved = 0
+    for dirpath, _, files in os.walk(run_dir):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path) or name.endswith((".tmp", ".sqlite")):
+                continue
+            size = os.path.getsize(path)
+            if size < min_bytes:
+                continue
+            try:
+                if _link_to_blob(path, root):
+                    saved += size
+            except OSError as e:
+                # p. ej. sistema de ficheros sin hardlinks: la deduplicación es solo una optimización
+                log.debug("[RunStore] No se pudo deduplicar %s: %s", path, e)
+    if saved:
+        log.info("[RunStore] %s: %.1f MB deduplicados", os.path.basename(run_dir), saved / (1024 * 1024))
+    return saved
+
+def import_file(src: str, dest: str, root: str | None = None) -> str:
+    """Copia src a dest compartiendo el contenido vía .blobs (p. ej. el audio personalizado de cada ejecución)"""
+    root = root or _root_of(os.path.dirname(os.path.abspath(dest)))
+    blob = _blob_path(root, _digest(src))
+    try:
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp = f"{blob}.{os.getpid()}.tmp"
+            shutil.copy2(src, tmp)
+            os.replace(tmp, blob)
+        os.link(blob, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+    return dest
+
+# ---------------------------------------------------------------------------
+# Retención
+# ---------------------------------------------------------------------------
+def _iter_stats(folder: str):
+    for dirpath, _, files in os.walk(folder):
+        for name in files:
+            try:
+                yield os.lstat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+
+def run_bytes(run_dir: str) -> int:
+    """Tamaño aparente de una ejecución (los ficheros compartidos cuentan entero)"""
+    return sum(st.st_size for st in _iter_stats(run_dir))
+
+def disk_usage(root: str | None = None) -> int:
+    """Uso real de disco del almacén, contando una sola vez cada inodo"""
+    root = root or runs_root()
+    seen, total = set(), 0
+    for st in _iter_stats(root):
+        if (st.st_dev, st.st_ino) not in seen:
+            seen.add((st.st_dev, st.st_ino))
+            total += st.st_size
+    return total
+
+def _run_refs(paths) -> dict:
+    """
+    Enlaces de cada inodo fuera de las ejecuciones: {inodo: [enlaces desde ejecuciones, enlaces externos]}.
+    Un enlace externo es el propio blob (que se recoge después); más de uno (p. ej. la
+    caché de segmentos) significa que borrar las ejecuciones no libera ese espacio.
+    """
+    refs: dict = {}
+    for path in paths:
+        for st in _iter_stats(path):
+            entry = refs.setdefault((st.st_dev, st.st_ino), [0, st.st_nlink])
+            entry[0] += 1
+    for entry in refs.values():
+        entry[1] -= entry[0]
+    return refs
+
+def _adopt_legacy(conn: sqlite3.Connection, root: str) -> None:
+    """Registra carpetas run_* anteriores al catálogo para que la retención también las cubra"""
+    known = {r["id"] for r in conn.execute("SELECT id FROM runs")}
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith("run_") and name not in known and os.path.isdir(path):
+            mtime = os.path.getmtime(path)
+            conn.execute("INSERT INTO runs (id, path, created_at, finished_at, status) VALUES (?, ?, ?, ?, ?)",
+                         (name, os.path.abspath(path), mtime, mtime, "legacy"))
+
+def _spool_videos() -> set[str]:
+    """Vídeos referenciados por trabajos del spool aún sin publicar"""
+    from utils.publish_spool import jobs
+    return {os.path.abspath(job["video_path"]) for _, job in jobs(("pending", "claimed"))
+            if job.get("video_path")}
+
+def gc_blobs(root: str | None = None) -> int:
+    """Elimina los blobs que ya no enlaza ninguna ejecución"""
+    removed = 0
+    blobs = os.path.join(root or runs_root(), BLOBS)
+    for dirpath, _, files in os.walk(blobs):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            if os.stat(path).st_nlink <= 1:
+                os.remove(path)
+                removed += 1
+        if dirpath != blobs and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return removed
+
+def enforce_retention(root: str | None = None, max_age_days: float | None = None,
+                      max_bytes: int | None = None) -> list[str]:
+    """
+    Borra ejecuciones terminadas, de la más antigua a la más nueva, mientras superen
+    la edad máxima o el almacén supere la cuota. 0 desactiva cada límite.
+
+    Returns:
+        Ids de las ejecuciones eliminadas
+    """
+    root = root or runs_root()
+    if max_age_days is None:
+        max_age_days = float(os.getenv("RUNS_MAX_AGE_DAYS", "0"))
+    if max_bytes is None:
+        max_bytes = int(float(os.getenv("RUNS_MAX_MB", "0")) * 1024 * 1024)
+    if max_age_days <= 0 and max_bytes <= 0:
+        return []
+
+    removed = []
+    with closing(_connect(root)) as conn, conn:
+        _adopt_legacy(conn, root)
+        # Una ejecución 'running' de hace más de RUNS_STALE_HOURS es de un proceso que murió
+        stale = time.time() - float(os.getenv("RUNS_STALE_HOURS", "24")) * 3600
+        rows = conn.execute(
+            f"SELECT id, path, created_at FROM runs WHERE status NOT IN ({','.join('?' * len(ACTIVE_STATES))}) "
+            "OR (status = 'running' AND created_at < ?) ORDER BY created_at", (*ACTIVE_STATES, stale)).fetchall()
+        protected = _spool_videos()
+        usage = disk_usage(root) if max_bytes > 0 else 0
+        # Un inodo compartido solo se libera cuando lo suelta la última ejecución (su blob se recoge al final)
+        refs = _run_refs(r["path"] for r in conn.execute("SELECT path FROM runs")) if max_bytes > 0 else {}
+        cutoff = time.time() - max_age_days * 86400
+
+        for row in rows:
+            too_old = max_age_days > 0 and row["created_at"] < cutoff
+            over_quota = max_bytes > 0 and usage > max_bytes
+            if not (too_old or over_quota):
+                break  # ordenadas por antigüedad: las siguientes tampoco cumplen
+            path = row["path"]
+            if any(v.startswith(os.path.abspath(path) + os.sep) for v in protected):
+                continue
+            for st in _iter_stats(path):
+                entry = refs.get((st.st_dev, st.st_ino), [1, 0])
+                entry[0] -= 1
+                if entry[0] <= 0 and entry[1] <= 1:
+                    usage -= st.st_size
+            shutil.rmtree(path, ignore_errors=True)
+            conn.execute("DELETE FROM runs WHERE id = ?", (row["id"],))
+            removed.append(row["id"])
+
+    if removed:
+        blobs = gc_blobs(root)
+        log.info("[RunStore] %d ejecuciones eliminadas por retención (%d blobs huérfanos); uso actual %.0f MB",
+                 len(removed), blobs, disk_usage(root) / (1024 * 1024))
+    return removed
+
+if __name__ == "__main__":
+    from utils.helper import bootstrap
+
+    parser = argparse.ArgumentParser(description="Catálogo y retención de runs/")
+    parser.add_argument("--list", action="store_true", help="Muestra las últimas ejecuciones")
+    parser.add_argument("--prune", action="store_true", help="Aplica RUNS_MAX_AGE_DAYS / RUNS_MAX_MB")
+    args = parser.parse_args()
+
+    bootstrap()
+    if args.prune:
+        print(json.dumps({"removed": enforce_retention(), "bytes": disk_usage()}, indent=2))
+    else:
+        print(json.dumps(list_runs(), indent=2, default=str))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché de segmentos de vídeo ya codificados.
+
+Cada segmento se guarda bajo un hash de todo lo que determina sus píxeles y su
+codificación (imagen normalizada, textos, fuente, duración, perfil). Al volver a
+renderizar solo se codifican los segmentos que cambiaron; el resto se reutiliza
+por copia de flujo. Los aciertos se enlazan en el directorio de la ejecución (checkout)
+antes de usarlos, y la poda se hace después del multiplexado.
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+
+log = logging.getLogger(__name__)
+
+def cache_dir() -> str:
+    return os.getenv("SEGMENT_CACHE_DIR", os.path.join("runs", ".segment_cache"))
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 del contenido de un fichero"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def segment_key(image_path: str, **params) -> str:
+    """Clave de un segmento: contenido de la imagen + parámetros de texto, fuente y codificación"""
+    if hasattr(image_path, "wait"):
+        image_path = image_path.wait()  # ImageArtifact: el fichero puede estar aún escribiéndose
+    payload = json.dumps({"image": file_digest(image_path), **params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _entry_path(key: str) -> str:
+    return os.path.join(cache_dir(), key[:2], f"{key}.mp4")
+
+def lookup(key: str) -> str | None:
+    """Devuelve la ruta del segmento cacheado o None si no existe"""
+    path = _entry_path(key)
+    if os.path.isfile(path):
+        # Actualiza la fecha de acceso para la poda por antigüedad
+        os.utime(path, None)
+        return path
+    return None
+
+def checkout(key: str, dest: str) -> str | None:
+    """
+    Enlaza (hardlink, o copia si no se puede) el segmento cacheado en dest, dentro de la
+    ejecución: así una poda de la caché, de este trabajo o de otro a la vez, no puede
+    borrar un segmento que el render aún va a concatenar. Devuelve dest, o None si no está.
+    """
+    path = lookup(key)
+    if path is None:
+        return None
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    try:
+        if os.path.exists(dest) and os.path.samefile(path, dest):
+            return dest  # ya enlazado (re-render en la misma ejecución)
+        try:
+            os.link(path, tmp)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copy2(path, tmp)
+    except FileNotFoundError:
+        return None  # podado entre lookup() y el enlace: se codifica de nuevo
+    os.replace(tmp, dest)
+    return dest
+
+def store(key: str, segment_path: str) -> str:
+    """Guarda un segmento recién codificado en la caché (escritura atómica)"""
+    dest = _entry_path(key)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    try:
+        os.link(segment_path, tmp)
+    except OSError:
+        shutil.copy2(segment_path, tmp)
+    os.replace(tmp, dest)
+    return dest
+
+def prune(max_bytes: int) -> int:
+    """Elimina los segmentos menos usados hasta dejar la caché por debajo de max_bytes"""
+    root = cache_dir()
+    if max_bytes <= 0 or not os.path.isdir(root):
+        return 0
+    entries = []
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue  # otro trabajo podando a la vez
+            entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    if removed:
+        log.info("[SegmentCache] %d segmentos eliminados (caché en %.0f MB)", removed, total / (1024 * 1024))
+    return removed
@@ -3,6 +3,9 @@
 import os
 import time
 import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -10,38 +13,188 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import (
+    TimeoutException, WebDriverException, NoSuchElementException, StaleElementReferenceException
+)
 from dotenv import load_dotenv
+from utils import trace_helper
+
+try:
+    import psutil  # opcional: contabilidad de CPU/memoria del navegador
+except ImportError:
+    psutil = None
 
 load_dotenv()
 
 # ---------------------------------------------------
 # CONFIGURACIÓN DE PERFILES
 # ---------------------------------------------------
-PROFILE_DIR = Path(os.getenv("WHATSAPP_PROFILE_DIR"))
+PROFILE_DIR = Path(os.getenv("WHATSAPP_PROFILE_DIR", "selenium_profile"))
 PROFILE_DIR.mkdir(exist_ok=True)  # se crea si no existe
 
+# Cuentas adicionales, cada una con su propio perfil de Chrome:
+# WHATSAPP_ACCOUNTS="marca_a=/ruta/perfil_a,marca_b=/ruta/perfil_b"
+DEFAULT_ACCOUNT = "default"
+
+def load_accounts() -> dict[str, Path]:
+    """Devuelve {cuenta: directorio de perfil}; la cuenta 'default' usa WHATSAPP_PROFILE_DIR"""
+    accounts = {DEFAULT_ACCOUNT: PROFILE_DIR}
+    for item in os.getenv("WHATSAPP_ACCOUNTS", "").split(","):
+        if not item.strip():
+            continue
+        name, _, path = item.partition("=")
+        if not name.strip() or not path.strip():
+            raise ValueError(f"Entrada inválida en WHATSAPP_ACCOUNTS: {item!r} (formato cuenta=ruta)")
+        accounts[name.strip()] = Path(path.strip()).expanduser()
+    return accounts
+
 CHROMEDRIVER_PATH = os.getenv("CHROMEDRIVER_PATH")  # opcionalmente pon tu ruta
 
+# URL de WhatsApp Web (se puede apuntar a la réplica local de tests/whatsapp_standin.py)
+WHATSAPP_URL = os.getenv("WHATSAPP_URL", "https://web.whatsapp.com")
+
+# Selectores de WhatsApp Web usados en el flujo de publicación
+SELECTORS = {
+    "logged_in": "button[aria-label='Chats'][data-navbar-item-selected='true']",
+    "navbar": "button[aria-label='Chats']",
+    "status_tab": "button[aria-label='Estados']",
+    "add_status": "button[aria-label='Add Status']",
+    "media_item": "li[data-animate-dropdown-item] span[data-icon='media-refreshed']",
+    "file_input": "input[type='file']",
+    "preview": "video",
+    "progress": "[role='progressbar']",
+    "caption": "div[contenteditable='true'][aria-label='Añade un comentario']",
+    "send": "div[role='button'][aria-label='Enviar']",
+    "pending": "span[data-icon='msg-time']",
+}
+
+# Modo ligero: Chrome sin imágenes, fuentes ni servicios en segundo plano
+LEAN_CHROME = os.getenv("WHATSAPP_LEAN_CHROME", "false").lower() == "true"
+
+# Recursos que no hacen falta para publicar (la vista previa usa blob: y no se bloquea)
+LEAN_BLOCKED_URLS = [
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp",
+    "*.mp3", "*.ogg",
+]
+
+LEAN_ARGS = [
+    "--disable-background-networking",
+    "--disable-extensions",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-notifications",
+    "--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication",
+    "--blink-settings=imagesEnabled=false",
+    "--mute-audio",
+    "--no-first-run",
+    "--no-default-browser-check",
+]
+
 # -------------------------------------------------------------------
-# Función para crear un ChromeDriver (mantenida exactamente como en el original)
+# Función para crear un ChromeDriver
 # -------------------------------------------------------------------
-def _mk_driver(headless: bool) -> webdriver.Chrome:
+def _mk_driver(headless: bool, lean: bool | None = None, profile_dir: Path | None = None) -> webdriver.Chrome:
+    lean = LEAN_CHROME if lean is None else lean
+    profile_dir = Path(profile_dir or PROFILE_DIR)
+    profile_dir.mkdir(parents=True, exist_ok=True)
     opts = Options()
     if headless:
         opts.add_argument("--headless=new")
         opts.add_argument("--disable-gpu")
     # usamos un profile propio para no tocar tu Chrome de siempre
-    opts.add_argument(f"--user-data-dir={PROFILE_DIR}")
+    opts.add_argument(f"--user-data-dir={profile_dir}")
     opts.add_argument("--no-sandbox")
     opts.add_experimental_option("excludeSwitches", ["enable-automation"])
     opts.add_experimental_option("useAutomationExtension", False)
+    if lean:
+        # Solo flags de línea de comandos: nada se persiste en el perfil compartido
+        for arg in LEAN_ARGS:
+            opts.add_argument(arg)
+        opts.add_argument(f"--window-size={os.getenv('WHATSAPP_WINDOW_SIZE', '1000,800')}")
+        opts.page_load_strategy = "eager"
 
     if CHROMEDRIVER_PATH:
         svc = Service(CHROMEDRIVER_PATH)
-        return webdriver.Chrome(service=svc, options=opts)
+        driver = webdriver.Chrome(service=svc, options=opts)
     else:
-        return webdriver.Chrome(options=opts)
+        driver = webdriver.Chrome(options=opts)
+
+    if lean:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+    return driver
+
+# -------------------------------------------------------------------
+# Contabilidad de recursos del árbol de procesos del navegador
+# -------------------------------------------------------------------
+class _ResourceMonitor:
+    """
+    Muestrea en segundo plano el árbol de procesos de chromedriver/Chrome y acumula
+    el tiempo de CPU consumido y el pico de memoria residente durante un bloque.
+
+    Requiere psutil; sin él, el resultado queda vacío.
+    """
+
+    def __init__(self, pid_fn, interval: float = 0.5):
+        self._pid_fn = pid_fn
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._cpu_start: dict[int, float] = {}
+        self._cpu_last: dict[int, float] = {}
+        self._peak_rss = 0
+        self._baseline_taken = False
+        self.result: dict[str, float] = {}
+
+    def _tree(self):
+        pid = self._pid_fn()
+        if not pid:
+            return []
+        try:
+            root = psutil.Process(pid)
+            return [root] + root.children(recursive=True)
+        except psutil.Error:
+            return []
+
+    def _sample(self) -> None:
+        rss = 0
+        for proc in self._tree():
+            try:
+                ct = proc.cpu_times()
+                rss += proc.memory_info().rss
+            except psutil.Error:
+                continue
+            self._cpu_last[proc.pid] = ct.user + ct.system
+            # Procesos que ya existían al empezar: solo cuenta su CPU a partir de ahí
+            self._cpu_start.setdefault(proc.pid, 0.0 if self._baseline_taken else self._cpu_last[proc.pid])
+        self._peak_rss = max(self._peak_rss, rss)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self._interval):
+            self._sample()
+
+    def __enter__(self):
+        if psutil is not None:
+            self._sample()
+            self._baseline_taken = True
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+            cpu = sum(self._cpu_last[pid] - self._cpu_start.get(pid, 0.0) for pid in self._cpu_last)
+            self.result = {
+                "cpu_seconds": round(cpu, 2),
+                "peak_rss_mb": round(self._peak_rss / (1024 * 1024), 1),
+                "processes": len(self._cpu_last),
+            }
+        return False
 
 # -------------------------------------------------------------------
 # Comprobar si está logueado (función exacta del test_publish.py)
@@ -49,29 +202,18 @@ def _mk_driver(headless: bool) -> webdriver.Chrome:
 def is_logged_in(driver):
     """Comprueba si el botón Chats está seleccionado"""
     try:
-        btn = driver.find_element(By.CSS_SELECTOR,
-            "button[aria-label='Chats'][data-navbar-item-selected='true']")
+        btn = driver.find_element(By.CSS_SELECTOR, SELECTORS["logged_in"])
         return btn.is_displayed()
     except:
         return False
 
 # -------------------------------------------------------------------
-# Función principal de publicación (interfaz compatible con main.py)
+# Sesión: headless si ya hay login; si no, UI visible para escanear el QR
 # -------------------------------------------------------------------
-def publish(video_path: str, caption: str) -> None:
-    """Publica un video como estado en WhatsApp Web.
-    
-    Esta función mantiene la lógica exacta de test_publish.py que funciona correctamente.
-    """
-    video_abs = os.path.abspath(video_path)
-    
-    if not os.path.isfile(video_abs):
-        logging.error("El video no existe en %s", video_abs)
-        exit(1)
-    
-    # 1️⃣ Intento headless para validar sesión
-    driver = _mk_driver(headless=True)
-    driver.get("https://web.whatsapp.com")
+def _open_session(timeout: int = 60, profile_dir: Path | None = None):
+    """Abre Chrome con el perfil, valida la sesión y devuelve (driver, wait)"""
+    driver = _mk_driver(headless=True, profile_dir=profile_dir)
+    driver.get(WHATSAPP_URL)
     wait = WebDriverWait(driver, 15)
     try:
         logging.info("🔍 Comprobando sesión en headless…")
@@ -81,95 +223,384 @@ def publish(video_path: str, caption: str) -> None:
         # Si no está logueado, pasar a UI visible
         logging.info("⚠️ No logueado. Abriendo UI para escanear QR…")
         driver.quit()
-        driver = _mk_driver(headless=False)
-        driver.get("https://web.whatsapp.com")
-        wait = WebDriverWait(driver, 60)
+        driver = _mk_driver(headless=False, profile_dir=profile_dir)
+        driver.get(WHATSAPP_URL)
+        wait = WebDriverWait(driver, timeout)
         logging.info("🔍 Espera QR y login en UI…")
         wait.until(lambda d: is_logged_in(d))
         logging.info("✅ Login completado en UI.")
-        time.sleep(2)
+    return driver, wait
 
+def _session_alive(driver) -> bool:
+    """Comprueba que el navegador responde y que la barra de navegación sigue ahí"""
     try:
-        # 2️⃣ Ir a Estados
+        driver.current_window_handle
+        return bool(driver.find_elements(By.CSS_SELECTOR, SELECTORS["navbar"]))
+    except WebDriverException:
+        return False
+
+class SendUnconfirmed(RuntimeError):
+    """
+    Falló algo después de pulsar Enviar: el estado puede haberse publicado ya, así que
+    ni publish() ni el spool deben repetirlo (se revisa a mano).
+    """
+    retryable = False
+
+class _StepTimer:
+    """Registra la duración de cada paso de la publicación"""
+
+    def __init__(self):
+        self.timings: dict[str, float] = {}
+
+    @contextmanager
+    def step(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            with trace_helper.span(f"publish.{name}"):
+                yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - t0, 3)
+
+def _timeouts() -> dict[str, float]:
+    """Timeouts configurables: paso normal, subida del vídeo y confirmación de envío"""
+    return {
+        "step": float(os.getenv("PUBLISH_STEP_TIMEOUT", "15")),
+        "upload": float(os.getenv("PUBLISH_UPLOAD_TIMEOUT", "120")),
+        "sent": float(os.getenv("PUBLISH_SENT_TIMEOUT", "60")),
+    }
+
+def _preview_ready(driver) -> bool:
+    """El vídeo de la vista previa tiene datos suficientes para reproducirse"""
+    return driver.execute_script(
+        "const v = document.querySelector(arguments[0]);"
+        "return !!v && v.readyState >= 2;",
+        SELECTORS["preview"],
+    )
+
+def _upload_finished(driver) -> bool:
+    """No queda ninguna barra de progreso de subida visible"""
+    return not any(el.is_displayed() for el in driver.find_elements(By.CSS_SELECTOR, SELECTORS["progress"]))
+
+def _send_enabled(driver):
+    """Devuelve el botón Enviar cuando está visible y habilitado"""
+    for el in driver.find_elements(By.CSS_SELECTOR, SELECTORS["send"]):
+        if el.is_displayed() and el.get_attribute("aria-disabled") != "true":
+            return el
+    return False
+
+def _watch_pending(driver) -> None:
+    """
+    Justo antes de pulsar Enviar: un MutationObserver anota en la página si aparece un estado
+    pendiente (icono de reloj) nuevo, aunque dure menos que el intervalo de sondeo.
+    """
+    driver.execute_script(
+        "const sel = arguments[0];"
+        "const count = () => document.querySelectorAll(sel).length;"
+        "if (window.__statusSend) window.__statusSend.observer.disconnect();"
+        "const w = window.__statusSend = {baseline: count(), seen: false};"
+        "w.observer = new MutationObserver(() => { if (count() > w.baseline) w.seen = true; });"
+        "w.observer.observe(document.body, {subtree: true, childList: true, attributes: true,"
+        "                                   attributeFilter: ['data-icon']});",
+        SELECTORS["pending"],
+    )
+
+def _sent_confirmed(driver) -> bool:
+    """
+    Prueba positiva del envío: el editor se ha cerrado, el estado nuevo llegó a aparecer como
+    pendiente (visto por _watch_pending) y los pendientes han vuelto a los de antes del clic
+    """
+    if any(el.is_displayed() for el in driver.find_elements(By.CSS_SELECTOR, SELECTORS["send"])):
+        return False
+    state = driver.execute_script(
+        "const w = window.__statusSend;"
+        "return w ? {seen: w.seen, baseline: w.baseline,"
+        "            pending: document.querySelectorAll(arguments[0]).length} : null;",
+        SELECTORS["pending"],
+    )
+    return bool(state) and state["seen"] and state["pending"] <= state["baseline"]
+
+def _bmp(text: str) -> str:
+    """Solo los caracteres del plano básico: ChromeDriver no puede teclear el resto (la mayoría de emojis)"""
+    return "".join(c for c in text if ord(c) <= 0xFFFF)
+
+def _publish_steps(driver, video_abs: str, caption: str) -> dict[str, float]:
+    """
+    Secuencia de WhatsApp Web para publicar un estado con vídeo.
+
+    Cada paso espera a una condición explícita del DOM en lugar de a un tiempo fijo.
+    Devuelve la duración de cada paso en segundos.
+    """
+    limits = _timeouts()
+    ignored = (NoSuchElementException, StaleElementReferenceException)
+    wait = WebDriverWait(driver, limits["step"], ignored_exceptions=ignored)
+    upload_wait = WebDriverWait(driver, limits["upload"], poll_frequency=0.25, ignored_exceptions=ignored)
+    sent_wait = WebDriverWait(driver, limits["sent"], poll_frequency=0.25, ignored_exceptions=ignored)
+    timer = _StepTimer()
+
+    # 2️⃣ Ir a Estados
+    with timer.step("open_status"):
         logging.info("▶️ Abriendo Estados...")
-        wait.until(EC.element_to_be_clickable(
-            (By.CSS_SELECTOR, "button[aria-label='Estados']")
-        )).click()
-        time.sleep(2)
+        wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, SELECTORS["status_tab"]))).click()
 
-        # 3️⃣ Nuevo estado
+    # 3️⃣ Nuevo estado
+    with timer.step("new_status"):
         logging.info("▶️ Nuevo estado...")
-        wait.until(EC.element_to_be_clickable(
-            (By.CSS_SELECTOR, "button[aria-label='Add Status']")
-        )).click()
-        time.sleep(2)
+        wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, SELECTORS["add_status"]))).click()
 
-        # 4️⃣ Seleccionar Fotos y Videos
+    # 4️⃣ Seleccionar Fotos y Videos
+    with timer.step("select_media"):
         logging.info("▶️ Seleccionando Fotos y Videos...")
-        wait.until(EC.element_to_be_clickable(
-            (By.CSS_SELECTOR, "li[data-animate-dropdown-item] span[data-icon='media-refreshed']")
-        )).click()
-        time.sleep(2)
+        wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, SELECTORS["media_item"]))).click()
 
-        # 5️⃣ Subir video
+    # 5️⃣ Subir video y esperar a que la vista previa esté lista y la subida termine
+    with timer.step("upload"):
         logging.info(f"▶️ Subiendo video: {video_abs}")
-        input_el = wait.until(EC.presence_of_element_located(
-            (By.CSS_SELECTOR, "input[type='file']")
-        ))
+        input_el = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, SELECTORS["file_input"])))
         input_el.send_keys(video_abs)
-        time.sleep(10)  # Tiempo crucial para la carga del video
-
-        # 6️⃣ Preview y caption
         logging.info("🔎 Esperando preview de vídeo...")
-        wait.until(EC.presence_of_element_located(
-            (By.CSS_SELECTOR, "video")
-        ))
-        time.sleep(1)
-        
+        upload_wait.until(_preview_ready)
+        upload_wait.until(_upload_finished)
+
+    # 6️⃣ Caption
+    with timer.step("caption"):
         logging.info("✏️ Escribiendo caption...")
         try:
-            cap_el = wait.until(EC.element_to_be_clickable((
-                By.CSS_SELECTOR,
-                "div[contenteditable='true'][aria-label='Añade un comentario']"
-            )))
+            cap_el = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, SELECTORS["caption"])))
             cap_el.clear()
-            cap_el.send_keys(caption)
-            time.sleep(1)
+            if _bmp(caption) == caption:
+                cap_el.send_keys(caption)
+            else:
+                # Con emojis, insertText escribe el texto completo como si se pegara
+                driver.execute_script(
+                    "arguments[0].focus(); document.execCommand('insertText', false, arguments[1]);",
+                    cap_el, caption,
+                )
+            # Comparación sin emojis: el editor puede representarlos como imágenes
+            expected = " ".join(_bmp(caption).split())[:20]
+            if expected:
+                wait.until(lambda d: expected in " ".join(_bmp(cap_el.text or "").split()))
         except Exception:
             logging.warning("Pie de foto no disponible.")
 
-        # 7️⃣ Enviar estado
-        logging.info("▶️ Enviando estado...")
-        wait.until(EC.element_to_be_clickable(
-            (By.CSS_SELECTOR, "div[role='button'][aria-label='Enviar']")
-        )).click()
-        time.sleep(5)  # Espera importante para completar el envío
-        logging.info("✅ Estado publicado correctamente.")
-    finally:
-        driver.quit()
+    # 7️⃣ Enviar estado y esperar la confirmación en la lista de estados
+    clicked = False
+    try:
+        with timer.step("send"):
+            logging.info("▶️ Enviando estado...")
+            send_button = wait.until(_send_enabled)
+            _watch_pending(driver)
+            clicked = True  # desde el clic, el estado puede estar publicado aunque algo falle
+            send_button.click()
+        with timer.step("confirm"):
+            sent_wait.until(_sent_confirmed)
+    except WebDriverException as e:
+        if not clicked:
+            raise
+        raise SendUnconfirmed(f"Enviar pulsado sin confirmación ({e.__class__.__name__})") from e
+    logging.info("✅ Estado publicado correctamente.")
+    logging.info("⏱️ Tiempos de publicación: %s", timer.timings)
+    return timer.timings
+
+# -------------------------------------------------------------------
+# Publicador con sesión persistente (un solo navegador para varios estados)
+# -------------------------------------------------------------------
+class WhatsAppPublisher:
+    """
+    Mantiene abierto un navegador con sesión iniciada en WhatsApp Web y publica
+    estados sobre él, comprobando su salud entre trabajos y reconectando si falla.
+
+    Uso:
+        with WhatsAppPublisher() as pub:
+            pub.publish_many([("a.mp4", "Título A"), ("b.mp4", "Título B")])
+    """
+
+    def __init__(self, login_timeout: int = 60, max_reconnects: int = 1,
+                 profile_dir: Path | None = None, account: str = DEFAULT_ACCOUNT):
+        self.account = account
+        self.profile_dir = profile_dir
+        self.login_timeout = login_timeout
+        self.max_reconnects = max_reconnects
+        self.driver = None
+        self.published = 0
+        self.last_timings: dict[str, float] = {}
+        self.last_resources: dict[str, float] = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def start(self) -> None:
+        """Arranca el navegador y valida la sesión si aún no está abierto"""
+        if self.driver is None:
+            self.driver, _ = _open_session(self.login_timeout, self.profile_dir)
+
+    def close(self) -> None:
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except WebDriverException:
+                pass
+            self.driver = None
+
+    def _browser_pid(self) -> int | None:
+        """PID de chromedriver; Chrome y sus procesos auxiliares cuelgan de él"""
+        try:
+            return self.driver.service.process.pid
+        except AttributeError:
+            return None
+
+    def restart(self) -> None:
+        logging.info("♻️ Reiniciando sesión de WhatsApp Web (%s)…", self.account)
+        self.close()
+        self.start()
+
+    def is_healthy(self) -> bool:
+        return self.driver is not None and _session_alive(self.driver)
+
+    def ensure_ready(self) -> None:
+        """Comprueba la salud de la sesión antes de cada trabajo y reconecta si hace falta"""
+        if not self.is_healthy():
+            self.restart()
+
+    def publish(self, video_path: str, caption: str) -> dict[str, float]:
+        """Publica un vídeo como estado reutilizando la sesión abierta; devuelve los tiempos por paso"""
+        video_abs = os.path.abspath(video_path)
+        if not os.path.isfile(video_abs):
+            raise FileNotFoundError(f"El video no existe en {video_abs}")
+
+        monitor = _ResourceMonitor(self._browser_pid)
+        with monitor:
+            for attempt in range(self.max_reconnects + 1):
+                self.ensure_ready()
+                try:
+                    self.last_timings = _publish_steps(self.driver, video_abs, caption)
+                    self.published += 1
+                    break
+                except WebDriverException as e:
+                    # Solo llegan aquí fallos anteriores al clic en Enviar (los posteriores son
+                    # SendUnconfirmed y se propagan): repetir desde cero no duplica el estado
+                    if attempt == self.max_reconnects:
+                        raise
+                    logging.warning("Fallo del navegador durante la publicación (%s); reconectando…",
+                                    e.__class__.__name__)
+                    self.restart()
+        self.last_resources = monitor.result
+        if monitor.result:
+            logging.info("📊 Recursos del navegador: %s", monitor.result)
+        return self.last_timings
+
+    def publish_many(self, jobs) -> list[tuple[str, bool]]:
+        """Publica una cola de (video_path, caption) en la misma sesión; devuelve (ruta, ok) por trabajo"""
+        results = []
+        for video_path, caption in jobs:
+            try:
+                self.publish(video_path, caption)
+                results.append((video_path, True))
+            except Exception:
+                logging.exception("No se pudo publicar %s", video_path)
+                results.append((video_path, False))
+        return results
+
+# -------------------------------------------------------------------
+# Varias cuentas en paralelo: un navegador y un hilo por perfil
+# -------------------------------------------------------------------
+class PublisherPool:
+    """
+    Gestiona un WhatsAppPublisher por cuenta, cada uno en su propio hilo.
+
+    Los trabajos de una misma cuenta se publican en serie sobre su navegador;
+    los de cuentas distintas, en paralelo. Los navegadores se abren al llegar
+    el primer trabajo de cada cuenta.
+
+    Uso:
+        with PublisherPool() as pool:
+            futures = [pool.submit("marca_a", "a.mp4", "Título"), pool.submit("marca_b", "b.mp4", "Título")]
+    """
+
+    def __init__(self, accounts: dict[str, Path] | None = None, **publisher_kwargs):
+        self.accounts = accounts or load_accounts()
+        self._publisher_kwargs = publisher_kwargs
+        self._publishers: dict[str, WhatsAppPublisher] = {}
+        self._executors: dict[str, ThreadPoolExecutor] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _lane(self, account: str):
+        if account not in self.accounts:
+            raise KeyError(f"Cuenta de WhatsApp desconocida: {account!r}")
+        with self._lock:
+            if account not in self._executors:
+                self._publishers[account] = WhatsAppPublisher(
+                    profile_dir=self.accounts[account], account=account, **self._publisher_kwargs
+                )
+                self._executors[account] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"wa-{account}")
+            return self._publishers[account], self._executors[account]
+
+    def submit(self, account: str | None, video_path: str, caption: str) -> Future:
+        """Encola una publicación en la cuenta indicada; el futuro devuelve {'timings', 'resources'}"""
+        publisher, executor = self._lane(account or DEFAULT_ACCOUNT)
+
+        def _job():
+            timings = publisher.publish(video_path, caption)
+            return {"timings": timings, "resources": publisher.last_resources}
+
+        return executor.submit(_job)
+
+    def publish_jobs(self, jobs) -> list[tuple[str, str, bool]]:
+        """Publica una lista de (cuenta, video_path, caption) en paralelo entre cuentas"""
+        futures = [(account, path, self.submit(account, path, caption)) for account, path, caption in jobs]
+        results = []
+        for account, path, fut in futures:
+            try:
+                fut.result()
+                results.append((account, path, True))
+            except Exception:
+                logging.exception("No se pudo publicar %s en la cuenta %s", path, account)
+                results.append((account, path, False))
+        return results
+
+    def close(self) -> None:
+        """Espera a los trabajos en curso y cierra los navegadores, cada uno desde su hilo"""
+        for account, executor in self._executors.items():
+            executor.submit(self._publishers[account].close)
+            executor.shutdown(wait=True)
+        self._executors.clear()
+        self._publishers.clear()
+
+# -------------------------------------------------------------------
+# Función principal de publicación (interfaz compatible con main.py)
+# -------------------------------------------------------------------
+def publish(video_path: str, caption: str, account: str | None = None) -> dict[str, float]:
+    """Publica un video como estado en WhatsApp Web.
+    
+    Abre una sesión de un solo uso; para publicar varios estados seguidos,
+    usar WhatsAppPublisher directamente y reutilizar el navegador.
+    """
+    video_abs = os.path.abspath(video_path)
+    
+    if not os.path.isfile(video_abs):
+        logging.error("El video no existe en %s", video_abs)
+        raise FileNotFoundError(f"El video no existe en {video_abs}")
+    
+    account = account or DEFAULT_ACCOUNT
+    profile_dir = load_accounts()[account]
+    with WhatsAppPublisher(profile_dir=profile_dir, account=account) as publisher:
+        return publisher.publish(video_abs, caption)
 
 # -------------------------------------------------------------------
 # Función ensure_session para mantener compatibilidad por si acaso
 # -------------------------------------------------------------------
 def ensure_session(timeout: int = 60) -> webdriver.Chrome:
     """Asegura que existe una sesión de WhatsApp Web"""
-    driver = _mk_driver(headless=True)
-    driver.get("https://web.whatsapp.com")
-    wait = WebDriverWait(driver, 15)
-    try:
-        logging.info("🔍 Comprobando sesión en headless…")
-        wait.until(lambda d: is_logged_in(d))
-        logging.info("✅ Sesión activa en headless.")
-    except TimeoutException:
-        # Si no está logueado, pasar a UI visible
-        logging.info("⚠️ No logueado. Abriendo UI para escanear QR…")
-        driver.quit()
-        driver = _mk_driver(headless=False)
-        driver.get("https://web.whatsapp.com")
-        wait = WebDriverWait(driver, timeout)
-        logging.info("🔍 Espera QR y login en UI…")
-        wait.until(lambda d: is_logged_in(d))
-        logging.info("✅ Login completado en UI.")
-        time.sleep(2)
-    
-    return driver
\ No newline at end of file
+    driver, _ = _open_session(timeout)
+    return driver
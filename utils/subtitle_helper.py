@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Subtítulos en formato ASS para el render con ffmpeg (VIDEO_RENDER_MODE=ffmpeg).
+
+En lugar de dibujar con PIL una capa RGBA por segmento, se escribe un fichero .ass con un
+evento por segmento y estilo, y libass lo dibuja dentro de la misma codificación de ffmpeg.
+Estilos, equivalentes a la maquetación de video_helper._render_text_layer:
+
+    Original     subtítulo del guion, abajo a la izquierda (blanco)
+    Translated   traducción, abajo a la derecha (verde claro), solo si hubo traducción
+    Caption      CAPTION_TEXT, arriba a la derecha, durante todo el vídeo
+
+Con USE_OVERLAY cada estilo lleva su caja negra semitransparente (BorderStyle=3).
+Las coordenadas están en píxeles del lienzo (PlayResX/PlayResY = lienzo).
+"""
+import textwrap
+
+from PIL import ImageFont
+
+# Caracteres por línea, como en la capa de PIL (con y sin overlay)
+CHARS_PER_LINE = {True: 32, False: 35}
+
+def _ass_color(r: int, g: int, b: int, alpha: int = 255) -> str:
+    """Color ASS &HAABBGGRR (en ASS, alfa 00 es opaco y FF transparente)"""
+    return f"&H{255 - alpha:02X}{b:02X}{g:02X}{r:02X}"
+
+def _ass_time(seconds: float) -> str:
+    cs = max(0, round(seconds * 100))
+    h, rem = divmod(cs, 360000)
+    m, rem = divmod(rem, 6000)
+    s, cs = divmod(rem, 100)
+    return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+
+def _ass_text(text: str, width: int | None) -> str:
+    """Escapa el texto (llaves y barras invertidas son órdenes de ASS) y aplica el ajuste de línea"""
+    text = " ".join(text.split()).replace("\\", "⧵").replace("{", "(").replace("}", ")")
+    if width:
+        text = textwrap.fill(text, width=width)
+    return text.replace("\n", "\\N")
+
+def ass_font_size(font: ImageFont.FreeTypeFont) -> int:
+    """Tamaño ASS equivalente a una fuente de PIL: libass usa el alto de línea (ascent+descent)"""
+    try:
+        ascent, descent = font.getmetrics()
+        return max(1, ascent + descent)
+    except AttributeError:
+        return getattr(font, "size", 10)
+
+def build_ass(canvas: tuple[int, int], cues: list[tuple[float, float, str, str | None]],
+              caption_text: str | None, duration: float, font: ImageFont.FreeTypeFont,
+              use_overlay: bool, hubo_traduccion: bool, font_name: str = "DejaVu Sans") -> str:
+    """
+    Devuelve el contenido de un fichero .ass.
+
+    Args:
+        canvas: (ancho, alto) del vídeo
+        cues: (inicio, fin, texto original, traducción) por evento, en segundos; cada evento
+              tiene su propia temporización (un segmento, o una frase si se afina más)
+        caption_text: texto de la esquina superior derecha (todo el vídeo)
+        font: fuente de PIL de los subtítulos (se usa su tamaño)
+    """
+    width, height = canvas
+    size = ass_font_size(font)
+    white = _ass_color(255, 255, 255)
+    green = _ass_color(200, 255, 200)
+    if use_overlay:
+        # Caja opaca (color de contorno) con el relleno del mini-overlay de PIL
+        border, outline, margin = 3, 10, 20
+        box = _ass_color(0, 0, 0, 100)
+        cap_box, cap_outline = _ass_color(0, 0, 0, 120), 5
+    else:
+        border, outline, margin = 1, 0, 10
+        box = cap_box = _ass_color(0, 0, 0, 0)
+        cap_outline = 0
+    wrap = CHARS_PER_LINE[use_overlay]
+
+    def style(name, colour, back, out, alignment, margin_l, margin_r, margin_v):
+        return (f"Style: {name},{font_name},{size},{colour},{colour},{back},{back},0,0,0,0,100,100,0,0,"
+                f"{border},{out},0,{alignment},{margin_l},{margin_r},{margin_v},1")
+
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 2",  # sin ajuste automático: las líneas ya vienen partidas como en PIL
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+        "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+        # Alineación numérica ASS: 1 abajo-izquierda, 3 abajo-derecha, 9 arriba-derecha
+        style("Original", white, box, outline, 1, margin, 0, margin),
+        # Sin overlay, la traducción empieza en la mitad derecha (alineada a la izquierda), como en PIL
+        style("Translated", green, box, outline, 3, 0, margin, margin) if use_overlay
+        else style("Translated", green, box, outline, 1, width // 2 + 10, 0, margin),
+        style("Caption", white, cap_box, cap_outline, 9, 0, 10, 10),
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    # Un layer por estilo: libass solo evita colisiones dentro de un mismo layer, y original y
+    # traducción van lado a lado en la misma línea de base (como en la capa de PIL)
+    for start, end, text, translated in cues:
+        if text:
+            lines.append(f"Dialogue: 0,{_ass_time(start)},{_ass_time(end)},Original,,0,0,0,,"
+                         f"{_ass_text(text, wrap)}")
+        if hubo_traduccion and translated:
+            lines.append(f"Dialogue: 1,{_ass_time(start)},{_ass_time(end)},Translated,,0,0,0,,"
+                         f"{_ass_text(translated, wrap)}")
+    if caption_text:
+        lines.append(f"Dialogue: 2,{_ass_time(0)},{_ass_time(duration)},Caption,,0,0,0,,"
+                     f"{_ass_text(caption_text, None)}")
+    return "\n".join(lines) + "\n"
+
+def write_ass(path: str, *args, **kwargs) -> str:
+    """build_ass() escrito en `path` (UTF-8, como espera libass)"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(build_ass(*args, **kwargs))
+    return path
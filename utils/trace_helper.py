@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Traza temporal de cada ejecución: spans por etapa y sub-paso, exportados al terminar.
+
+    with trace_helper.start(run_dir):            # una traza por ejecución
+        with trace_helper.span("images", source="web"):
+            ...
+
+    @trace_helper.traced("process_audio")
+    def process_audio(...): ...
+
+Formato (TRACE_FORMAT):
+- chrome (por defecto): runs/<run>/trace.json, abrir en chrome://tracing o https://ui.perfetto.dev
+- otlp: runs/<run>/trace.otlp.json, JSON de OTLP (ExportTraceServiceRequest) para importarlo
+  en cualquier backend de OpenTelemetry
+- off: sin traza
+
+Fuera de start() los spans no hacen nada, así que las funciones trazadas pueden usarse en
+cualquier contexto. Los hilos no heredan el contexto: las funciones que se envían a un pool
+deben envolverse con bind().
+
+Perfilado opcional de una etapa: TRACE_PROFILE_STAGE=<nombre de span> con
+TRACE_PROFILER=cprofile (profile_<etapa>.prof + resumen .txt, solo el hilo del span) o
+sample (muestreo de pilas de todos los hilos cada TRACE_SAMPLE_INTERVAL s, en formato
+plegado profile_<etapa>.folded para flamegraph.pl o speedscope).
+"""
+import os
+import io
+import json
+import sys
+import time
+import uuid
+import pstats
+import logging
+import threading
+import contextvars
+import collections
+from contextlib import contextmanager
+from functools import wraps
+
+log = logging.getLogger(__name__)
+
+FORMATS = ("chrome", "otlp", "off")
+
+# (traza activa, id del span padre)
+_active = contextvars.ContextVar("trace_active", default=None)
+
+class Trace:
+    """Spans de una ejecución; seguro entre hilos"""
+
+    def __init__(self, run_dir: str, fmt: str = "chrome", profile_stage: str | None = None,
+                 profiler: str = "cprofile"):
+        if fmt not in FORMATS:
+            raise ValueError(f"TRACE_FORMAT debe ser uno de {FORMATS}, no '{fmt}'")
+        self.run_dir = run_dir
+        self.fmt = fmt
+        self.profile_stage = profile_stage
+        self.profiler = profiler
+        self.trace_id = uuid.uuid4().hex
+        self.spans: list[dict] = []
+        self._lock = threading.Lock()
+        self._profiling = False
+
+    def record(self, name: str, start_ns: int, end_ns: int, parent: str | None = None,
+               span_id: str | None = None, attrs: dict | None = None, error: str | None = None,
+               lane: str | None = None) -> str:
+        """
+        Añade un span terminado. lane agrupa spans que se solapan sin anidarse (p. ej. intentos
+        concurrentes de una llamada); en Chrome se dibujan como eventos asíncronos.
+        """
+        span_id = span_id or uuid.uuid4().hex[:16]
+        with self._lock:
+            self.spans.append({
+                "name": name, "id": span_id, "parent": parent, "start": start_ns, "end": end_ns,
+                "pid": os.getpid(), "tid": threading.get_native_id(),
+                "thread": threading.current_thread().name,
+                "attrs": attrs or {}, "error": error, "lane": lane,
+            })
+        return span_id
+
+    # ------------------------------------------------------------------
+    # Exportación
+    # ------------------------------------------------------------------
+    def export(self) -> str | None:
+        if self.fmt == "off":
+            return None
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start"])
+        if self.fmt == "otlp":
+            path, data = os.path.join(self.run_dir, "trace.otlp.json"), self._otlp(spans)
+        else:
+            path, data = os.path.join(self.run_dir, "trace.json"), self._chrome(spans)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        os.replace(tmp, path)
+        log.info("[Trace] %d spans exportados a %s", len(spans), path)
+        return path
+
+    def _chrome(self, spans: list[dict]) -> dict:
+        events, threads = [], {}
+        for s in spans:
+            args = dict(s["attrs"])
+            if s["error"]:
+                args["error"] = s["error"]
+            ts, dur = s["start"] / 1000, (s["end"] - s["start"]) / 1000
+            threads[(s["pid"], s["tid"])] = s["thread"]
+            if s["lane"]:
+                common = {"name": s["name"], "cat": s["lane"], "id": s["id"], "pid": s["pid"], "tid": s["tid"]}
+                events.append({**common, "ph": "b", "ts": ts, "args": args})
+                events.append({**common, "ph": "e", "ts": ts + dur})
+            else:
+                events.append({"name": s["name"], "ph": "X", "ts": ts, "dur": dur,
+                               "pid": s["pid"], "tid": s["tid"], "args": args})
+        for (pid, tid), name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"run_dir": os.path.abspath(self.run_dir), "trace_id": self.trace_id}}
+
+    def _otlp(self, spans: list[dict]) -> dict:
+        def value(v):
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        out = []
+        for s in spans:
+            attrs = {**s["attrs"], "thread.name": s["thread"], "thread.id": s["tid"], "process.pid": s["pid"]}
+            span = {
+                "traceId": self.trace_id, "spanId": s["id"], "name": s["name"], "kind": 1,
+                "startTimeUnixNano": str(s["start"]), "endTimeUnixNano": str(s["end"]),
+                "attributes": [{"key": k, "value": value(v)} for k, v in attrs.items()],
+                "status": {"code": 2, "message": s["error"]} if s["error"] else {"code": 1},
+            }
+            if s["parent"]:
+                span["parentSpanId"] = s["parent"]
+            out.append(span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": "whatsapp-status-bot"}},
+                {"key": "run.dir", "value": {"stringValue": os.path.abspath(self.run_dir)}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "utils.trace_helper"}, "spans": out}],
+        }]}
+
+    # ------------------------------------------------------------------
+    # Perfilado de una etapa
+    # ------------------------------------------------------------------
+    @contextmanager
+    def maybe_profile(self, name: str):
+        with self._lock:
+            wanted = name == self.profile_stage and not self._profiling
+            if wanted:
+                self._profiling = True  # solo una captura a la vez (cProfile no admite anidarse)
+        if not wanted:
+            yield
+            return
+        try:
+            if self.profiler == "sample":
+                with _sampler(self.run_dir, name):
+                    yield
+            else:
+                with _cprofile(self.run_dir, name):
+                    yield
+        finally:
+            with self._lock:
+                self._profiling = False
+
+def _profile_base(run_dir: str, name: str) -> str:
+    return os.path.join(run_dir, "profile_" + "".join(c if c.isalnum() else "_" for c in name))
+
+@contextmanager
+def _cprofile(run_dir: str, name: str):
+    import cProfile
+
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        base = _profile_base(run_dir, name)
+        prof.dump_stats(base + ".prof")
+        buf = io.StringIO()
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(40)
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(buf.getvalue())
+        log.info("[Trace] Perfil de '%s' guardado en %s.prof", name, base)
+
+@contextmanager
+def _sampler(run_dir: str, name: str):
+    """Muestreo de pilas de todos los hilos (incluidos pools de render y de red)"""
+    interval = float(os.getenv("TRACE_SAMPLE_INTERVAL", "0.005"))
+    stacks = collections.Counter()
+    stop = threading.Event()
+
+    def loop():
+        me = threading.get_ident()  # el propio muestreador no cuenta
+        names = {}
+        while not stop.wait(interval):
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stacks[";".join([names.get(ident, str(ident))] + parts[::-1])] += 1
+
+    sampler = threading.Thread(target=loop, name="trace-sampler", daemon=True)
+    sampler.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        sampler.join()
+        base = _profile_base(run_dir, name)
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        log.info("[Trace] %d muestras de '%s' guardadas en %s.folded", sum(stacks.values()), name, base)
+
+# ---------------------------------------------------------------------------
+# API
+# ---------------------------------------------------------------------------
+@contextmanager
+def start(run_dir: str, fmt: str | None = None):
+    """Activa una traza para el bloque y la exporta al salir (también si hay error)"""
+    fmt = (fmt or os.getenv("TRACE_FORMAT", "chrome")).lower()
+    trace = Trace(run_dir, fmt, profile_stage=os.getenv("TRACE_PROFILE_STAGE") or None,
+                  profiler=os.getenv("TRACE_PROFILER", "cprofile").lower())
+    token = _active.set((trace, None))
+    try:
+        with span("run", run=os.path.basename(os.path.normpath(run_dir))):
+            yield trace
+    finally:
+        _active.reset(token)
+        try:
+            trace.export()
+        except OSError as e:
+            log.warning("[Trace] No se pudo exportar la traza: %s", e)
+
+def current():
+    """Estado de traza del contexto actual (para record() manual o para bind())"""
+    return _active.get()
+
+@contextmanager
+def span(name: str, **attrs):
+    """Span alrededor del bloque; attrs se pueden ampliar dentro con el dict devuelto"""
+    state = _active.get()
+    if state is None or state[0].fmt == "off":
+        yield attrs
+        return
+    trace, parent = state
+    span_id = uuid.uuid4().hex[:16]
+    token = _active.set((trace, span_id))
+    start_ns, error = time.time_ns(), None
+    try:
+        with trace.maybe_profile(name):
+            yield attrs
+    except BaseException as e:
+        error = f"{e.__class__.__name__}: {e}"
+        raise
+    finally:
+        _active.reset(token)
+        trace.record(name, start_ns, time.time_ns(), parent=parent, span_id=span_id, attrs=attrs, error=error)
+
+def traced(name: str | None = None):
+    """Decorador: envuelve cada llamada a la función en un span"""
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def bind(fn):
+    """Propaga la traza del hilo que llama a fn cuando se ejecute en otro hilo (pools)"""
+    state = _active.get()
+    if state is None:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _active.set(state)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _active.reset(token)
+    return wrapper
@@ -5,13 +5,49 @@ Funciones auxiliares para la generación de videos
 """
 import os
 import logging
+import subprocess
+import math
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from moviepy.editor import (
-    ImageClip, AudioFileClip, AudioClip, CompositeVideoClip,
+    ImageClip, AudioFileClip, AudioClip,
     concatenate_videoclips, concatenate_audioclips, CompositeAudioClip
 )
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from utils.motion_helper import make_motion_clip, motion_frame_sampler, zoompan_filter
+from utils import segment_cache, trace_helper, image_artifact, subtitle_helper
+from utils.config import JobConfig
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """Parámetros de codificación de un render (final o borrador)"""
+    name: str
+    fps: int = 24
+    preset: str = "medium"
+    scale: float = 1.0
+    suffix: str = ""
+
+FINAL_PROFILE = RenderProfile("final")
+
+def draft_profile(config: JobConfig | None = None) -> RenderProfile:
+    """Perfil de borrador: resolución y fps reducidos con preset ultrafast"""
+    config = config or JobConfig.from_env()
+    return RenderProfile(
+        "draft",
+        fps=config.video_draft_fps,
+        preset="ultrafast",
+        scale=config.video_draft_scale,
+        suffix="_draft",
+    )
 
 def _split_script(text: str, parts: int) -> list[str]:
     """Divide un texto en partes aproximadamente iguales (por palabras)"""
@@ -24,14 +60,63 @@ def _split_script(text: str, parts: int) -> list[str]:
         segments.append(' '.join(words[start:end]))
     return segments
 
-def process_audio(audio_file, bg_music_dir="media"):
+def _fit_to_canvas(img: Image.Image, canvas: tuple[int, int], fit: str = "contain",
+                   background: str = "#000000") -> Image.Image:
+    """Ajusta una imagen al lienzo: 'contain' la encaja con bandas, 'cover' la recorta centrada"""
+    cw, ch = canvas
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    w, h = img.size
+    if fit == "cover":
+        scale = max(cw / w, ch / h)
+    else:
+        scale = min(cw / w, ch / h)
+    new_size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    if new_size != (w, h):
+        img = img.resize(new_size, Image.LANCZOS)
+    if fit == "cover":
+        left = (new_size[0] - cw) // 2
+        top = (new_size[1] - ch) // 2
+        return img.crop((left, top, left + cw, top + ch))
+    out = Image.new("RGB", canvas, background)
+    out.paste(img, ((cw - new_size[0]) // 2, (ch - new_size[1]) // 2))
+    return out
+
+@trace_helper.traced("video.normalize_image")
+def _normalize_one(args) -> Image.Image:
+    src, canvas, fit, background = args
+    # En memoria si src es un ImageArtifact; si no, draft() decodifica el JPEG a una escala
+    # reducida cercana al lienzo
+    return _fit_to_canvas(image_artifact.load(src, draft=canvas), canvas, fit, background)
+
+def normalize_images(img_files, canvas, fit="contain", background="#000000", workers=None) -> list[Image.Image]:
+    """
+    Redimensiona/encaja todas las imágenes al mismo lienzo de salida, en paralelo.
+
+    Con todos los segmentos al mismo tamaño, la concatenación puede usar el método
+    'chain' en lugar de 'compose' (que compone cada fotograma sobre un lienzo acolchado).
+    Las imágenes normalizadas se quedan en memoria: son intermedias y no se escriben a disco.
+
+    Returns:
+        Lista de imágenes normalizadas, en el mismo orden de entrada
+    """
+    jobs = [(p, canvas, fit, background) for p in img_files]
+    # PIL libera el GIL al decodificar y redimensionar, así que los hilos escalan bien
+    with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+        images = list(pool.map(trace_helper.bind(_normalize_one), jobs))
+    logging.info(f"{len(images)} imágenes normalizadas a {canvas[0]}x{canvas[1]} ({fit})")
+    return images
+
+@trace_helper.traced("video.process_audio")
+def process_audio(audio_file, bg_music_dir="media", config: JobConfig | None = None):
     """Procesa el archivo de audio: añade silencios, ajusta volumen y añade música de fondo si está disponible"""
     logging.info("Procesando audio para vídeo...")
     
-    # Cargar parámetros de volumen y segmentos desde variables de entorno
-    voice_vol = float(os.getenv("VOICE_VOLUME", "1.0"))
-    music_vol = float(os.getenv("MUSIC_VOLUME", "1.2"))
-    silence_dur = float(os.getenv("SILENCE_DURATION", "3"))
+    # Parámetros de volumen y segmentos del trabajo
+    config = config or JobConfig.from_env()
+    voice_vol = config.voice_volume
+    music_vol = config.music_volume
+    silence_dur = config.silence_duration
     
     # Cargar el audio principal
     voice_audio = AudioFileClip(audio_file)
@@ -50,7 +135,7 @@ def process_audio(audio_file, bg_music_dir="media"):
     # Intentar usar música de fondo (si está disponible)
     try:
         # Obtener nombre de archivo de música de fondo
-        bg_music_file = os.getenv("BACKGROUND_MUSIC_FILE")
+        bg_music_file = config.background_music_file
         if not bg_music_file:
             return audio_with_silence
         
@@ -110,8 +195,555 @@ def process_audio(audio_file, bg_music_dir="media"):
         # En caso de error, devolver solo el audio con silencios
         return audio_with_silence
 
+def _load_font(size: int):
+    """Carga la fuente de subtítulos (DejaVuSans) o la fuente por defecto de PIL"""
+    try:
+        return ImageFont.truetype(
+            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+            size,
+        )
+    except Exception:
+        return ImageFont.load_default()
+
+def _text_size(font, text: str) -> tuple[int, int]:
+    """Ancho y alto de una línea de texto, compatible con versiones antiguas y nuevas de PIL"""
+    try:
+        return font.getsize(text)
+    except Exception:
+        return font.getmask(text).size
+
+@trace_helper.traced("video.text_layer")
+def _render_text_layer(size, seg, tseg, caption_text, font, use_overlay, hubo_traduccion) -> Image.Image:
+    """
+    Dibuja subtítulos, traducción y caption en una única capa RGBA del tamaño del lienzo.
+
+    La capa se compone una sola vez sobre la imagen en los segmentos estáticos, o
+    fotograma a fotograma (solo en su caja envolvente) en los segmentos con movimiento.
+    """
+    width, height = size
+    layer = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    ascent, descent = font.getmetrics()
+    line_h = ascent + descent + 4
+    
+    if use_overlay:
+        # --- Subtítulo original (izquierda, mini-overlay ajustado) ---
+        # Limitar el ancho del texto a menos de la mitad de la pantalla
+        chars_per_line = 32  # Reducir para evitar solapamiento
+        wrapped = textwrap.fill(seg, width=chars_per_line)
+        lines = wrapped.split('\n')
+        text_h = line_h * len(lines)
+        max_line_width = max((_text_size(font, line)[0] for line in lines), default=0)
+        
+        # Posicionar en la parte inferior con margen izquierdo
+        left_margin = 20
+        y = height - text_h - 20  # 20px de margen inferior
+        padding = 10  # Espacio extra alrededor del texto
+        if seg:
+            draw.rectangle([
+                (left_margin - padding, y - padding),
+                (left_margin + max_line_width + padding, y + text_h + padding)
+            ], fill=(0, 0, 0, 100))  # Negro semitransparente
+            draw.multiline_text((left_margin, y), wrapped, font=font, fill=(255, 255, 255, 255))
+        
+        # --- Subtítulo traducido (derecha, mini-overlay ajustado) ---
+        if hubo_traduccion and tseg:
+            t_wrapped = textwrap.fill(tseg, width=chars_per_line)
+            t_lines = t_wrapped.split('\n')
+            t_text_h = line_h * len(t_lines)
+            t_max_line_width = max((_text_size(font, line)[0] for line in t_lines), default=0)
+            
+            # Posicionar en la parte inferior derecha con margen
+            right_margin = width - t_max_line_width - 20  # 20px de margen derecho
+            t_y = height - t_text_h - 20  # 20px de margen inferior
+            draw.rectangle([
+                (right_margin - padding, t_y - padding),
+                (right_margin + t_max_line_width + padding, t_y + t_text_h + padding)
+            ], fill=(0, 0, 0, 100))
+            # Texto traducido en verde claro
+            draw.multiline_text((right_margin, t_y), t_wrapped, font=font, fill=(200, 255, 200, 255))
+    else:
+        # --- Capas de texto sin overlay ---
+        # Subtítulo original (izquierda)
+        half_width = width // 2  # Dividir la pantalla en dos mitades
+        chars_per_line = 35  # Menos caracteres para evitar solapamiento
+        wrapped = textwrap.fill(seg, width=chars_per_line)
+        text_h = line_h * (wrapped.count('\n') + 1)
+        y = height - text_h - 10
+        draw.multiline_text((10, y), wrapped, font=font, fill=(255,255,255,255))
+        
+        if hubo_traduccion and tseg:
+            # Subtítulo traducido (derecha), alineado desde la mitad de la pantalla
+            right_margin = half_width + 10
+            t_lines = textwrap.fill(tseg, width=chars_per_line).split('\n')
+            t_y = height - line_h * len(t_lines) - 10
+            for j, line in enumerate(t_lines):
+                draw.text((right_margin, t_y + j*line_h), line, font=font, fill=(200,255,200,255))
+    
+    # CAPTION_TEXT (arriba derecha, con mini-overlay solo si USE_OVERLAY es true)
+    if caption_text:
+        cap_w, cap_h = _text_size(font, caption_text)
+        margin = 10
+        padding = 5  # Espacio extra alrededor del texto
+        text_x = width - cap_w - margin
+        text_y = margin
+        if use_overlay:
+            draw.rectangle([
+                (text_x - padding, text_y - padding),
+                (text_x + cap_w + padding, text_y + cap_h + padding)
+            ], fill=(0, 0, 0, 120))  # Negro semitransparente
+        # El texto se muestra siempre, con o sin overlay
+        draw.text((text_x, text_y), caption_text, font=font, fill=(255, 255, 255, 255))
+    
+    return layer
+
+def _with_overlay(layer: Image.Image, overlay: str | None) -> Image.Image:
+    """Capa de un segmento con la capa de la pasada final encima (para las miniaturas)"""
+    if not overlay:
+        return layer
+    with Image.open(overlay) as top:
+        return Image.alpha_composite(layer, top.convert("RGBA"))
+
+def _compose_image(img: Image.Image, layer: Image.Image) -> np.ndarray:
+    """Compone la capa de texto sobre la imagen una única vez y devuelve el fotograma RGB"""
+    frame = Image.alpha_composite(img.convert('RGBA'), layer)
+    return np.array(frame.convert('RGB'))
+
+def _peak_rss_mb() -> float:
+    """Pico de memoria residente del proceso en MB (0 si la plataforma no lo expone)"""
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _current_rss_mb() -> float:
+    """Memoria residente actual del proceso en MB (Linux); si no, el pico"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return _peak_rss_mb()
+
+def _segment_frame_counts(total_duration: float, parts: int, fps: int) -> list[int]:
+    """Reparte los fotogramas entre segmentos sin acumular error de redondeo"""
+    total_frames = max(parts, int(round(total_duration * fps)))
+    bounds = [round(k * total_frames / parts) for k in range(parts + 1)]
+    return [bounds[k + 1] - bounds[k] for k in range(parts)]
+
+def _image_frames(img: Image.Image, layer, n_frames, canvas, motion, motion_zoom, variant):
+    """Genera los fotogramas de un segmento uno a uno (estático o con movimiento) a partir de
+    una imagen ya decodificada y ajustada al lienzo"""
+    if motion == "kenburns":
+        frame_at = motion_frame_sampler(img.convert('RGB'), layer, n_frames, canvas,
+                                        zoom=motion_zoom, variant=variant)
+        for i in range(n_frames):
+            yield frame_at(i)
+    else:
+        frame = _compose_image(img, layer)
+        for _ in range(n_frames):
+            yield frame
+
+def _unlink_segment(path: str) -> None:
+    """Quita un segmento anterior antes de recodificarlo: puede ser un enlace duro a la caché y
+    sobrescribirlo en el sitio corrompería la entrada cacheada"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _encode_frames(frames, path, size, fps, preset="medium") -> str:
+    """Codifica un iterador de fotogramas RGB a un MP4 sin audio"""
+    with trace_helper.span("video.encode_segment", segment=os.path.basename(path)) as attrs:
+        _unlink_segment(path)
+        writer = FFMPEG_VideoWriter(path, size, fps, codec="libx264", preset=preset)
+        n = 0
+        try:
+            for frame in frames:
+                writer.write_frame(frame)
+                n += 1
+        finally:
+            writer.close()
+        attrs["frames"] = n
+    return path
+
+@trace_helper.traced("video.export_audio")
+def _export_audio(audio_clip, path) -> str:
+    """Escribe la mezcla de audio una sola vez, para multiplexarla luego sin recodificar vídeo"""
+    audio_clip.write_audiofile(path, fps=44100, codec="aac", logger=None)
+    return path
+
+def _caption_overlay(canvas, caption_text, font, use_overlay, path) -> str | None:
+    """PNG RGBA del lienzo con solo el CAPTION_TEXT, para la pasada final; None si no hay caption"""
+    if not caption_text:
+        return None
+    _render_text_layer(canvas, "", None, caption_text, font, use_overlay, False).save(path)
+    return path
+
+@trace_helper.traced("video.concat_mux")
+def _concat_and_mux(segment_paths, audio_path, out_path, overlay=None, preset="medium") -> str:
+    """
+    Une los segmentos por copia de flujo (concat demuxer) y añade el audio.
+
+    Con overlay (PNG RGBA del lienzo), la capa se compone sobre todo el vídeo en esta misma
+    pasada: el vídeo se recodifica una vez en ffmpeg, sin volver a generar fotogramas en Python.
+    """
+    list_path = os.path.splitext(out_path)[0] + "_segments.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for p in segment_paths:
+            f.write(f"file '{os.path.abspath(p)}'\n")
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-i", audio_path,
+    ]
+    if overlay:
+        cmd += [
+            "-i", overlay,
+            "-filter_complex", "[0:v][2:v]overlay=0:0,format=yuv420p[v]",
+            "-map", "[v]", "-map", "1:a:0",
+            "-c:v", "libx264", "-preset", preset, "-c:a", "copy",
+        ]
+    else:
+        cmd += ["-map", "0:v:0", "-map", "1:a:0", "-c:v", "copy", "-c:a", "copy"]
+    cmd += ["-movflags", "+faststart", "-shortest", out_path]
+    subprocess.run(cmd, check=True)
+    os.remove(list_path)
+    return out_path
+
+def _render_streaming(audio_clip, img_files, segments, translated_segments, caption_text, font,
+                      use_overlay, hubo_traduccion, canvas, fit, background, profile, motion, motion_zoom,
+                      run_dir, thumbs=None, use_cache=False, cache_max_mb=2048.0) -> str:
+    """
+    Render por segmentos con memoria acotada.
+
+    Cada segmento normaliza su imagen, se materializa, se codifica a su propio fichero y se
+    libera antes de pasar al siguiente; al final los segmentos se concatenan por copia y se
+    añade el audio. Con use_cache, los segmentos cuyo hash de entradas (imagen de origen,
+    ajuste al lienzo, textos...) ya está en la caché no se recodifican. El caption es igual en
+    todos los segmentos, así que con la caché no forma parte de ellos: se compone en la pasada
+    final (_concat_and_mux) y cambiar solo CAPTION_TEXT no invalida ningún segmento.
+    """
+    fps = profile.fps
+    seg_dir = os.path.join(run_dir, f"segments{profile.suffix}")
+    os.makedirs(seg_dir, exist_ok=True)
+    audio_path = _export_audio(audio_clip, os.path.join(run_dir, "audio_mix.m4a"))
+    
+    frame_counts = _segment_frame_counts(audio_clip.duration, len(img_files), fps)
+    overlay = None
+    if use_cache:
+        overlay = _caption_overlay(canvas, caption_text, font, use_overlay,
+                                   os.path.join(run_dir, f"caption{profile.suffix}.png"))
+        seg_caption = None
+    else:
+        seg_caption = caption_text
+    segment_paths = []
+    hits = 0
+    for i, src in enumerate(img_files):
+        tseg = translated_segments[i] if translated_segments else None
+        
+        key = None
+        if use_cache:
+            key = segment_cache.segment_key(
+                src, seg=segments[i], tseg=tseg if hubo_traduccion else None,
+                font=getattr(font, "path", "default"),
+                font_size=getattr(font, "size", 0), overlay=use_overlay,
+                motion=motion, motion_zoom=motion_zoom if motion == "kenburns" else None,
+                variant=i if motion == "kenburns" else None, fit=fit, background=background,
+                frames=frame_counts[i], fps=fps, canvas=canvas, preset=profile.preset, codec="libx264",
+            )
+            cached = segment_cache.checkout(key, os.path.join(seg_dir, f"seg_{i:03d}.mp4"))
+            if cached:
+                segment_paths.append(cached)
+                hits += 1
+                if thumbs is not None:
+                    thumbs.append(_segment_thumbnail(cached, canvas, overlay))
+                image_artifact.release(src)
+                logging.info(f"Segmento {i+1}/{len(img_files)} reutilizado desde caché")
+                continue
+        
+        img = _normalize_one((src, canvas, fit, background))
+        layer = _render_text_layer(canvas, segments[i], tseg, seg_caption, font, use_overlay, hubo_traduccion)
+        if thumbs is not None:
+            thumbs.append(_thumbnail(_compose_image(img, _with_overlay(layer, overlay))))
+        frames = _image_frames(img, layer, frame_counts[i], canvas, motion, motion_zoom, i)
+        path = _encode_frames(frames, os.path.join(seg_dir, f"seg_{i:03d}.mp4"), canvas, fps,
+                              preset=profile.preset)
+        # Segmento escrito: la imagen decodificada de la obtención no debe seguir en memoria
+        image_artifact.release(src)
+        if key:
+            segment_cache.store(key, path)
+        segment_paths.append(path)
+        del img, layer, frames
+        logging.info(f"Segmento {i+1}/{len(img_files)} codificado ({frame_counts[i]} fotogramas) "
+                     f"- RSS actual {_current_rss_mb():.0f} MB")
+    
+    video_path = _concat_and_mux(segment_paths, audio_path,
+                                 os.path.join(run_dir, f"status{profile.suffix}.mp4"),
+                                 overlay=overlay, preset=profile.preset)
+    if use_cache:
+        # Después del mux: la poda no puede borrar segmentos que este render aún necesita
+        logging.info(f"Caché de segmentos: {hits}/{len(img_files)} reutilizados")
+        segment_cache.prune(int(cache_max_mb * 1024 * 1024))
+    logging.info(f"Render por segmentos completado - pico de memoria {_peak_rss_mb():.0f} MB")
+    return video_path
+
+def _even_canvas(size, scale: float = 1.0) -> tuple[int, int]:
+    """Lienzo escalado con dimensiones pares (requisito de yuv420p)"""
+    w, h = (max(2, round(v * scale)) for v in size)
+    return w - w % 2, h - h % 2
+
+def rendition_path(run_dir: str, canvas: tuple[int, int], suffix: str = "", primary: bool = False) -> str:
+    """status.mp4 para la versión principal; status_<ANCHO>x<ALTO>.mp4 para las demás"""
+    name = "status" if primary else f"status_{canvas[0]}x{canvas[1]}"
+    return os.path.join(run_dir, f"{name}{suffix}.mp4")
+
+def _render_renditions(audio_clip, img_files, segments, translated_segments, caption_text, font_size,
+                       use_overlay, hubo_traduccion, canvases, fit, background, profile, motion, motion_zoom,
+                       run_dir, thumbs=None, use_cache=False, cache_max_mb=2048.0) -> list[str]:
+    """
+    Render de varias versiones (lienzos) en una sola pasada.
+
+    Cada imagen de origen se decodifica una vez por segmento; para cada versión se ajusta a su
+    lienzo, se dibuja su propia capa de subtítulos y se envía a su propio codificador. Los
+    codificadores de un segmento reciben los fotogramas intercalados, así que trabajan en
+    paralelo. La mezcla de audio se exporta una vez y se multiplexa en todas las versiones.
+
+    Returns:
+        Rutas de los vídeos, en el orden de canvases (la primera es la versión principal)
+    """
+    fps = profile.fps
+    seg_dir = os.path.join(run_dir, f"segments{profile.suffix}")
+    os.makedirs(seg_dir, exist_ok=True)
+    audio_path = _export_audio(audio_clip, os.path.join(run_dir, "audio_mix.m4a"))
+    frame_counts = _segment_frame_counts(audio_clip.duration, len(img_files), fps)
+
+    # Subtítulos proporcionales al lado corto de cada lienzo (font_size es el de la principal)
+    base_side = min(canvases[0])
+    fonts = {c: _load_font(max(8, round(font_size * min(c) / base_side))) for c in canvases}
+    segment_paths = {c: [] for c in canvases}
+    # Con la caché, el caption se compone en la pasada final (ver _render_streaming)
+    overlays = {c: None for c in canvases}
+    if use_cache:
+        overlays = {c: _caption_overlay(c, caption_text, fonts[c], use_overlay,
+                                        os.path.join(run_dir, f"caption_{c[0]}x{c[1]}{profile.suffix}.png"))
+                    for c in canvases}
+    seg_caption = None if use_cache else caption_text
+    encoded = hits = 0
+
+    for i, src in enumerate(img_files):
+        tseg = translated_segments[i] if translated_segments else None
+        todo = []
+        for c in canvases:
+            key = None
+            if use_cache:
+                key = segment_cache.segment_key(
+                    src, seg=segments[i], tseg=tseg if hubo_traduccion else None,
+                    font=getattr(fonts[c], "path", "default"),
+                    font_size=getattr(fonts[c], "size", 0), overlay=use_overlay,
+                    motion=motion, motion_zoom=motion_zoom if motion == "kenburns" else None,
+                    variant=i if motion == "kenburns" else None, fit=fit, background=background,
+                    frames=frame_counts[i], fps=fps, canvas=c, preset=profile.preset, codec="libx264",
+                )
+                cached = segment_cache.checkout(key, os.path.join(seg_dir, f"seg_{c[0]}x{c[1]}_{i:03d}.mp4"))
+                if cached:
+                    segment_paths[c].append(cached)
+                    hits += 1
+                    if thumbs is not None and c == canvases[0]:
+                        thumbs.append(_segment_thumbnail(cached, c, overlays[c]))
+                    continue
+            todo.append((c, key))
+        if not todo:
+            image_artifact.release(src)
+            continue
+
+        # Una sola decodificación de la imagen de origen para todas las versiones
+        with trace_helper.span("video.decode_source", segment=i):
+            largest = max((c for c, _ in todo), key=lambda c: c[0] * c[1])
+            source = image_artifact.load(src, draft=largest)
+
+        writers, streams = [], []
+        try:
+            for c, key in todo:
+                fitted = _fit_to_canvas(source, c, fit, background)
+                layer = _render_text_layer(c, segments[i], tseg, seg_caption, fonts[c], use_overlay, hubo_traduccion)
+                if thumbs is not None and c == canvases[0]:
+                    thumbs.append(_thumbnail(_compose_image(fitted, _with_overlay(layer, overlays[c]))))
+                name = f"seg_{c[0]}x{c[1]}_{i:03d}.mp4"
+                path = os.path.join(seg_dir, name)
+                _unlink_segment(path)
+                writers.append((c, key, path, FFMPEG_VideoWriter(path, c, fps, codec="libx264",
+                                                                 preset=profile.preset)))
+                streams.append(_image_frames(fitted, layer, frame_counts[i], c, motion, motion_zoom, i))
+            with trace_helper.span("video.encode_renditions", segment=i, renditions=len(writers),
+                                   frames=frame_counts[i]):
+                for frames in zip(*streams):
+                    for (_, _, _, writer), frame in zip(writers, frames):
+                        writer.write_frame(frame)
+        finally:
+            for _, _, _, writer in writers:
+                writer.close()
+        for c, key, path, _ in writers:
+            if key:
+                segment_cache.store(key, path)
+            segment_paths[c].append(path)
+            encoded += 1
+        del source, streams
+        image_artifact.release(src)
+        logging.info(f"Segmento {i+1}/{len(img_files)} codificado en {len(writers)} versiones "
+                     f"({frame_counts[i]} fotogramas) - RSS actual {_current_rss_mb():.0f} MB")
+
+    paths = []
+    for n, c in enumerate(canvases):
+        out = rendition_path(run_dir, c, profile.suffix, primary=n == 0)
+        paths.append(_concat_and_mux(segment_paths[c], audio_path, out, overlay=overlays[c],
+                                     preset=profile.preset))
+    if use_cache:
+        # Después del mux: la poda no puede borrar segmentos que este render aún necesita
+        logging.info(f"Caché de segmentos: {hits}/{hits + encoded} reutilizados")
+        segment_cache.prune(int(cache_max_mb * 1024 * 1024))
+    logging.info(f"Render de {len(canvases)} versiones completado ({', '.join(paths)}) "
+                 f"- pico de memoria {_peak_rss_mb():.0f} MB")
+    return paths
+
+def _fit_filter(canvas: tuple[int, int], fit: str, background: str) -> str:
+    """Equivalente en filtros de ffmpeg de _fit_to_canvas"""
+    w, h = canvas
+    if fit == "cover":
+        return (f"scale={w}:{h}:force_original_aspect_ratio=increase:flags=lanczos,"
+                f"crop={w}:{h},setsar=1")
+    return (f"scale={w}:{h}:force_original_aspect_ratio=decrease:flags=lanczos,"
+            f"pad={w}:{h}:(ow-iw)/2:(oh-ih)/2:color={background},setsar=1")
+
+def _render_ffmpeg(audio_clip, img_files, segments, translated_segments, caption_text, font_size,
+                   use_overlay, hubo_traduccion, canvases, fit, background, profile, motion, motion_zoom,
+                   run_dir, contact_sheet=False, soft_subtitles=False) -> list[str]:
+    """
+    Render completo en una sola codificación de ffmpeg (VIDEO_RENDER_MODE=ffmpeg).
+
+    Python no genera fotogramas: cada imagen de origen entra una vez en el grafo de filtros,
+    se ajusta al lienzo (scale/pad/crop), se alarga a su número de fotogramas (loop, o
+    zoompan con VIDEO_MOTION=kenburns), se concatena y libass dibuja los subtítulos desde un
+    fichero .ass. El audio se multiplexa en la misma orden y cada versión (VIDEO_RENDITIONS)
+    es una salida más del mismo proceso. Con soft_subtitles se añade además una pista
+    mov_text con los mismos textos.
+
+    Returns:
+        Rutas de los vídeos, en el orden de canvases (la primera es la versión principal)
+    """
+    fps = profile.fps
+    audio_path = _export_audio(audio_clip, os.path.join(run_dir, "audio_mix.m4a"))
+    frame_counts = _segment_frame_counts(audio_clip.duration, len(img_files), fps)
+    starts = np.concatenate([[0], np.cumsum(frame_counts)]) / fps
+    cues = [(starts[i], starts[i + 1], segments[i], translated_segments[i] if translated_segments else None)
+            for i in range(len(img_files))]
+    duration = starts[-1]
+
+    cmd = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error"]
+    for src in img_files:
+        # ImageArtifact: el fichero se escribe en segundo plano
+        cmd += ["-i", os.path.abspath(src.wait() if hasattr(src, "wait") else src)]
+        image_artifact.release(src)  # ffmpeg lee el fichero
+    audio_in = len(img_files)
+    cmd += ["-i", os.path.abspath(audio_path)]
+
+    base_side = min(canvases[0])
+    graph, subs, outputs = [], [], []
+    n_out = len(canvases)
+    for i in range(len(img_files)):
+        if n_out > 1:
+            graph.append(f"[{i}:v]split={n_out}" + "".join(f"[src{i}_{k}]" for k in range(n_out)))
+        else:
+            graph.append(f"[{i}:v]null[src{i}_0]")
+    for k, c in enumerate(canvases):
+        for i, n in enumerate(frame_counts):
+            chain = _fit_filter(c, fit, background)
+            if motion == "kenburns":
+                buf = (max(c[0], round(c[0] * motion_zoom)), max(c[1], round(c[1] * motion_zoom)))
+                chain += f",scale={buf[0]}:{buf[1]}:flags=lanczos," + zoompan_filter(n, c, fps, motion_zoom, i)
+            else:
+                chain += f",loop=loop={n - 1}:size=1:start=0,setpts=N/({fps}*TB)"
+            graph.append(f"[src{i}_{k}]{chain},settb=1/{fps}[v{k}_{i}]")
+
+        # Subtítulos proporcionales al lado corto de cada lienzo (font_size es el de la principal)
+        font = _load_font(max(8, round(font_size * min(c) / base_side)))
+        sub_name = f"subs_{c[0]}x{c[1]}{profile.suffix}.ass"
+        subtitle_helper.write_ass(os.path.join(run_dir, sub_name), c, cues, caption_text, duration,
+                                  font, use_overlay, hubo_traduccion)
+        subs.append(sub_name)
+        fonts_dir = os.path.dirname(getattr(font, "path", "") or "")
+        ass = f"ass={sub_name}" + (f":fontsdir={fonts_dir}" if fonts_dir else "")
+        graph.append("".join(f"[v{k}_{i}]" for i in range(len(img_files)))
+                     + f"concat=n={len(img_files)}:v=1:a=0,{ass},format=yuv420p[out{k}]")
+        outputs.append(rendition_path(run_dir, c, profile.suffix, primary=k == 0))
+
+    if soft_subtitles:
+        for sub_name in subs:
+            cmd += ["-i", sub_name]
+    cmd += ["-filter_complex", ";".join(graph)]
+    # Sin -shortest: los fotogramas ya suman la duración del audio y el relleno del AAC
+    # recortaría los últimos
+    for k, out in enumerate(outputs):
+        cmd += ["-map", f"[out{k}]", "-map", f"{audio_in}:a:0"]
+        if soft_subtitles:
+            cmd += ["-map", f"{audio_in + 1 + k}:s:0", "-c:s", "mov_text"]
+        cmd += ["-c:v", "libx264", "-preset", profile.preset, "-r", str(fps), "-c:a", "copy",
+                "-movflags", "+faststart", os.path.abspath(out)]
+
+    with trace_helper.span("video.encode_ffmpeg", fps=fps, preset=profile.preset,
+                           renditions=len(canvases), frames=sum(frame_counts)):
+        # Desde run_dir, para que las rutas de los .ass no necesiten escaparse en el grafo
+        subprocess.run(cmd, check=True, cwd=run_dir)
+
+    if contact_sheet:
+        _contact_sheet_ffmpeg(outputs[0], frame_counts, os.path.join(run_dir, "contact_sheet.png"))
+    logging.info(f"Render con ffmpeg completado ({', '.join(outputs)}) - pico de memoria {_peak_rss_mb():.0f} MB")
+    return outputs
+
+def _contact_sheet_ffmpeg(video_path, frame_counts, path, max_side=320) -> str:
+    """Hoja de contactos del render con ffmpeg: el fotograma central de cada segmento, con el filtro tile"""
+    starts = np.concatenate([[0], np.cumsum(frame_counts)])
+    picks = "+".join(f"eq(n,{int(starts[i] + frame_counts[i] // 2)})" for i in range(len(frame_counts)))
+    columns = math.ceil(math.sqrt(len(frame_counts)))
+    rows = math.ceil(len(frame_counts) / columns)
+    vf = (f"select='{picks}',"
+          f"scale='if(gt(iw,ih),{max_side},-2)':'if(gt(iw,ih),-2,{max_side})',"
+          f"tile={columns}x{rows}:padding=4:margin=4:color=0x202020")
+    subprocess.run([get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-i", video_path,
+                    "-vf", vf, "-frames:v", "1", path], check=True)
+    logging.info("Hoja de contactos guardada en: %s", path)
+    return path
+
+def _contact_sheet(thumbs, path, columns=None) -> str:
+    """Compone las miniaturas de todos los segmentos en una sola imagen PNG"""
+    columns = columns or math.ceil(math.sqrt(len(thumbs)))
+    rows = math.ceil(len(thumbs) / columns)
+    tw, th = thumbs[0].size
+    gap = 4
+    sheet = Image.new('RGB', (columns * (tw + gap) + gap, rows * (th + gap) + gap), (32, 32, 32))
+    for i, thumb in enumerate(thumbs):
+        r, c = divmod(i, columns)
+        sheet.paste(thumb, (gap + c * (tw + gap), gap + r * (th + gap)))
+    sheet.save(path)
+    logging.info("Hoja de contactos guardada en: %s", path)
+    return path
+
+def _thumbnail(frame: np.ndarray, max_side: int = 320) -> Image.Image:
+    thumb = Image.fromarray(frame)
+    thumb.thumbnail((max_side, max_side))
+    return thumb
+
+def _segment_thumbnail(path: str, size: tuple[int, int], overlay: str | None = None) -> Image.Image:
+    """Miniatura del primer fotograma de un segmento ya codificado (acierto de la caché), con la
+    capa de la pasada final encima: así la hoja de contactos no obliga a recodificarlo"""
+    out = subprocess.run([get_setting("FFMPEG_BINARY"), "-v", "error", "-i", path, "-frames:v", "1",
+                          "-f", "rawvideo", "-pix_fmt", "rgb24", "-"], capture_output=True, check=True).stdout
+    frame = np.frombuffer(out, np.uint8)[: size[0] * size[1] * 3].reshape(size[1], size[0], 3)
+    if overlay:
+        frame = _compose_image(Image.fromarray(frame), _with_overlay(Image.new("RGBA", size), overlay))
+    return _thumbnail(frame)
+
 def generate_video(audio_file, img_files, script, translated_script=None, hubo_traduccion=False, 
-                  caption_text="", run_dir=".", font_size=None):
+                  caption_text="", run_dir=".", font_size=None, draft=False, config=None):
     """
     Genera un video combinando imágenes, audio y subtítulos.
     
@@ -124,262 +756,158 @@ def generate_video(audio_file, img_files, script, translated_script=None, hubo_t
         caption_text: Texto a mostrar en la esquina superior derecha
         run_dir: Directorio donde se guardará el video
         font_size: Tamaño de fuente para los subtítulos
+        draft: Si es True, render rápido de borrador (baja resolución/fps, preset ultrafast)
+               y, si VIDEO_DRAFT_CONTACT_SHEET=true, hoja de contactos PNG de los segmentos
+        config: JobConfig del trabajo (lienzo, subtítulos, movimiento, caché...);
+                por defecto, instantánea del entorno
     
     Returns:
         Ruta al archivo de video generado
     """
+    config = config or JobConfig.from_env()
+    profile = draft_profile(config) if draft else FINAL_PROFILE
+    fps = profile.fps
+    
     # Procesamiento de audio
-    audio_clip = process_audio(audio_file)
+    audio_clip = process_audio(audio_file, config=config)
+    
+    # VIDEO_CANVAS ya viene validado por JobConfig; aquí solo se escala (borrador) y se fuerza a pares
+    canvas = _even_canvas(config.video_canvas, profile.scale)
+    # Versiones adicionales (VIDEO_RENDITIONS): cada imagen se ajusta a cada lienzo dentro de la pasada
+    canvases = [canvas]
+    for size in config.video_renditions:
+        rendition = _even_canvas(size, profile.scale)
+        if rendition not in canvases:
+            canvases.append(rendition)
     
-    # Crear los clips de imagen con la duración calculada
+    # Duración de cada segmento
     duration = audio_clip.duration / len(img_files)
-    base_clips = [ImageClip(p).set_duration(duration) for p in img_files]
     logging.info(f"Duración por imagen: {duration:.2f} segundos para {len(img_files)} imágenes")
     
     # Generar subtítulos distribuidos
-    segments = _split_script(script, len(base_clips))
-    clips = []
+    segments = _split_script(script, len(img_files))
     
     # Determinar si hay que usar traducción
     if hubo_traduccion and translated_script:
-        translated_segments = _split_script(translated_script, len(base_clips))
+        translated_segments = _split_script(translated_script, len(img_files))
     else:
         translated_segments = None
         hubo_traduccion = False
     
     # Tamaño de fuente de subtítulos
-    subtitle_font_size = font_size if font_size else int(os.getenv("SUBTITLE_FONT_SIZE", "30"))
+    subtitle_font_size = font_size if font_size else config.subtitle_font_size
+    font = _load_font(max(8, round(subtitle_font_size * profile.scale)))
     
     # Verificar si estamos usando audio personalizado (en cuyo caso no mostramos subtítulos)
-    using_custom_audio = os.getenv("USE_CUSTOM_AUDIO", "false").lower() == "true"
+    using_custom_audio = config.use_custom_audio
     
     # Si estamos usando audio personalizado, forzamos a que no se muestren subtítulos ni overlay
     if using_custom_audio:
         logging.info("Usando audio personalizado - no se mostrarán subtítulos ni overlay")
         use_overlay = False
         # Vaciamos el texto de los segmentos para que no se muestren subtítulos
-        segments = [""] * len(base_clips)
+        segments = [""] * len(img_files)
         if translated_segments:
-            translated_segments = [""] * len(base_clips)
+            translated_segments = [""] * len(img_files)
     else:
         # Determinar si se debe usar overlay para los subtítulos normales
-        use_overlay = os.getenv("USE_OVERLAY", "false").lower() == "true"
+        use_overlay = config.use_overlay
+    
+    # Movimiento pan/zoom opcional (Ken Burns) con rectángulos de recorte precalculados
+    motion = config.video_motion
+    motion_zoom = config.video_motion_zoom
+    
+    # Miniaturas para la hoja de contactos del borrador
+    want_sheet = draft and config.video_draft_contact_sheet
+    thumbs = [] if want_sheet else None
+    
+    # Una sola codificación de ffmpeg: textos con libass, movimiento con zoompan, audio en la misma orden
+    if config.video_render_mode == "ffmpeg":
+        if config.segment_cache:
+            logging.info("SEGMENT_CACHE no se aplica con VIDEO_RENDER_MODE=ffmpeg (no hay segmentos)")
+        paths = _render_ffmpeg(
+            audio_clip, img_files, segments, translated_segments, caption_text, subtitle_font_size * profile.scale,
+            use_overlay, hubo_traduccion, canvases, config.video_canvas_fit, config.background_color,
+            profile, motion, motion_zoom, run_dir, contact_sheet=want_sheet,
+            soft_subtitles=config.video_soft_subtitles,
+        )
+        logging.info("Vídeos generados: %s", paths)
+        return paths[0]
+
+    if len(canvases) > 1:
+        paths = _render_renditions(
+            audio_clip, img_files, segments, translated_segments, caption_text, subtitle_font_size * profile.scale,
+            use_overlay, hubo_traduccion, canvases, config.video_canvas_fit, config.background_color,
+            profile, motion, motion_zoom, run_dir, thumbs=thumbs, use_cache=config.segment_cache,
+            cache_max_mb=config.segment_cache_max_mb,
+        )
+        if thumbs:
+            _contact_sheet(thumbs, os.path.join(run_dir, "contact_sheet.png"))
+        logging.info("Vídeos generados: %s", paths)
+        return paths[0]
+
+    # Render por segmentos con memoria acotada (vídeos largos o muchas imágenes).
+    # La caché de segmentos trabaja sobre este modo, así que lo activa implícitamente.
+    use_cache = config.segment_cache
+    if use_cache or config.video_render_mode == "streaming":
+        video_path = _render_streaming(
+            audio_clip, img_files, segments, translated_segments, caption_text, font,
+            use_overlay, hubo_traduccion, canvas, config.video_canvas_fit, config.background_color,
+            profile, motion, motion_zoom, run_dir,
+            thumbs=thumbs, use_cache=use_cache, cache_max_mb=config.segment_cache_max_mb,
+        )
+        if thumbs:
+            _contact_sheet(thumbs, os.path.join(run_dir, "contact_sheet.png"))
+        logging.info("Video generado y guardado en: %s", video_path)
+        return video_path
+    
+    # Normalizar todas las imágenes al lienzo de salida (una sola vez, en paralelo y en memoria)
+    norm_images = normalize_images(
+        img_files, canvas,
+        fit=config.video_canvas_fit,
+        background=config.background_color,
+    )
+    for src in img_files:
+        image_artifact.release(src)
     
     # Bucle principal para procesar cada imagen
-    for i, img_clip in enumerate(base_clips):
-        seg = segments[i]
+    clips = []
+    for i, img in enumerate(norm_images):
         tseg = translated_segments[i] if translated_segments else None
+        layer = _render_text_layer(canvas, segments[i], tseg, caption_text, font, use_overlay, hubo_traduccion)
         
-        width, height = img_clip.size
-        try:
-            font = ImageFont.truetype(
-                "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-                subtitle_font_size,
-            )
-        except Exception:
-            font = ImageFont.load_default()
-        
-        if use_overlay:
-            # --- Usar overlays para imágenes web ---
-            frame_np = img_clip.get_frame(0).astype('uint8')
-            canvas = Image.fromarray(frame_np)
-            draw = ImageDraw.Draw(canvas, 'RGBA')
-            
-            # --- Subtítulo original (izquierda, mini-overlay ajustado) ---
-            # Limitar el ancho del texto a menos de la mitad de la pantalla
-            chars_per_line = 32  # Reducir para evitar solapamiento
-            
-            # Dar formato al texto y calcular dimensiones
-            wrapped = textwrap.fill(seg, width=chars_per_line)
-            lines = wrapped.split('\n')
-            ascent, descent = font.getmetrics()
-            line_h = ascent + descent + 4
-            text_h = line_h * len(lines)
-            
-            # Calcular el ancho máximo de las líneas de texto
-            max_line_width = 0
-            for line in lines:
-                line_width = font.getsize(line)[0] if hasattr(font, 'getsize') else font.getmask(line).size[0]
-                max_line_width = max(max_line_width, line_width)
-            
-            # Posicionar en la parte inferior con margen izquierdo
-            left_margin = 20
-            y = height - text_h - 20  # 20px de margen inferior
-            padding = 10  # Espacio extra alrededor del texto
-            
-            # Dibujar un mini-overlay ajustado al tamaño exacto del texto
-            draw.rectangle([
-                (left_margin - padding, y - padding),
-                (left_margin + max_line_width + padding, y + text_h + padding)
-            ], fill=(0, 0, 0, 100))  # Negro semitransparente
-            
-            # Dibujar el texto sobre el mini-overlay
-            draw.multiline_text((left_margin, y), wrapped, font=font, fill=(255, 255, 255, 255))
-            
-            # Subtítulo traducido (derecha) si procede
-            # --- Subtítulo traducido (derecha, mini-overlay ajustado) ---
-            if hubo_traduccion and tseg:
-                # Dar formato al texto y calcular dimensiones
-                chars_per_line = 32  # Reducir para evitar solapamiento
-                t_wrapped = textwrap.fill(tseg, width=chars_per_line)
-                t_lines = t_wrapped.split('\n')
-                t_text_h = line_h * len(t_lines)
-                
-                # Calcular el ancho máximo de las líneas de texto
-                t_max_line_width = 0
-                for line in t_lines:
-                    line_width = font.getsize(line)[0] if hasattr(font, 'getsize') else font.getmask(line).size[0]
-                    t_max_line_width = max(t_max_line_width, line_width)
-                
-                # Posicionar en la parte inferior derecha con margen
-                right_margin = width - t_max_line_width - 20  # 20px de margen derecho
-                t_y = height - t_text_h - 20  # 20px de margen inferior
-                padding = 10  # Espacio extra alrededor del texto
-                
-                # Dibujar un mini-overlay ajustado al tamaño exacto del texto
-                draw.rectangle([
-                    (right_margin - padding, t_y - padding),
-                    (right_margin + t_max_line_width + padding, t_y + t_text_h + padding)
-                ], fill=(0, 0, 0, 100))  # Negro semitransparente
-                
-                # Dibujar el texto sobre el mini-overlay, en verde claro
-                draw.multiline_text((right_margin, t_y), t_wrapped, font=font, fill=(200, 255, 200, 255))
-            
-            # CAPTION_TEXT (arriba derecha, con mini-overlay solo si USE_OVERLAY es true)
-            if caption_text:
-                try:
-                    cap_w, cap_h = font.getsize(caption_text)
-                except Exception:
-                    cap_w, cap_h = font.getmask(caption_text).size
-                
-                # Márgenes y posición del texto
-                margin = 10
-                padding = 5  # Espacio extra alrededor del texto
-                text_x = width - cap_w - margin
-                text_y = margin
-                
-                # Dibujar un overlay rectangular mínimo solo si USE_OVERLAY es true
-                if use_overlay:
-                    draw.rectangle([
-                        (text_x - padding, text_y - padding),
-                        (text_x + cap_w + padding, text_y + cap_h + padding)
-                    ], fill=(0, 0, 0, 120))  # Negro semitransparente
-                
-                # Dibujar el texto (siempre se muestra, con o sin overlay)
-                draw.text((text_x, text_y), caption_text, font=font, fill=(255, 255, 255, 255))
-            
-            # Crear clip final
-            img_clip_with_overlay = ImageClip(np.array(canvas)).set_duration(img_clip.duration)
-            clips.append(img_clip_with_overlay)
+        if motion == "kenburns":
+            clip = make_motion_clip(img, layer, duration, fps, canvas, zoom=motion_zoom, variant=i)
+            if thumbs is not None:
+                thumbs.append(_thumbnail(_compose_image(img, layer)))
         else:
-            # --- Funcionamiento original para imágenes generadas por IA ---
-            # Estos clips usan capas transparentes superpuestas
-            
-            # Subtítulo original (izquierda)
-            half_width = width // 2  # Dividir la pantalla en dos mitades
-            chars_per_line = 35  # Menos caracteres para evitar solapamiento
-            
-            wrapped = textwrap.fill(seg, width=chars_per_line)
-            txt_img = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-            draw = ImageDraw.Draw(txt_img)
-            ascent, descent = font.getmetrics()
-            line_h = ascent + descent + 4
-            text_h = line_h * (wrapped.count('\n') + 1)
-            y = height - text_h - 10
-            draw.multiline_text((10, y), wrapped, font=font, fill=(255,255,255,255))
-            txt_clip = ImageClip(np.array(txt_img)).set_duration(img_clip.duration)
-            
-            if hubo_traduccion and tseg:
-                # Subtítulo traducido (derecha)
-                half_width = width // 2  # Dividir la pantalla en dos mitades
-                right_margin = half_width + 10  # Margen desde la mitad de la pantalla
-                chars_per_line = 35  # Menos caracteres para evitar solapamiento
-                
-                t_wrapped = textwrap.fill(tseg, width=chars_per_line)
-                t_lines = t_wrapped.split('\n')
-                t_text_h = line_h * len(t_lines)
-                t_y = height - t_text_h - 10
-                t_img = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-                t_draw = ImageDraw.Draw(t_img)
-                
-                # Posicionar texto alineado desde la mitad de la pantalla
-                for j, line in enumerate(t_lines):
-                    t_draw.text((right_margin, t_y + j*line_h), line, font=font, fill=(200,255,200,255))
-                t_clip = ImageClip(np.array(t_img)).set_duration(img_clip.duration)
-                
-                # CAPTION_TEXT (con mini-overlay solo si USE_OVERLAY es true)
-                cap_img = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-                cdraw = ImageDraw.Draw(cap_img)
-                try:
-                    cap_w, cap_h = font.getsize(caption_text)
-                except Exception:
-                    cap_w, cap_h = font.getmask(caption_text).size
-                
-                # Márgenes y posición del texto
-                margin = 10
-                padding = 5  # Espacio extra alrededor del texto
-                text_x = width - cap_w - margin
-                text_y = margin
-                
-                # Dibujar un overlay rectangular mínimo solo si USE_OVERLAY es true
-                if use_overlay:
-                    cdraw.rectangle([
-                        (text_x - padding, text_y - padding),
-                        (text_x + cap_w + padding, text_y + cap_h + padding)
-                    ], fill=(0, 0, 0, 120))  # Negro semitransparente
-                
-                # Dibujar el texto (siempre se muestra, con o sin overlay)
-                cdraw.text((text_x, text_y), caption_text, font=font, fill=(255,255,255,255))
-                cap_clip = ImageClip(np.array(cap_img)).set_duration(img_clip.duration)
-                
-                clips.append(CompositeVideoClip([img_clip, txt_clip, t_clip, cap_clip]))
-            else:
-                # Sin traducción, solo subtítulo original
-                if caption_text:
-                    # CAPTION_TEXT (arriba derecha, con mini-overlay solo si USE_OVERLAY es true)
-                    cap_img = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-                    cdraw = ImageDraw.Draw(cap_img)
-                    try:
-                        cap_w, cap_h = font.getsize(caption_text)
-                    except Exception:
-                        cap_w, cap_h = font.getmask(caption_text).size
-                    
-                    # Márgenes y posición del texto
-                    margin = 10
-                    padding = 5  # Espacio extra alrededor del texto
-                    text_x = width - cap_w - margin
-                    text_y = margin
-                    
-                    # Dibujar un overlay rectangular mínimo solo si USE_OVERLAY es true
-                    if use_overlay:
-                        cdraw.rectangle([
-                            (text_x - padding, text_y - padding),
-                            (text_x + cap_w + padding, text_y + cap_h + padding)
-                        ], fill=(0, 0, 0, 120))  # Negro semitransparente
-                    
-                    # Dibujar el texto (siempre se muestra, con o sin overlay)
-                    cdraw.text((text_x, text_y), caption_text, font=font, fill=(255,255,255,255))
-                    cap_clip = ImageClip(np.array(cap_img)).set_duration(img_clip.duration)
-                    
-                    clips.append(CompositeVideoClip([img_clip, txt_clip, cap_clip]))
-                else:
-                    clips.append(CompositeVideoClip([img_clip, txt_clip]))
+            frame = _compose_image(img, layer)
+            if thumbs is not None:
+                thumbs.append(_thumbnail(frame))
+            clip = ImageClip(frame).set_duration(duration)
+        clips.append(clip)
     
-    # Concatenar todos los clips y añadir audio
-    video_clip = concatenate_videoclips(clips, method="compose")
+    if thumbs:
+        _contact_sheet(thumbs, os.path.join(run_dir, "contact_sheet.png"))
+    
+    # Concatenar todos los clips y añadir audio (mismo tamaño → método 'chain', sin recomposición)
+    video_clip = concatenate_videoclips(clips, method="chain")
     video_clip = video_clip.set_audio(audio_clip)
     video_clip = video_clip.set_duration(audio_clip.duration)
     
     # Guardar el video
-    video_path = os.path.join(run_dir, "status.mp4")
-    video_clip.write_videofile(
-        video_path,
-        fps=24,
-        codec="libx264",
-        audio_codec="aac",
-        temp_audiofile="temp-audio.m4a",
-        remove_temp=True,
-    )
+    video_path = os.path.join(run_dir, f"status{profile.suffix}.mp4")
+    with trace_helper.span("video.encode", fps=fps, preset=profile.preset):
+        video_clip.write_videofile(
+            video_path,
+            fps=fps,
+            codec="libx264",
+            preset=profile.preset,
+            audio_codec="aac",
+            temp_audiofile=os.path.join(run_dir, "temp-audio.m4a"),
+            remove_temp=True,
+        )
     logging.info("Video generado y guardado en: %s", video_path)
+    logging.info(f"Pico de memoria del render: {_peak_rss_mb():.0f} MB")
     
     return video_path